@@ -9,18 +9,14 @@ import random
 from pathlib import Path
 from typing import Callable, List, Optional, Tuple, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from alive_progress import alive_bar
-from matplotlib.patches import Rectangle
 from numpy.linalg import LinAlgError
-from rich.table import Table
 from scipy.stats import multivariate_normal
 from scipy.stats.distributions import uniform
 
 from pydci.log import disable_log, enable_log, log_table, logger
+from pydci.plotting import plt, sns
 from pydci.utils import (
     KDEError,
     add_noise,
@@ -440,6 +436,8 @@ class DynamicModel:
         sample_full_state = np.zeros((np.sum(data_df["sample_flag"]), self.n_states))
         samples_xf = np.zeros((len(samples), self.n_states))
 
+        from alive_progress import alive_bar
+
         with alive_bar(
             len(samples),
             title="Solving model sample set:",
@@ -614,6 +612,8 @@ class DynamicModel:
         if ax is None:
             fig, ax = plt.subplots(1, 1, figsize=figsize)
 
+        from matplotlib.patches import Rectangle
+
         interval_colors = sns.color_palette("muted", n_colors=50)
 
         # Plot each column (state) of data on a separate subplot
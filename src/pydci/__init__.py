@@ -1,6 +1,32 @@
-from pydci.consistent_bayes.DCIProblem import DCIProblem
-from pydci.consistent_bayes.MUDProblem import MUDProblem
-from pydci.consistent_bayes.PCAMUDProblem import PCAMUDProblem
-from pydci.consistent_bayes.OfflineSequential import OfflineSequential
-from pydci.consistent_bayes.OfflineSequentialSearch import OfflineSequentialSearch
-from pydci.consistent_bayes.OnlineSequential import OnlineSequential
+"""
+pyDCI
+
+Data-Consistent Inversion problems. The problem classes are imported from
+their modules on first access, e.g. `from pydci import DCIProblem`, so
+`import pydci` itself stays cheap, and plotting and scikit-learn are only
+imported by the methods that use them.
+"""
+import importlib
+
+_PROBLEMS = {
+    "DCIProblem": "pydci.consistent_bayes.DCIProblem",
+    "MUDProblem": "pydci.consistent_bayes.MUDProblem",
+    "PCAMUDProblem": "pydci.consistent_bayes.PCAMUDProblem",
+    "OfflineSequential": "pydci.consistent_bayes.OfflineSequential",
+    "OfflineSequentialSearch": "pydci.consistent_bayes.OfflineSequentialSearch",
+    "OnlineSequential": "pydci.consistent_bayes.OnlineSequential",
+}
+
+__all__ = list(_PROBLEMS)
+
+
+def __getattr__(name):
+    if name in _PROBLEMS:
+        value = getattr(importlib.import_module(_PROBLEMS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
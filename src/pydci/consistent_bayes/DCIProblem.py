@@ -8,9 +8,9 @@ in general in terms of how they are to be used:
 
 1. Initialization: Upon initailization the state of the system is set,
 including parameter samples, their values evaluated through the forward model,
-and data/assumptions on observed data. This is used to initailiaze a pandas
-DataFrame `state`, that stores these values and is used for computing and
-storing final solutions
+and data/assumptions on observed data. This is used to initailiaze the
+array backed `state` (see `pydci.state.ProblemState`), that stores these values
+and is used for computing and storing final solutions
 2. Solving: solve() -> Main method called to solve the problem class. Specific
 parameters controlling how the algorithm is solved can be set here. The results
 of the solve are store in the `result` attribute of the class.
@@ -25,37 +25,41 @@ Problems,” SIAM J. Sci. Comput., vol. 40, no. 2, pp. A984–A1011, Jan. 2018,
 doi: 10.1137/16M1087229.
 
 """
+import copy
 import itertools
 import pdb
 import random
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Callable, List, Optional, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
 from numpy.typing import ArrayLike
 from scipy.stats import rv_continuous  # type: ignore
+from scipy.special import logsumexp
 from scipy.stats import entropy, gaussian_kde
-from sklearn.decomposition import PCA  # type: ignore
-from sklearn.preprocessing import StandardScaler  # type: ignore
 
+from pydci.kde import (
+    evaluate_blocks,
+    get_block_size,
+    get_n_jobs,
+    get_rng,
+    weighted_resample,
+)
 from pydci.log import disable_log, enable_log, log_table, logger
-from pydci.plotting import DEF_RC_PARAMS
+from pydci.plotting import plt, sns
+from pydci.state import ProblemState
 from pydci.utils import (
     KDEError,
     closest_factors,
     fit_domain,
     get_df,
     gkde,
-    put_df,
     set_shape,
+    stack_dists,
 )
 
-sns.color_palette("bright")
-sns.set_style("darkgrid")
-plt.rcParams.update(DEF_RC_PARAMS)
-
 __author__ = "Carlos del-Castillo-Negrete"
 __copyright__ = "Carlos del-Castillo-Negrete"
 __license__ = "mit"
@@ -159,13 +163,21 @@ class DCIProblem(object):
         else:
             self.lam = set_shape(np.array(samples[0]), (1, -1))
             self.q_lam = set_shape(np.array(samples[1]), (-1, 1))
-        self.state = pd.DataFrame(
-            np.zeros((self.n_samples, 6)),
-            columns=["weight", "pi_in", "pi_pr", "pi_obs", "ratio", "pi_up"],
+        self.state = ProblemState(
+            self.n_samples,
+            {
+                "weight": 1.0,
+                "pi_in": 0.0,
+                "pi_pr": 0.0,
+                "pi_obs": 0.0,
+                "ratio": 0.0,
+                "pi_up": 0.0,
+                "log_ratio": -np.inf,
+                "log_pi_up": -np.inf,
+                "q_lam": self.q_lam,
+                "lam": self.lam,
+            },
         )
-        self.state["weight"] = 1.0
-        self.state = put_df(self.state, "q_lam", self.q_lam, size=self.n_states)
-        self.state = put_df(self.state, "lam", self.lam, size=self.n_params)
         self.dists = {
             "pi_in": pi_in,
             "pi_pr": pi_pr,
@@ -173,9 +185,159 @@ class DCIProblem(object):
             "pi_up": None,
             "pi_pf": None,
         }
+        self.kde_opts = {}
+        self.max_bytes = None
+        self.n_jobs = 1
+        self.executor = None
+        self._block_jobs = None
         self.result = None
 
-    def pi_in(self, values=None):
+    def set_kde(self, method=None, dists=None, **kwargs):
+        """
+        Set KDE Backend
+
+        Sets the KDE backend used to estimate densities from the samples. By
+        default the global default backend is used (see `pydci.kde`). Note
+        this only affects densities estimated after the call, so it should be
+        set before calling `solve()`.
+
+        Parameters
+        ----------
+        method : str, optional
+            Name of a KDE backend registered in `pydci.kde`. If None, the
+            global default backend is used.
+        dists : List[str], optional
+            Distributions to set the backend for, out of `pi_in`, `pi_pr`,
+            `pi_up` and `pi_pf`. Defaults to all of them.
+        kwargs : dict
+            Extra arguments to pass to the backend when constructing the KDEs.
+        """
+        dists = ["pi_in", "pi_pr", "pi_up", "pi_pf"] if dists is None else dists
+        for d in dists:
+            self.kde_opts[d] = dict(method=method, **kwargs)
+
+    def set_max_bytes(self, max_bytes=None):
+        """
+        Set Memory Budget
+
+        Sets the memory budget, in bytes, for evaluating densities. Densities
+        are evaluated over blocks of points sized so that the intermediates
+        of evaluating a KDE on `n` samples, assumed to be `n` pairwise
+        kernel values per point, fit in the budget. Results are identical to
+        evaluating all points at once.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Memory budget in bytes. If None, the default budget in
+            `pydci.kde.DEF_MAX_BYTES` is used.
+        """
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f"max_bytes must be a positive integer: {max_bytes}")
+        self.max_bytes = max_bytes
+
+    def set_n_jobs(self, n_jobs=1, executor=None):
+        """
+        Set Parallel Density Evaluation
+
+        Sets how densities are evaluated in parallel. Evaluation points are
+        split across a pool of `n_jobs` threads, or submitted to `executor` if
+        passed, and `solve()` evaluates the independent densities `pi_in`,
+        `pi_obs` and `pi_pr` concurrently, splitting the `n_jobs` threads
+        between them. Results are identical for any number of workers.
+
+        Parameters
+        ----------
+        n_jobs : int, default=1
+            Number of threads to use. -1 uses all CPUs.
+        executor : concurrent.futures.Executor, optional
+            Thread based executor to evaluate blocks of points with.
+        """
+        self.n_jobs = n_jobs
+        self.executor = executor
+
+    def _is_sample_kde(self, dens, samples):
+        """
+        Whether `dens` is a KDE estimated on `samples`.
+        """
+        return (
+            isinstance(dens, gaussian_kde)
+            and dens.n == len(samples)
+            and np.array_equal(dens.dataset, samples.T)
+        )
+
+    def _pdf(self, dist, values, samples, prod=False, log=False):
+        """
+        Evaluate density `dist`, the name of a stored distribution or a
+        distribution itself, at `values`, of shape (n_points, n_dims),
+        streaming over blocks of points to bound memory used. If `values` is
+        None the density is evaluated at `samples`, using cached kernel sums
+        for KDEs on the samples that support it (see `pydci.kde.FrozenKDE`).
+        If `prod` is set, the pdf values of (non KDE) distributions are
+        multiplied across dimensions. If `log` is set the log density is
+        returned, with the log pdf values of (non KDE) distributions summed
+        across dimensions. For KDEs, whose `logpdf()` can be much slower than
+        `pdf()`, it is only used at points where the latter underflows.
+        """
+        dens = self.dists[dist] if isinstance(dist, str) else dist
+        if values is None:
+            if hasattr(dens, "self_pdf") and self._is_sample_kde(dens, samples):
+                return dens.self_logpdf() if log else dens.self_pdf()
+            values = samples
+        values = np.array(values)
+
+        def _eval(x):
+            if isinstance(dens, gaussian_kde):
+                res = dens.pdf(x.T).T
+                if not log:
+                    return res
+                tail = ~(res >= np.finfo(float).tiny)
+                with np.errstate(divide="ignore"):
+                    res = np.log(res)
+                if tail.any():
+                    res[tail] = dens.logpdf(x[tail].T)
+                return res
+            if log:
+                res = dens.logpdf(x)
+                return res.sum(axis=1) if res.ndim > 1 else res
+            return dens.pdf(x).prod(axis=1) if prod else dens.pdf(x)
+
+        if values.ndim < 2:
+            return _eval(values)
+        n = dens.n if isinstance(dens, gaussian_kde) else 1
+        return evaluate_blocks(
+            _eval,
+            values,
+            get_block_size(n, max_bytes=self.max_bytes),
+            n_jobs=self.n_jobs if self._block_jobs is None else self._block_jobs,
+            executor=self.executor,
+        )
+
+    def _kde(self, dist, X, weights=None, label=None):
+        """
+        Estimate density `dist` from samples `X` using the KDE backend set
+        for it by `set_kde()`.
+
+        The updated densities `pi_up` and `pi_pf` share their samples with
+        `pi_in` and `pi_pr` respectively, and only differ in their weights.
+        If the latter is a KDE on the same samples that supports re-weighting
+        (see `pydci.kde.FrozenKDE`), and the same KDE options are set for
+        both, the updated density is a re-weighted copy of it, sharing its
+        bandwidth and cached kernel evaluations.
+        """
+        base = {"pi_up": "pi_in", "pi_pf": "pi_pr"}.get(dist)
+        opts = self.kde_opts.get(dist, {})
+        if base is not None and opts == self.kde_opts.get(base, {}):
+            dens = self.dists[base]
+            if hasattr(dens, "reweight") and self._is_sample_kde(dens, X.T):
+                logger.debug(f"Computing {dist} by re-weighting {base}")
+                try:
+                    return dens.reweight(weights)
+                except ValueError as v:
+                    raise KDEError(X, weights=weights, name=label, msg=str(v))
+        return gkde(X, weights=weights, label=label, **opts)
+
+    def pi_in(self, values=None, log=False):
         """
         Evaluate the initial distribution.
 
@@ -186,7 +348,8 @@ class DCIProblem(object):
         if self.dists["pi_in"] is None:
             logger.debug("Calculating pi_in by computing KDE on lam")
             try:
-                self.dists["pi_in"] = gkde(
+                self.dists["pi_in"] = self._kde(
+                    "pi_in",
                     self.lam.T,
                     weights=self.state["weight"],
                     label="Initial Distribution",
@@ -194,13 +357,9 @@ class DCIProblem(object):
             except KDEError as k:
                 k.msg = "KDE failed on initial samples"
                 raise k
-        values = self.lam if values is None else values
-        if isinstance(self.dists["pi_in"], gaussian_kde):
-            return self.dists["pi_in"].pdf(values.T).T
-        else:
-            return self.dists["pi_in"].pdf(values)
+        return self._pdf("pi_in", values, self.lam, log=log)
 
-    def pi_pr(self, values=None):
+    def pi_pr(self, values=None, log=False):
         """
         Evaluate the predicted distribution.
 
@@ -212,7 +371,8 @@ class DCIProblem(object):
         if self.dists["pi_pr"] is None:
             logger.debug("Calculating pi_pr by computing KDE on q_lam")
             try:
-                self.dists["pi_pr"] = gkde(
+                self.dists["pi_pr"] = self._kde(
+                    "pi_pr",
                     self.q_lam.T,
                     weights=self.state["weight"],
                     label="Predicted Distribution",
@@ -220,25 +380,17 @@ class DCIProblem(object):
             except KDEError as k:
                 k.msg = "KDE failed on observations"
                 raise k
-        values = self.q_lam if values is None else values
-        if isinstance(self.dists["pi_pr"], gaussian_kde):
-            return self.dists["pi_pr"].pdf(values.T).T.ravel()
-        else:
-            return self.dists["pi_pr"].pdf(values).prod(axis=1)
+        return self._pdf("pi_pr", values, self.q_lam, prod=True, log=log).ravel()
 
-    def pi_obs(self, values=None):
+    def pi_obs(self, values=None, log=False):
         """
         Evaluate the observed distribution.
 
         Observed distribion is set explicitly in the call to `init_prob`.
         """
-        values = self.q_lam if values is None else values
-        if isinstance(self.dists["pi_obs"], gaussian_kde):
-            return self.dists["pi_obs"].pdf(values.T).T.ravel()
-        else:
-            return self.dists["pi_obs"].pdf(values).prod(axis=1)
+        return self._pdf("pi_obs", values, self.q_lam, prod=True, log=log).ravel()
 
-    def pi_up(self, values=None):
+    def pi_up(self, values=None, log=False):
         """
         Evaluate Updated Distribution
 
@@ -250,19 +402,18 @@ class DCIProblem(object):
         # Compute udpated density
         if self.dists["pi_up"] is None:
             try:
-                self.dists["pi_up"] = gkde(
+                self.dists["pi_up"] = self._kde(
+                    "pi_up",
                     self.lam.T,
-                    weights=self.state["ratio"] * self.state["weight"],
+                    weights=self._update_weights(),
                     label="Updated Distribution",
                 )
             except KDEError as k:
                 k.msg = "KDE failed on updated samples"
                 raise k
-        values = np.array(values)
-        values = self.lam if values is None else values
-        return self.dists["pi_up"].pdf(np.array(values).T).T
+        return self._pdf("pi_up", values, self.lam, log=log)
 
-    def pi_pf(self, values=None):
+    def pi_pf(self, values=None, log=False):
         """
         Evaluate Updated Distribution
 
@@ -274,18 +425,28 @@ class DCIProblem(object):
         # Compute udpated density
         if self.dists["pi_pf"] is None:
             try:
-                self.dists["pi_pf"] = gkde(
+                self.dists["pi_pf"] = self._kde(
+                    "pi_pf",
                     self.q_lam.T,
-                    weights=self.state["ratio"] * self.state["weight"],
+                    weights=self._update_weights(),
                     label="Push-Forward of Updated Distribution",
                 )
             except KDEError as k:
                 k.msg = "KDE failed on updated observations"
                 raise k
-        values = self.q_lam if values is None else values
-        return self.dists["pi_pf"].pdf(values.T).T
+        return self._pdf("pi_pf", values, self.q_lam, log=log)
+
+    def _update_weights(self):
+        """
+        Weights of the samples in the updated distribution, `ratio * weight`,
+        computed from the log ratio and scaled so the largest is one, so they
+        neither overflow nor underflow. KDE weights are normalized anyways.
+        """
+        with np.errstate(divide="ignore"):
+            log_w = self.state["log_ratio"] + np.log(self.state["weight"])
+        return np.exp(log_w - np.max(log_w))
 
-    def sample_dist(self, num_samples=1, dist="pi_up"):
+    def sample_dist(self, num_samples=1, dist="pi_up", seed=None, method="systematic"):
         """
         Sample Stored Distribution
 
@@ -293,6 +454,11 @@ class DCIProblem(object):
         distribution on parameter samples, but also can draw samples from any
         stored distribtuion: pi_in, pi_pr, pi_obs, and pi_up.
 
+        Distributions estimated with KDEs are sampled directly as weighted
+        mixtures of kernels on the samples (see
+        `pydci.kde.weighted_resample`), by resampling the kernel weights and
+        adding a Gaussian jitter, which scales to millions of draws.
+
         Parameters
         ----------
         dist: optional, default='pi_up'
@@ -300,6 +466,12 @@ class DCIProblem(object):
             distribution
         num_samples: optional, default=1
             Number of samples to draw from distribtuion
+        seed: optional
+            Seed or `np.random.Generator` to draw with. By default NumPy's
+            global random state is used.
+        method: str, default='systematic'
+            How kernels of KDEs are resampled, 'systematic' or 'multinomial'.
+            See `pydci.kde.weighted_resample`.
 
         Returns
         -------
@@ -307,16 +479,20 @@ class DCIProblem(object):
             Samples from the udpated distribution. Dimension of array is
             (num_samples * num_params)
         """
-        if isinstance(self.dists[dist], gaussian_kde):
-            return self.dists[dist].resample(size=num_samples).T
-        else:
-            dim = self.n_params if dist in ["pi_in", "pi_up"] else self.n_states
-            if self.dists[dist] is None:
-                _ = getattr(self, dist, None)(np.zeros(dim))
-            if not isinstance(self.dists[dist], gaussian_kde):
-                return self.dists[dist].rvs((num_samples, dim)).T
-            else:
-                return self.dists[dist].resample(num_samples).T
+        dim = self.n_params if dist in ["pi_in", "pi_up"] else self.n_states
+        if self.dists[dist] is None:
+            _ = getattr(self, dist, None)(np.zeros(dim))
+        dens = self.dists[dist]
+        if isinstance(dens, gaussian_kde):
+            return weighted_resample(
+                dens.dataset,
+                dens.weights,
+                dens.covariance,
+                size=num_samples,
+                seed=seed,
+                method=method,
+            ).T
+        return dens.rvs((num_samples, dim), random_state=get_rng(seed)).T
 
     def set_weights(self, weights: ArrayLike = None):
         """
@@ -331,7 +507,9 @@ class DCIProblem(object):
         Note: Setting weights resets the initial, predicted, updated, and
         push-forward of updated distributions, as they need to be recalculated
         using new set of sample weights. Only observed distribution is left
-        untouched, since it is given by the user.
+        untouched, since it is given by the user. Initial and predicted KDEs
+        on the samples that support re-weighting (frozen bandwidth KDEs, see
+        `pydci.kde.FrozenKDE`) are re-weighted instead of being recomputed.
 
         Parameters
         ----------
@@ -355,13 +533,102 @@ class DCIProblem(object):
             w = np.prod(w, axis=0)
 
             # If non-zero weights set, whipe saved distributions
-            self.dists["pi_in"] = None
-            self.dists["pi_pr"] = None
+            for dist, samples in [("pi_in", self.lam), ("pi_pr", self.q_lam)]:
+                dens = self.dists[dist]
+                if hasattr(dens, "reweight") and self._is_sample_kde(dens, samples):
+                    self.dists[dist] = dens.reweight(w)
+                else:
+                    self.dists[dist] = None
             self.dists["pi_up"] = None
             self.dists["pi_pf"] = None
 
         self.state["weight"] = w
 
+    def checkpoint(self) -> dict:
+        """
+        Checkpoint Solver State
+
+        Snapshot of the problem's attributes, e.g. the `state`, distributions,
+        and `result`, that `restore()` returns the problem to, e.g. to undo a
+        failed solve. Solves and `set_weights()` replace, rather than modify,
+        the fields of the `state` and the distributions, so the snapshot only
+        references them, and costs the same regardless of the number of
+        samples. Members modified in place, the KDE options, the `result`,
+        and KDEs grown by `append_samples()`, are copied. Subclasses copy
+        their own (see `_copy_members()`). Other members, e.g. caches shared
+        between problems, are referenced.
+
+        Returns
+        -------
+        ckpt : dict
+            Snapshot to pass to `restore()`.
+        """
+        ckpt = dict(self.__dict__)
+        ckpt.update(self._copy_members(ckpt))
+        return ckpt
+
+    def restore(self, ckpt: dict):
+        """
+        Restore the problem to a snapshot taken by `checkpoint()`. Can be
+        restored more than once, and by other problems on the same samples,
+        as members modified in place are copied again.
+        """
+        self.__dict__.update(ckpt)
+        self.__dict__.update(self._copy_members(ckpt))
+
+    def _copy_members(self, members: dict) -> dict:
+        """
+        Copies of the members in `members`, attributes of a problem, that are
+        modified in place, for `checkpoint()` and `restore()`.
+        """
+        return {
+            "state": members["state"].copy(),
+            "dists": {
+                k: copy.copy(v) if isinstance(v, gaussian_kde) else v
+                for k, v in members["dists"].items()
+            },
+            "kde_opts": dict(members["kde_opts"]),
+            "result": None if members["result"] is None else members["result"].copy(),
+        }
+
+    def append_samples(self, samples, weights=None):
+        """
+        Append Samples
+
+        Adds parameter samples, and their push-forward values, to the problem.
+        Initial and predicted KDEs on the samples that support it (see
+        `pydci.kde.DirectKDE.append`) are updated in place with the new
+        samples, with a running update of their bandwidths, instead of being
+        refit on all samples. The updated distributions are reset, and the
+        problem must be solved again.
+
+        Parameters
+        ----------
+        samples : Tuple[ArrayLike, ArrayLike]
+            Tuple of arrays `(lam, q_lam)` of new samples, as in `init_prob`.
+        weights : ArrayLike, optional
+            Weights of the new samples. Defaults to one per sample.
+        """
+        lam = set_shape(np.array(samples[0]), (1, -1))
+        q_lam = set_shape(np.array(samples[1]), (-1, 1))
+        if len(lam) != len(q_lam):
+            raise ValueError(f"lam and q_lam sizes differ: {len(lam)}, {len(q_lam)}")
+        w = np.ones(len(lam)) if weights is None else np.asarray(weights, dtype=float)
+        for dist, old, new in [("pi_in", self.lam, lam), ("pi_pr", self.q_lam, q_lam)]:
+            dens = self.dists[dist]
+            if hasattr(dens, "append") and self._is_sample_kde(dens, old):
+                logger.debug(f"Appending {len(new)} samples to {dist}")
+                dens.append(new.T, weights=w)
+            elif isinstance(dens, gaussian_kde):
+                self.dists[dist] = None
+        self.dists["pi_up"] = None
+        self.dists["pi_pf"] = None
+
+        self.lam = np.vstack([self.lam, lam])
+        self.q_lam = np.vstack([self.q_lam, q_lam])
+        self.state.append({"weight": w, "lam": lam, "q_lam": q_lam})
+        self.result = None
+
     def solve(self):
         """
         Solve the data consistent inverse problem by computing `pi_up` as the
@@ -374,6 +641,12 @@ class DCIProblem(object):
         with the ratio of the observed (`pi_obs`) to predicted (`pi_pr`), for
         ease of access later.
 
+        Densities are evaluated in log space, and the ratio and updated
+        density computed from their logs, stored in the `log_ratio` and
+        `log_pi_up` columns. This way samples far in the tails, where both
+        `pi_obs` and `pi_pr` underflow to zero, still get a well defined
+        (small) ratio instead of `0 / 0`.
+
         Raises
         ------
         ZeroDivisionError
@@ -382,18 +655,18 @@ class DCIProblem(object):
             is undefined or infinite, indicating our predictions aren't able
             to predict our observations.
         """
-        self.state["pi_in"] = self.pi_in()
-        self.state["pi_obs"] = self.pi_obs()
-        pi_pr = self.pi_pr()
-        self.state["pi_pr"] = pi_pr
-        self.state["ratio"] = np.divide(self.state["pi_obs"], self.state["pi_pr"])
-        update = np.multiply(self.state["ratio"], self.state["weight"])
-        if len(bad := np.where(~np.isfinite(update))[0]) > 0:
-            raise ZeroDivisionError(
-                f"Predictability assumption violated for samples {len(bad)}/"
-                + f"{self.n_samples} samples."
-            )
-        self.state["pi_up"] = np.multiply(self.state["pi_in"], update)
+        log_in, log_obs, log_pr = self._evaluate(
+            [partial(d, log=True) for d in [self.pi_in, self.pi_obs, self.pi_pr]]
+        )
+        self.state["pi_in"] = np.exp(log_in)
+        self.state["pi_obs"] = np.exp(log_obs)
+        self.state["pi_pr"] = np.exp(log_pr)
+        log_ratio, log_update = self._log_update(log_obs, log_pr)
+        self.state["log_ratio"] = log_ratio
+        self.state["log_pi_up"] = log_in + log_update
+        with np.errstate(over="ignore"):
+            self.state["ratio"] = np.exp(log_ratio)
+            self.state["pi_up"] = np.exp(self.state["log_pi_up"])
 
         # Store result into result dataframe
         results_cols = ["e_r", "kl"]
@@ -403,6 +676,111 @@ class DCIProblem(object):
         res_df = pd.DataFrame(results, columns=results_cols)
         self.result = res_df
 
+    def solve_batch(self, pi_obs_list):
+        """
+        Solve for a batch of observed distributions
+
+        Solves the data consistent inverse problem on the same samples for
+        each observed distribution in `pi_obs_list`, e.g. one per data set.
+        The initial and predicted densities, the expensive part of a solve
+        when estimated with KDEs, are computed once and shared by all of the
+        solutions. Observed distributions of the same `scipy.stats` family are
+        stacked (see `pydci.utils.stack_dists`) and evaluated together in one
+        pass, otherwise they are evaluated one by one.
+
+        The `state` and `result` of the problem are not modified.
+
+        Parameters
+        ----------
+        pi_obs_list : List[rv_continuous]
+            Observed distributions on the data.
+
+        Returns
+        -------
+        batch : dict
+            Solution for each observed distribution, with arrays of shape
+            `(n_obs, n_samples)` for the `ratio`, `log_ratio`, `pi_up` and
+            `log_pi_up` at each sample, and of shape `(n_obs,)` for the
+            expected ratio `e_r` and KL divergence `kl` of each solution.
+
+        Raises
+        ------
+        ZeroDivisionError
+            If the predictability assumption is violated for any sample for
+            any of the observed distributions. See `solve()`.
+        """
+        log_in, log_pr = self._evaluate(
+            [partial(self.pi_in, log=True), partial(self.pi_pr, log=True)]
+        )
+        stacked = stack_dists(pi_obs_list, ndim=2)
+        if stacked is not None:
+            log_obs = evaluate_blocks(
+                lambda x: stacked.logpdf(x).sum(axis=-1).T,
+                self.q_lam,
+                get_block_size(len(pi_obs_list) * self.n_states, self.max_bytes),
+                n_jobs=self.n_jobs,
+                executor=self.executor,
+            ).T
+        else:
+            log_obs = np.stack(
+                self._evaluate(
+                    [
+                        partial(self._pdf, d, None, self.q_lam, prod=True, log=True)
+                        for d in pi_obs_list
+                    ]
+                )
+            ).reshape(len(pi_obs_list), -1)
+        log_ratio, log_update = self._log_update(log_obs, log_pr)
+        log_pi_up = log_in + log_update
+        weights = self.state["weight"]
+        log_er = logsumexp(log_ratio, b=weights, axis=1) - np.log(np.sum(weights))
+        with np.errstate(over="ignore"):
+            return {
+                "ratio": np.exp(log_ratio),
+                "log_ratio": log_ratio,
+                "pi_up": np.exp(log_pi_up),
+                "log_pi_up": log_pi_up,
+                "e_r": np.exp(log_er),
+                "kl": entropy(np.exp(log_obs), np.exp(log_pr), axis=1),
+            }
+
+    def _evaluate(self, funcs):
+        """
+        Call each of `funcs`, concurrently if parallel evaluation is set (see
+        `set_n_jobs()`), and return their results in order. The `n_jobs`
+        threads are split between the calls, each evaluating its blocks of
+        points with its share, so at most `n_jobs` threads evaluate at once.
+        With an `executor`, calls are made in turn, sharing it for blocks.
+        """
+        n_jobs = get_n_jobs(self.n_jobs)
+        if n_jobs == 1 or self.executor is not None:
+            return [f() for f in funcs]
+        n_workers = min(len(funcs), n_jobs)
+        self._block_jobs = n_jobs // n_workers
+        try:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                futures = [pool.submit(f) for f in funcs]
+                return [f.result() for f in futures]
+        finally:
+            self._block_jobs = None
+
+    def _log_update(self, log_obs, log_pr):
+        """
+        Log of the ratio of observed to predicted densities at each sample,
+        and of the multiplicative update to the initial density, `ratio *
+        weight`, checking the predictability assumption holds.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            log_ratio = log_obs - log_pr
+            log_update = log_ratio + np.log(self.state["weight"])
+        bad = np.isnan(log_update) | (log_update == np.inf)
+        if (n_bad := np.sum(np.any(bad.reshape(-1, self.n_samples), axis=0))) > 0:
+            raise ZeroDivisionError(
+                f"Predictability assumption violated for samples {n_bad}/"
+                + f"{self.n_samples} samples."
+            )
+        return log_ratio, log_update
+
     def expected_ratio(self):
         """Expectation Value of R
 
@@ -417,7 +795,9 @@ class DCIProblem(object):
         expected_ratio : float
             Value of the E(r). Should be close to 1.0.
         """
-        return np.average(self.state["ratio"], weights=self.state["weight"])
+        weights = self.state["weight"]
+        log_er = logsumexp(self.state["log_ratio"], b=weights)
+        return np.exp(log_er - np.log(np.sum(weights)))
 
     def divergence_kl(self):
         """KL-Divergence Between observed and predicted.
@@ -455,8 +835,8 @@ class DCIProblem(object):
         ----------
         df: pd.DataFrame, default=None
             Dataframe to use for accessing data. Defaults to the classes's
-            `self.state` DataFrame. Can be used by sub-classes that store past
-            states for plotting them.
+            `self.state` as a DataFrame. Can be used by sub-classes that store
+            past states for plotting them.
         param_idx : int, default=0
             Index of parameter, `lam` to plot.
         param_col: str, default='lam'
@@ -479,7 +859,7 @@ class DCIProblem(object):
             Tuple of (1) matplotlib axis object where distributions where
             plotted and (2) List of labels that were plotted, in order plotted.
         """
-        df = self.state if df is None else df
+        df = self.state.to_frame() if df is None else df
 
         labels = []
         if ax is None:
@@ -556,8 +936,8 @@ class DCIProblem(object):
         ----------
         df: pd.DataFrame, default=None
             Dataframe to use for accessing data. Defaults to the classes's
-            `self.state` DataFrame. Can be used by sub-classes that store past
-            states for plotting them.
+            `self.state` as a DataFrame. Can be used by sub-classes that store
+            past states for plotting them.
         state_idx: int, default=0
             Index of state, `q_lam`, to plot.
         state_col: str, default='q_lam'
@@ -586,7 +966,7 @@ class DCIProblem(object):
             Tuple of (1) matplotlib axis object where distributions where
             plotted and (2) List of labels that were plotted, in order plotted.
         """
-        df = self.state if df is None else df
+        df = self.state.to_frame() if df is None else df
 
         labels = []
         if ax is None:
@@ -598,7 +978,7 @@ class DCIProblem(object):
         # Plot predicted distribution
         pr_label = "$\pi^{{pr}}_{{Q(\lambda)_{state_idx}}}$"
         sns.kdeplot(
-            data=self.state,
+            data=self.state.to_frame(),
             x=f"{state_col}_{state_idx}",
             ax=ax,
             fill=True,
@@ -610,7 +990,7 @@ class DCIProblem(object):
         if plot_pf:
             pf_label = f"$\pi^{{pf}}_{{Q(\lambda)_{state_idx}}}$"
             sns.kdeplot(
-                data=self.state,
+                data=self.state.to_frame(),
                 x=f"{state_col}_{state_idx}",
                 ax=ax,
                 fill=True,
@@ -9,9 +9,9 @@ in general in terms of how they are to be used:
 
 1. Initialization: Upon initailization the state of the system is set,
 including parameter samples, their values evaluated through the forward model,
-and data/assumptions on observed data. This is used to initailiaze a pandas
-DataFrame `state`, that stores these values and is used for computing and
-storing final solutions
+and data/assumptions on observed data. This is used to initailiaze the
+array backed `state` (see `pydci.state.ProblemState`), that stores these values
+and is used for computing and storing final solutions
 2. Solving: solve() -> Main method called to solve the problem class. Specific
 parameters controlling how the algorithm is solved can be set here. The results
 of the solve are store in the `result` attribute of the class.
@@ -28,23 +28,34 @@ Methods in Applied Mechanics and Engineering, vol. 407, p. 115906, Mar.
 """
 from typing import Callable, List, Optional, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
 from scipy.stats import distributions as dist  # type: ignore
+from scipy.stats import gaussian_kde, multivariate_normal
 
-from pydci import DCIProblem
+from pydci.consistent_bayes.DCIProblem import DCIProblem
+from pydci.kde import kde_log_grad
 from pydci.log import log_table, logger
+from pydci.plotting import plt, sns
 from pydci.utils import get_df, put_df, set_shape
 
-sns.color_palette("bright")
-sns.set_style("darkgrid")
-
 __author__ = "Carlos del-Castillo-Negrete"
 __copyright__ = "Carlos del-Castillo-Negrete"
 __license__ = "mit"
 
+# Max relative residual of a linear fit of the QoI map for solve(linear="auto")
+DEF_LINEAR_TOL = 1e-6
+
+# Number of samples with the highest updated density to refine MUD points from
+DEF_MUD_TOP_K = 10
+
+# Max steps, and relative step size below which they stop, refining MUD points
+DEF_REFINE_ITER = 100
+DEF_REFINE_TOL = 1e-8
+
+# Relative step of finite differences for gradients of non-KDE densities
+DEF_FD_STEP = 1e-6
+
 
 class MUDProblem(DCIProblem):
     """
@@ -83,6 +94,12 @@ class MUDProblem(DCIProblem):
         these values.
         3. Plotting - Plots add vertical lines for MUD points on the parameter
         distribution plots, and options for plotting the true value if known.
+        4. Linear maps - For linear (or linearized) QoI maps, the MUD point and
+        updated distribution have closed forms [1], used by
+        `solve(linear=True)` instead of KDEs. See `solve_linear()`.
+        5. Refinement - The MUD point can be refined off of the samples, by
+        maximizing a continuous surrogate of the updated density, with
+        `solve(refine=True)`. See `refine_mud_point()`.
 
     Note: this class does no data-aggregation using data-constructed QoI maps
     as proposed in [1] for parameter estimation. See sub-classes `WMEMUDProblem`
@@ -96,6 +113,9 @@ class MUDProblem(DCIProblem):
         states for each passsed in sample, `q_lam`.
     std_dev : float
         Assumed measurement noise in collecting the data.
+    linear : dict
+        Closed form solution of the last linear solve, see `solve_linear()`.
+        None if the problem was solved with KDEs.
 
     References
     ----------
@@ -138,34 +158,311 @@ class MUDProblem(DCIProblem):
         pi_obs = dist.norm(loc=np.mean(data), scale=std_dev)
         super().init_prob(samples, pi_obs, pi_in=pi_in, pi_pr=pi_pr)
         self.mud_point = None
+        self.linear = None
 
-    def solve(self):
+    def solve(
+        self,
+        linear: Union[bool, str] = False,
+        linear_tol: float = DEF_LINEAR_TOL,
+        refine: bool = False,
+    ):
         """
         Solve MUD Parameter Estimation Problem
 
         Extends the parent method by computing the MUD point, the solution
         to the parameter estimation problem, as the samples that maximizes the
-        `pi_up` column in the state DataFrame. This MUD Point is stored in the
+        `pi_up` column of the `state`. This MUD Point is stored in the
         results DataFrame that is returned.
+
+        Parameters
+        ----------
+        linear : bool or "auto", default=False
+            If True, solve in closed form with a linear fit of the QoI map,
+            see `solve_linear()`. If "auto", do so only if the map is linear,
+            that is if the relative residual of the fit is at most
+            `linear_tol`, and solve with KDEs otherwise.
+        linear_tol : float, default=DEF_LINEAR_TOL
+            Tolerance on the relative residual of the linear fit for
+            `linear="auto"`.
+        refine : bool, default=False
+            Refine the MUD point by maximizing the updated density between
+            samples, see `refine_mud_point()`. Not needed for linear solves,
+            whose MUD point is exact.
         """
+        if linear not in (True, False, "auto"):
+            raise ValueError(f"linear must be True, False or 'auto': {linear}")
+        fit = None
+        if linear == "auto":
+            fit = self.fit_linear_map()
+            linear = fit[2] <= linear_tol
+            logger.debug(f"Linear fit relative residual {fit[2]:.2e}: {linear}")
+        if linear:
+            self.solve_linear(fit=fit)
+            return
+        self.linear = None
         super().solve()
         m, mud_point = self.get_mud_point()
         self.result = put_df(self.result, "lam_MUD", mud_point, size=self.n_params)
         self.result["MUD_idx"] = m
         self.mud_point = mud_point[0]
         self.mud_arg = m
+        if refine:
+            self.refine_mud_point()
+
+    def refine_mud_point(
+        self,
+        top_k: int = DEF_MUD_TOP_K,
+        max_iter: int = DEF_REFINE_ITER,
+        tol: float = DEF_REFINE_TOL,
+    ):
+        """
+        Refine the MUD point between samples
+
+        The MUD point found by `solve()` is the sample with the highest
+        updated density, so its accuracy is bound by how densely the samples
+        cover the parameter space. This refines it by maximizing a continuous
+        surrogate of the updated density, `pi_in * ratio`, where:
+
+            - `pi_in` is the initial density itself, a Gaussian mixture when
+              estimated with a KDE, whose gradients are computed for all
+              starting points at once (see `pydci.kde.kde_log_grad`), or by
+              finite differences otherwise.
+            - The log `ratio` is a quadratic least squares fit of the log
+              ratios of the samples with the highest updated density. The
+              ratio is known exactly at the samples, and varies smoothly at
+              the scale of the updated distribution, unlike the kernel
+              smoothed updated density.
+
+        The surrogate is climbed with Newton steps on the quadratic part of
+        the log surrogate, from each of the `top_k` samples with the highest
+        updated density. The highest point of the surrogate, among the points
+        reached and the starting samples, is the new MUD point, stored in
+        `mud_point` and the `lam_MUD` columns of the `result`. The sample MUD
+        point index, `mud_arg`, is kept. If the fit of the log ratio is not
+        concave about its maximum, the sample MUD point is kept.
+
+        Parameters
+        ----------
+        top_k : int, default=DEF_MUD_TOP_K
+            Number of samples to start from. At least three times as many
+            samples as there are coefficients are used to fit the ratio.
+        max_iter : int, default=DEF_REFINE_ITER
+            Maximum number of steps from each sample.
+        tol : float, default=DEF_REFINE_TOL
+            Stop once steps are below `tol`, relative to the spread of the
+            samples the ratio is fit on.
+
+        Returns
+        -------
+        mud_point : np.ndarray
+            Refined MUD point.
+        """
+        if self.result is None:
+            raise ValueError("Problem must be solved before refining the MUD point")
+        log_up = self.state["log_pi_up"]
+        order = np.argsort(log_up)[::-1][: np.sum(np.isfinite(log_up))]
+        d = self.n_params
+        fit = order[: max(top_k, 3 * (d + 1) * (d + 2) // 2)]
+        center = self.lam[order[0]]
+        scale = np.std(self.lam[fit], axis=0)
+        scale[scale == 0] = 1.0
+
+        # Quadratic model c + g'z + z'Bz / 2 of the log ratio, z = scaled lam
+        z = (self.lam[fit] - center) / scale
+        iu = np.triu_indices(d)
+        X = np.hstack([np.ones((len(fit), 1)), z, z[:, iu[0]] * z[:, iu[1]]])
+        coef = np.linalg.lstsq(X, self.state["log_ratio"][fit], rcond=None)[0]
+        g = coef[1 : d + 1]
+        B = np.zeros((d, d))
+        B[iu] = coef[d + 1 :]
+        B = B + B.T
+        if np.any(np.linalg.eigvalsh(B) >= 0):
+            logger.warning("Log ratio fit is not concave. MUD point not refined.")
+            return self.mud_point
+
+        def _log_surrogate(z):
+            log_ratio = z @ g + 0.5 * np.sum((z @ B) * z, axis=1)
+            return self.pi_in(z * scale + center, log=True) + log_ratio
+
+        starts = (self.lam[order[:top_k]] - center) / scale
+        z = starts.copy()
+        for _ in range(max_iter):
+            grad = self._log_grad_in(z * scale + center) * scale
+            new_z = -np.linalg.solve(B, (g + grad).T).T
+            step = np.max(np.abs(new_z - z))
+            z = new_z
+            if step < tol:
+                break
+        # Iterates leaving the support of bounded initial densities are
+        # dropped, the starting samples include the sample MUD point
+        z = np.vstack([z[np.all(np.isfinite(z), axis=1)], starts])
+        log_surrogate = _log_surrogate(z)
+        log_surrogate[~np.isfinite(log_surrogate)] = -np.inf
+        if not np.any(np.isfinite(log_surrogate)):
+            logger.warning("Surrogate not finite. MUD point not refined.")
+            return self.mud_point
+        best = np.argmax(log_surrogate)
+        mud_point = z[best] * scale + center
+        logger.debug(f"MUD point refined from {self.mud_point} to {mud_point}")
+        self.mud_point = mud_point
+        self.result = put_df(
+            self.result, "lam_MUD", mud_point[None, :], size=self.n_params
+        )
+        return self.mud_point
+
+    def _log_grad_in(self, values):
+        """
+        Gradient of the log initial density at `values`, of shape
+        `(n_points, n_params)`, for KDEs from the Gaussian mixture, and by
+        central finite differences otherwise, zero where a step leaves the
+        support of the density.
+        """
+        self.pi_in(values[:1])
+        dens = self.dists["pi_in"]
+        if isinstance(dens, gaussian_kde):
+            return kde_log_grad(dens, values.T, max_bytes=self.max_bytes).T
+        eps = DEF_FD_STEP * np.maximum(np.abs(values), 1.0)
+        grad = np.zeros_like(values)
+        for j in range(values.shape[1]):
+            step = np.zeros_like(values)
+            step[:, j] = eps[:, j]
+            up = self.pi_in(values + step, log=True)
+            down = self.pi_in(values - step, log=True)
+            inside = np.isfinite(up) & np.isfinite(down)
+            diff = np.subtract(up, down, out=np.zeros_like(up), where=inside)
+            grad[:, j] = diff / (2 * eps[:, j])
+        return grad
+
+    def fit_linear_map(self):
+        """
+        Fit a linear map to the QoI
+
+        Weighted least squares fit `q_lam ~ lam @ A.T + b` of the push-forward
+        values of the samples, using the sample `weight`s.
+
+        Returns
+        -------
+        A, b, err : Tuple[np.ndarray, np.ndarray, float]
+            Map of shape `(n_states, n_params)`, offset of shape `(n_states,)`,
+            and relative residual of the fit, the weighted norm of the
+            residuals over that of the centered QoI values (0 for linear maps).
+        """
+        lam, q_lam = self.lam, self.q_lam
+        w = self.state["weight"] / np.sum(self.state["weight"])
+        X = np.hstack([lam, np.ones((self.n_samples, 1))]) * np.sqrt(w)[:, None]
+        coef = np.linalg.lstsq(X, q_lam * np.sqrt(w)[:, None], rcond=None)[0]
+        A, b = coef[:-1].T, coef[-1]
+        resid = np.sum(w[:, None] * (q_lam - lam @ A.T - b) ** 2)
+        total = np.sum(w[:, None] * (q_lam - w @ q_lam) ** 2)
+        err = np.sqrt(resid / total) if total > 0 else 0.0
+        return A, b, err
+
+    def _obs_moments(self):
+        """
+        Mean and covariance of a Gaussian observed distribution on the states.
+        """
+        obs = self.dists["pi_obs"]
+        if isinstance(obs, dist.rv_frozen) and obs.dist.name == "norm":
+            mean = np.broadcast_to(obs.mean(), (self.n_states,))
+            cov = np.diag(np.broadcast_to(obs.var(), (self.n_states,)))
+        elif hasattr(obs, "cov") and hasattr(obs, "mean") and hasattr(obs, "logpdf"):
+            mean = np.broadcast_to(obs.mean, (self.n_states,))
+            cov = np.broadcast_to(obs.cov, (self.n_states, self.n_states))
+        else:
+            raise ValueError(f"Closed form solution needs a Gaussian pi_obs: {obs}")
+        return np.asarray(mean, dtype=float), np.asarray(cov, dtype=float)
+
+    def solve_linear(self, fit=None):
+        """
+        Solve in closed form for a linear QoI map
+
+        For a linear map `Q(lam) = A lam + b`, a Gaussian initial distribution
+        `N(lam_0, C_in)` and a Gaussian observed distribution `N(d, C_obs)`,
+        the updated distribution is Gaussian [1], with precision
+
+        `P = C_in^-1 + A^T C_obs^-1 A - A^T C_pr^+ A`,  `C_pr = A C_in A^T`
+
+        and mean, the MUD point, `lam_0 + P^-1 A^T C_obs^-1 (d - b - A lam_0)`.
+        The pseudo-inverse of the predicted covariance `C_pr` covers maps with
+        more states than parameters, where the MUD point is the least squares
+        solution. No KDEs are computed: the map is fit from the samples (see
+        `fit_linear_map()`), and the initial distribution is taken as the
+        Gaussian with the weighted mean and covariance of the samples. The
+        observed distribution must be Gaussian.
+
+        The `state` densities are set from these Gaussians, with the ratio the
+        updated over the initial density, and `pi_pr` the observed density
+        over the ratio, so that the sampling based quantities, e.g. `e_r`, are
+        computed as in `solve()`. The MUD point is the closed form one, not
+        the sample maximizing `pi_up`, stored with the rest of the solution
+        in the `linear` attribute.
+
+        Parameters
+        ----------
+        fit : Tuple, optional
+            Linear fit `(A, b, err)` of the map, as returned by
+            `fit_linear_map()`. Computed if not given.
+        """
+        A, b, err = self.fit_linear_map() if fit is None else fit
+        lam = self.lam
+        mean_in = np.average(lam, axis=0, weights=self.state["weight"])
+        cov_in = np.atleast_2d(np.cov(lam.T, aweights=self.state["weight"]))
+        d, cov_obs = self._obs_moments()
+
+        obs_A = np.linalg.solve(cov_obs, A)
+        prec = (
+            np.linalg.inv(cov_in)
+            + A.T @ obs_A
+            - A.T @ np.linalg.pinv(A @ cov_in @ A.T, hermitian=True) @ A
+        )
+        prec = (prec + prec.T) / 2
+        cov_up = np.linalg.inv(prec)
+        mean_up = mean_in + cov_up @ (obs_A.T @ (d - b - A @ mean_in))
+
+        log_in = multivariate_normal(mean_in, cov_in).logpdf(lam).reshape(-1)
+        log_up = multivariate_normal(mean_up, cov_up).logpdf(lam).reshape(-1)
+        log_obs = self.pi_obs(log=True)
+        log_ratio = log_up - log_in
+        self.state["pi_in"] = np.exp(log_in)
+        self.state["pi_obs"] = np.exp(log_obs)
+        self.state["pi_pr"] = np.exp(log_obs - log_ratio)
+        self.state["log_ratio"] = log_ratio
+        self.state["log_pi_up"] = log_up
+        self.state["ratio"] = np.exp(log_ratio)
+        self.state["pi_up"] = np.exp(log_up)
+
+        self.linear = {
+            "A": A,
+            "b": b,
+            "err": err,
+            "mean_in": mean_in,
+            "cov_in": cov_in,
+            "mean_up": mean_up,
+            "cov_up": cov_up,
+        }
+        m = np.argmax(log_up)
+        self.result = pd.DataFrame(
+            [[self.expected_ratio(), self.divergence_kl()]], columns=["e_r", "kl"]
+        )
+        self.result = put_df(
+            self.result, "lam_MUD", mean_up[None, :], size=self.n_params
+        )
+        self.result["MUD_idx"] = m
+        self.mud_point = mean_up
+        self.mud_arg = m
 
     def get_mud_point(self, state_df=None):
         """
         Get MUD Point from DataFrame
 
         Get MUD point from DataFrame. If DataFrame is not passed in, use the
-        `result` attribute of the class.
+        `result` attribute of the class. The log of the updated density is
+        used if available, as it does not underflow.
         """
         if state_df is None:
             state_df = self.state
-        m = np.argmax(state_df["pi_up"])
-        mud_point = get_df(state_df.iloc[[m]], "lam", size=self.n_params)
+        m = np.argmax(state_df["log_pi_up" if "log_pi_up" in state_df else "pi_up"])
+        mud_point = get_df(state_df, "lam", size=self.n_params)[[m]]
         return m, mud_point
 
     def plot_L(
@@ -8,9 +8,9 @@ in general in terms of how they are to be used:
 
 1. Initialization: Upon initailization the state of the system is set,
 including parameter samples, their values evaluated through the forward model,
-and data/assumptions on observed data. This is used to initailiaze a pandas
-DataFrame `state`, that stores these values and is used for computing and
-storing final solutions
+and data/assumptions on observed data. This is used to initailiaze the
+array backed `state` (see `pydci.state.ProblemState`), that stores these values
+and is used for computing and storing final solutions
 2. Solving: solve() -> Main method called to solve the problem class. Specific
 parameters controlling how the algorithm is solved can be set here. The results
 of the solve are store in the `result` attribute of the class.
@@ -38,31 +38,56 @@ import random
 from itertools import cycle
 from typing import Callable, List, Optional, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from alive_progress import alive_bar
 from numpy.linalg import LinAlgError
 from numpy.typing import ArrayLike
-from rich.table import Table
 from scipy.stats import rv_continuous  # type: ignore
 from scipy.stats.distributions import norm
-from sklearn.decomposition import PCA  # type: ignore
-from sklearn.preprocessing import StandardScaler  # type: ignore
 
-from pydci import PCAMUDProblem
+from pydci.consistent_bayes.PCAMUDProblem import PCAMUDProblem
 from pydci.log import disable_log, enable_log, log_table, logger
+from pydci.plotting import plt, sns
 from pydci.utils import KDEError, closest_factors, fit_domain, get_df, put_df, set_shape
 
-sns.color_palette("bright")
-sns.set_style("darkgrid")
-
 __author__ = "Carlos del-Castillo-Negrete"
 __copyright__ = "Carlos del-Castillo-Negrete"
 __license__ = "mit"
 
 
+def get_iterations(n_qoi, pca_components=1, pca_mask=None, pca_splits=1):
+    """
+    Iterations `(pca_mask, pca_components)` of an `OfflineSequential` solve,
+    as set by the arguments of `OfflineSequential.solve()`, and the number of
+    splits of the data.
+    """
+    num_splits = 1
+    pca_components = (
+        [list(range(pca_components))]
+        if isinstance(pca_components, int)
+        else pca_components
+    )
+    if isinstance(pca_splits, int) or pca_splits is None:
+        # Make even number of splits of all qoi if mask is not specified
+        pca_mask = np.arange(n_qoi) if pca_mask is None else pca_mask
+        num_splits = pca_splits if pca_splits is not None else 1
+        pca_splits = [
+            range(x[0], x[-1] + 1) for x in np.array_split(pca_mask, num_splits)
+        ]
+    elif isinstance(pca_splits, list):
+        num_splits = len(pca_splits)
+        if pca_mask is not None:
+            raise ValueError("Cannot specify both pca_mask and non-integer pca_splits")
+    return [(i, j) for i in pca_splits for j in pca_components], num_splits
+
+
+def prefix_key(iterations):
+    """
+    Hashable key of `iterations`, as returned by `get_iterations()`.
+    """
+    return tuple((tuple(np.ravel(m)), tuple(np.ravel(c))) for m, c in iterations)
+
+
 class OfflineSequential(PCAMUDProblem):
     """
     Offline Sequential Estimation
@@ -82,6 +107,9 @@ class OfflineSequential(PCAMUDProblem):
     Attributes
     ----------
     pca_res : List[pd.DataFrame]
+    n_solves : int
+        Number of iterations solved by the last `solve()`, not counting those
+        resumed from a prefix cache.
 
     Methods
     -------
@@ -104,41 +132,6 @@ class OfflineSequential(PCAMUDProblem):
     ):
         self.init_prob(samples, data, std_dev, pi_in=pi_in)
 
-    def init_prob(self, samples, data, std_dev, pi_in=None):
-        """
-        Initialize problem
-
-        Initialize problem by setting the lambda samples, the values of the
-        samples pushed through the forward map, and the observe distribution
-        on the data. Can optionally as well set the initial and predicteed
-        distributions explicitly, and pass in weights to incorporate prior
-        beliefs on the `lam` sample sets.
-        """
-        # Assume gaussian error around mean of data with assumed noise
-        super().init_prob(
-            samples,
-            data,
-            std_dev,
-            pi_in=pi_in,
-        )
-        self.pca_states = None
-
-    def save_state(self, vals):
-        """
-        Save current state, adding columns with values in vals dictionary
-        """
-        keys = vals.keys()
-        cols = [c for c in self.state.columns if c.startswith("lam_")]
-        cols += [c for c in self.state.columns if c.startswith("q_pca_")]
-        cols += ["weight", "pi_in", "pi_obs", "pi_pr", "ratio", "pi_up"]
-        state = self.state[cols].copy()
-        for key in keys:
-            state[key] = vals[key]
-        if self.pca_states is None:
-            self.pca_states = state
-        else:
-            self.pca_states = pd.concat([self.pca_states, state], axis=0)
-
     def solve(
         self,
         weights=None,
@@ -148,6 +141,8 @@ class OfflineSequential(PCAMUDProblem):
         exp_thresh: float = 0.5,
         fail_on_partial: bool = True,
         state_extra: dict = None,
+        prefix_cache: dict = None,
+        max_its: int = None,
     ):
         """
         Solve the parameter estimation problem
@@ -156,8 +151,25 @@ class OfflineSequential(PCAMUDProblem):
         to aggregate data between the observed and predicted values and
         determine the best MUD estimate that fits the data.
 
+        Each iteration re-weights the samples, which refits the KDE on the
+        parameter samples. To instead freeze its bandwidth after the first
+        iteration and reuse its kernel matrix, evaluating the re-weighted
+        density as a matrix-vector product, use the frozen KDE backend before
+        solving: `prob.set_kde("frozen", dists=["pi_in"])`.
+
         Parameters
         ----------
+        prefix_cache : dict, optional
+            Checkpoints after each iteration, keyed by `exp_thresh` and the
+            iterations solved so far (see `prefix_key()`). Solves resume from
+            the longest prefix of their iterations found, and add the ones
+            they solve, so solves sharing first iterations, e.g. the
+            combinations of an `OfflineSequentialSearch`, only solve them
+            once. Must only be shared between solves of the same problem and
+            initial weights.
+        max_its : int, optional
+            Solve only the first `max_its` iterations, e.g. to resume the
+            solve later through a `prefix_cache`.
         """
         it_results = []
         weights = [] if weights is None else weights
@@ -166,29 +178,38 @@ class OfflineSequential(PCAMUDProblem):
             msg = f"Expected ratio thresh must be a float > 0: {exp_thresh}"
             logger.error(msg)
             raise ValueError(msg)
-        num_splits = 1
-        pca_components = [list(range(pca_components))] if isinstance(
-            pca_components, int) else pca_components
-        if isinstance(pca_splits, int) or pca_splits is None:
-            # Make even number of splits of all qoi if mask is not specified
-            pca_mask = np.arange(self.n_qoi) if pca_mask is None else pca_mask
-            num_splits = pca_splits if pca_splits is not None else 1
-            pca_splits = [
-                range(x[0], x[-1] + 1) for x in np.array_split(pca_mask, num_splits)
-            ]
-        elif isinstance(pca_splits, list):
-            num_splits = len(pca_splits)
-            if pca_mask is not None:
-                raise ValueError(
-                    "Cannot specify both pca_mask and non-integer pca_splits"
-                )
-        iterations = [(i, j) for i in pca_splits for j in pca_components]
-        prev_in = self.dists["pi_in"]
+        iterations, num_splits = get_iterations(
+            self.n_qoi, pca_components, pca_mask, pca_splits
+        )
+        iterations = iterations[:max_its]
+        ckpt = None
         if len(iterations) == 0:
             raise ValueError(f"No iterations specified: {pca_splits}, {pca_mask}")
-        for i, (pca_mask, pca_cs) in enumerate(iterations):
+        start, node = 0, None
+        if prefix_cache is not None:
+            for i in range(len(iterations), 0, -1):
+                node = prefix_cache.get((exp_thresh, prefix_key(iterations[:i])))
+                if node is not None:
+                    start = i
+                    break
+        if node is not None:
+            logger.info(f"Resuming from solved iterations {iterations[:start]}")
+            ckpt, weights, it_results = node["ckpt"], node["weights"], node["results"]
+            self.restore(ckpt)
+            info = {"pca_splits": num_splits, **(state_extra or {})}
+            self.it_log = self.it_log.copy(start, info=info)
+            weights = list(weights)
+            it_results = [r.copy() for r in it_results]
+            for r in it_results:
+                r["num_splits"] = num_splits
+        self.n_solves = 0
+        if node is not None:
+            # Own snapshot, as the cached one holds the log of another problem
+            ckpt = self.checkpoint()
+        for i, (pca_mask, pca_cs) in enumerate(iterations[start:], start):
             str_val = pca_mask if pca_mask is not None else "ALL"
             logger.info(f"Iteration {i}: Solving using ({str_val}, {pca_cs})")
+            self.n_solves += 1
 
             self.set_weights(weights)
             try:
@@ -231,14 +252,10 @@ class OfflineSequential(PCAMUDProblem):
                     failed = True
 
             if failed:
-                logger.info(f"Resetting to last solution at {iterations[i-1]}")
-                self.set_weights(weights[:-1])
-                self.dists["pi_in"] = prev_in
-                logger.debug(f"dists: {self.dists}")
-                self.solve(
-                    pca_mask=iterations[i - 1][0],
-                    pca_components=[iterations[i - 1][1]],
-                )
+                logger.info(f"Restoring last solution at {iterations[i-1]}")
+                n_solves = self.n_solves
+                self.restore(ckpt)
+                self.n_solves = n_solves
                 break
             else:
                 state_vals = {
@@ -253,10 +270,17 @@ class OfflineSequential(PCAMUDProblem):
                 it_results.append(self.result.copy())
                 it_results[-1]["i"] = len(it_results) - 1
                 it_results[-1]["num_splits"] = num_splits
+                ckpt = self.checkpoint()
+                if prefix_cache is not None:
+                    key = (exp_thresh, prefix_key(iterations[: i + 1]))
+                    prefix_cache[key] = {
+                        "ckpt": ckpt,
+                        "weights": weights + [self.state["ratio"]],
+                        "results": list(it_results),
+                    }
                 if i != len(iterations) - 1:
                     logger.info("Updating weights")
-                    weights.append(self.state["ratio"].values)
-                    prev_in = self.dists["pi_in"]
+                    weights.append(self.state["ratio"])
 
         self.it_results = pd.concat(it_results)
         self.result = self.it_results.iloc[[-1]]
@@ -267,15 +291,13 @@ class OfflineSequential(PCAMUDProblem):
 
     def get_iteration_state(self, iteration=-1):
         """
-        Retrieve the state of the system at the specified iteration
+        Retrieve the state of the system at the specified iteration, on read
+        only views of the iteration log `it_log`, or the current state if no
+        iterations have been saved.
         """
-        if self.pca_states is None:
-            df = self.state
-        else:
-            iterations = self.pca_states["iteration"].unique()
-            df = self.pca_states[self.pca_states["iteration"] == iterations[iteration]]
-
-        return df
+        if self.it_log is None:
+            return self.state
+        return self.it_log[iteration]
 
     def plot_L(
         self,
@@ -321,7 +343,8 @@ class OfflineSequential(PCAMUDProblem):
             Tuple of (1) matplotlib axis object where distributions where
             plotted and (2) List of labels that were plotted, in order plotted.
         """
-        df = df if df is not None else self.get_iteration_state(iteration=iteration)
+        if df is None:
+            df = self.get_iteration_state(iteration=iteration).to_frame()
 
         ax, labels = super().plot_L(
             lam_true=lam_true,
@@ -381,7 +404,8 @@ class OfflineSequential(PCAMUDProblem):
             Tuple of (1) matplotlib axis object where distributions where
             plotted and (2) List of labels that were plotted, in order plotted.
         """
-        df = df if df is not None else self.get_iteration_state(iteration=iteration)
+        if df is None:
+            df = self.get_iteration_state(iteration=iteration).to_frame()
 
         ax, labels = super().plot_D(
             df=df,
@@ -596,7 +620,7 @@ class OfflineSequential(PCAMUDProblem):
         """
         result = self.result if result is None else result
         title = super()._parse_title(result=result, lam_true=lam_true)
-        num_splits = len(self.pca_states["iteration"].unique())
+        num_splits = 0 if self.it_log is None else len(self.it_log)
         if nc:
             title = f"# Splits = {num_splits}: " + title
 
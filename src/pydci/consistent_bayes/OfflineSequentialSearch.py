@@ -8,9 +8,9 @@ in general in terms of how they are to be used:
 
 1. Initialization: Upon initailization the state of the system is set,
 including parameter samples, their values evaluated through the forward model,
-and data/assumptions on observed data. This is used to initailiaze a pandas
-DataFrame `state`, that stores these values and is used for computing and
-storing final solutions
+and data/assumptions on observed data. This is used to initailiaze the
+array backed `state` (see `pydci.state.ProblemState`), that stores these values
+and is used for computing and storing final solutions
 2. Solving: solve() -> Main method called to solve the problem class. Specific
 parameters controlling how the algorithm is solved can be set here. The results
 of the solve are store in the `result` attribute of the class.
@@ -34,33 +34,174 @@ TODO List:
 
 """
 import math
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from itertools import cycle
 from typing import Callable, List, Optional, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from alive_progress import alive_bar
 from numpy.linalg import LinAlgError
 from numpy.typing import ArrayLike
-from rich.table import Table
+from scipy.linalg import cho_solve, cholesky, solve_triangular
 from scipy.stats import rv_continuous  # type: ignore
 from scipy.stats.distributions import norm
-from sklearn.decomposition import PCA  # type: ignore
-from sklearn.preprocessing import StandardScaler  # type: ignore
 
-from pydci import OfflineSequential
+from pydci.consistent_bayes.OfflineSequential import (
+    OfflineSequential,
+    get_iterations,
+    prefix_key,
+)
+from pydci.consistent_bayes.PCAMUDProblem import DEF_PCA_CACHE_SIZE
+from pydci.kde import get_n_jobs
 from pydci.log import disable_log, enable_log, log_table, logger
-from pydci.utils import KDEError, closest_factors, fit_domain, get_df, put_df, set_shape, get_search_combinations
-
-sns.color_palette("bright")
-sns.set_style("darkgrid")
+from pydci.plotting import plt, sns
+from pydci.utils import (
+    KDEError,
+    LRUCache,
+    closest_factors,
+    fit_domain,
+    get_df,
+    get_search_combinations,
+    put_df,
+    set_shape,
+)
 
 __author__ = "Carlos del-Castillo-Negrete"
 __copyright__ = "Carlos del-Castillo-Negrete"
 __license__ = "mit"
 
+# q_pca maps cached per worker process of parallel searches
+_WORKER_CACHE = None
+
+# Search strategies, see OfflineSequentialSearch.solve()
+SEARCH_STRATEGIES = ["full", "halving", "adaptive"]
+
+# Successive halving: fraction of combinations kept at each budget, and how far
+# outside of `exp_thresh` combinations are dropped regardless
+DEF_HALVING_RATE = 2
+DEF_PRUNE_FACTOR = 4.0
+
+# Adaptive search: combinations solved before the surrogate proposes them, and
+# the Gaussian process length scale and noise on features scaled to [0, 1]
+DEF_ADAPTIVE_INIT = 8
+DEF_GP_LENGTH_SCALE = 0.3
+DEF_GP_NOISE = 1e-4
+
+# Arguments of OfflineSequential.solve() setting its iterations
+ITERATION_ARGS = ["pca_components", "pca_mask", "pca_splits"]
+
+
+def _search_features(search_list, n_qoi):
+    """
+    Features `(# PCA components, mask length, # splits)` of the search
+    combinations in `search_list`, on problems with `n_qoi` QoI, scaled to
+    [0, 1] over the search.
+    """
+    X = np.array(
+        [
+            [
+                max(len(c) for c in args.get("pca_components", [[0]])),
+                len(args.get("pca_mask", None) or range(n_qoi)),
+                args.get("pca_splits", 1),
+            ]
+            for args in search_list
+        ],
+        dtype=float,
+    )
+    span = X.max(axis=0) - X.min(axis=0)
+    return (X - X.min(axis=0)) / np.where(span > 0, span, 1.0)
+
+
+def _gp_predict(X, y, Xs, length_scale=DEF_GP_LENGTH_SCALE, noise=DEF_GP_NOISE):
+    """
+    Mean and standard deviation at `Xs` of a Gaussian process with a squared
+    exponential kernel fit to values `y` at `X`.
+    """
+    y_mean, y_std = y.mean(), y.std()
+    y_std = y_std if y_std > 0 else 1.0
+
+    def kernel(a, b):
+        d2 = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=-1)
+        return np.exp(-0.5 * d2 / length_scale**2)
+
+    L = cholesky(kernel(X, X) + noise * np.eye(len(X)), lower=True)
+    alpha = cho_solve((L, True), (y - y_mean) / y_std)
+    Ks = kernel(X, Xs)
+    v = solve_triangular(L, Ks, lower=True)
+    var = np.clip(1.0 - (v**2).sum(axis=0), 1e-12, None)
+    return y_mean + y_std * (Ks.T @ alpha), y_std * np.sqrt(var)
+
+
+def _expected_improvement(best, mean, std):
+    """
+    Expected improvement below `best` of normal predictions `mean`, `std`.
+    """
+    z = (best - mean) / std
+    return (best - mean) * norm.cdf(z) + std * norm.pdf(z)
+
+
+def _solve_combination(
+    setup, idx, args, pca_cache=None, keep_prob=True, prefix_cache=None
+):
+    """
+    Solve search combination `idx`, an `OfflineSequential` problem on
+    `setup`, a tuple `(samples, measurements, std_dev, pi_in)`, with solve
+    arguments `args`, resuming from the iterations in `prefix_cache` it
+    shares with other combinations. Runs in the workers of parallel
+    searches, so only the (compact) iteration results and result are
+    returned, or None if the solve failed, along with the problem itself if
+    `keep_prob`, and the number of iterations solved. Problems use
+    `pca_cache`, or a cache per worker process if None, detached from
+    returned problems.
+    """
+    global _WORKER_CACHE
+    if pca_cache is None:
+        if _WORKER_CACHE is None:
+            _WORKER_CACHE = LRUCache(DEF_PCA_CACHE_SIZE)
+        pca_cache = _WORKER_CACHE
+    samples, measurements, std_dev, pi_in = setup
+    prob = OfflineSequential(samples, measurements, std_dev, pi_in=pi_in)
+    prob.pca_cache = pca_cache
+
+    res = None
+    logger.debug(f"Attempting solve with args: {args}")
+    try:
+        prob.solve(
+            **args, state_extra={"search_index": idx}, prefix_cache=prefix_cache
+        )
+    except (ZeroDivisionError, KDEError, LinAlgError) as e:
+        logger.error(f"Failed: Ill-posed problem: {e}")
+    except RuntimeError as r:
+        if "No solution found within exp_thresh" in str(r):
+            logger.error(f"Failed: No solution in exp_thresh: {r}")
+        if "Failed to solve problem through all iterations" in str(r):
+            logger.error(f"Failed: No solution found for all data: {r}")
+            res = (prob.it_results, prob.result)
+        else:
+            raise r
+    else:
+        res = (prob.it_results, prob.result)
+    prob.pca_cache = None
+    return res, prob if keep_prob else None, prob.n_solves
+
+
+def _solve_group(setup, group, pca_cache=None, keep_prob=True, memoize=True):
+    """
+    Solve a `group` of search combinations `(idx, args)` in order, see
+    `_solve_combination()`, sharing a prefix cache if `memoize` is set, so
+    iterations shared between combinations are solved once.
+    """
+    prefix_cache = {} if memoize else None
+    res = [
+        (idx, *_solve_combination(setup, idx, args, pca_cache, keep_prob, prefix_cache))
+        for idx, args in group
+    ]
+    if memoize:
+        logger.debug(f"Solved {len(prefix_cache)} distinct iterations")
+    return res
+
 
 class OfflineSequentialSearch:
     """
@@ -68,6 +209,11 @@ class OfflineSequentialSearch:
 
     Attributes
     ----------
+    search_stats : dict
+        Statistics of the last `solve()`: its `strategy`, the iterations
+        `solves` and `full_solves` a full search without memoization would
+        solve, the `saved` difference, and the search indices `pruned`,
+        dropped or not solved by the "halving" and "adaptive" strategies.
 
     Methods
     -------
@@ -114,10 +260,57 @@ class OfflineSequentialSearch:
         self.probs = []
         self.best = None
 
+        # q_pca maps shared by the problems of all search combinations
+        self.pca_cache = LRUCache(DEF_PCA_CACHE_SIZE)
+        self.n_jobs = 1
+        self.executor = None
+
     @property
     def n_meas(self) -> int:
         return len(self.measurements)
 
+    def set_n_jobs(self, n_jobs=1, executor=None):
+        """
+        Set Parallel Search
+
+        Sets how the search combinations of `solve()` are solved in parallel.
+        Combinations are independent, so they are solved across a pool of
+        `n_jobs` processes, or threads if the problem can not be sent to
+        other processes, or submitted to `executor` if passed. Workers only
+        send back the results of each combination, and the problems
+        themselves if `store` is set. Results, and the ordering by
+        `search_index`, are the same for any number of workers.
+
+        Parameters
+        ----------
+        n_jobs : int, default=1
+            Number of workers to use. -1 uses all CPUs.
+        executor : concurrent.futures.Executor, optional
+            Executor to submit combinations to. q_pca maps are shared between
+            combinations unless it is a `ProcessPoolExecutor`.
+        """
+        self.n_jobs = n_jobs
+        self.executor = executor
+
+    def _search_pool(self, setup):
+        """
+        Executor to solve search combinations on `setup` with, None to solve
+        them serially, and whether its workers share memory with this one.
+        """
+        if self.executor is not None:
+            return self.executor, not isinstance(self.executor, ProcessPoolExecutor)
+        n_jobs = get_n_jobs(self.n_jobs)
+        if n_jobs == 1:
+            return None, True
+        try:
+            pickle.dumps(setup)
+            return ProcessPoolExecutor(max_workers=n_jobs), False
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.info(f"Unable to solve in processes, using threads: {e}")
+        except (OSError, NotImplementedError) as e:
+            logger.info(f"Process pools not available, using threads: {e}")
+        return ThreadPoolExecutor(max_workers=n_jobs), True
+
     def solve(
         self,
         search_list=None,
@@ -133,6 +326,10 @@ class OfflineSequentialSearch:
         max_nc=5,
         data_chunk_size=None,
         max_num_combs=20,
+        memoize: bool = True,
+        strategy: str = "full",
+        halving_rate: int = DEF_HALVING_RATE,
+        prune_factor: float = DEF_PRUNE_FACTOR,
     ):
         """
         Search through different iterations of solvign the PCA problem
@@ -141,8 +338,48 @@ class OfflineSequentialSearch:
         different iterative solve arguments, solve them and determine
         the "best" solution
 
+        The number of iterations solved, and those a full search without
+        memoization would solve, are stored in `search_stats`.
+
         Parameters
         ----------
+        max_num_combs : int, default=20
+            Maximum number of search combinations. With the "adaptive"
+            strategy, the number of combinations solved instead, out of all
+            search combinations.
+        memoize : bool, default=True
+            Solve iterations shared by combinations, e.g. the first splits of
+            increasingly large data masks, once. Combinations are grouped by
+            their first iteration, groups solved in order in a worker each,
+            and the solves in a group resume from the longest prefix of their
+            iterations already solved (see `OfflineSequential.solve()`).
+        strategy : str, default="full"
+            One of:
+                - "full": Solve all combinations through all iterations.
+                - "halving": Successive halving. Combinations are solved
+                  through a budget of iterations, starting at one and
+                  multiplied by `halving_rate` each round, resuming from the
+                  previous round. After each round, only the best
+                  `1 / halving_rate` of the unfinished combinations, as
+                  ranked by `best_method`, continue, and those with
+                  `|E(r) - 1|` over `prune_factor * exp_thresh` are dropped.
+                  Dropped combinations are not in the results. Solved in
+                  this process, sharing a prefix cache across rounds.
+                - "adaptive": Model based search. The search combinations
+                  are not truncated to `max_num_combs`, which is instead the
+                  number solved. After `DEF_ADAPTIVE_INIT` combinations spread
+                  over `(# PCA components, mask length, # splits)`, each next
+                  combination solved is the one with the largest expected
+                  improvement of Gaussian process surrogates fit to the
+                  `log|E(r) - 1|` and, for the KL methods, the KL divergence
+                  of those solved so far. Combinations not solved are not in
+                  the results. Solved in this process, sharing a prefix cache.
+        halving_rate : int, default=DEF_HALVING_RATE
+            Rate the iteration budget grows, and the combinations kept shrink,
+            each round of the "halving" strategy. An int >= 2.
+        prune_factor : float, default=DEF_PRUNE_FACTOR
+            Combinations with `|E(r) - 1|` over `prune_factor * exp_thresh`
+            after a round of the "halving" strategy are dropped.
         """
         am = ["closest", "min_kl", "max_kl"]
         if best_method not in am:
@@ -151,6 +388,12 @@ class OfflineSequentialSearch:
         if exp_thresh <= 0:
             msg = f"Expected ratio thresh must be a float > 0: {exp_thresh}"
             raise ValueError(msg)
+        if strategy not in SEARCH_STRATEGIES:
+            msg = f"Unrecognized strategy {strategy}. Allowed: {SEARCH_STRATEGIES}"
+            raise ValueError(msg)
+        if not isinstance(halving_rate, (int, np.integer)) or halving_rate < 2:
+            msg = f"Halving rate must be an int >= 2: {halving_rate}"
+            raise ValueError(msg)
 
         # TODO: Move this call to utility function, print pandata DataFrame if logger set
         search_list = (
@@ -165,7 +408,7 @@ class OfflineSequentialSearch:
                 split_range=split_range,
                 max_nc=max_nc,
                 data_chunk_size=data_chunk_size,
-                max_num_combs=max_num_combs,
+                max_num_combs=None if strategy == "adaptive" else max_num_combs,
             ) if search_list is None else search_list
         )
         logger.info(f'Searching through combinations:\n{pd.DataFrame(search_list)}')
@@ -174,50 +417,62 @@ class OfflineSequentialSearch:
         all_search_results = []
         all_results = []
         probs = []
+        its = []
+        for args in search_list:
+            args.update(dict(fail_on_partial=fail_on_partial))
+            its_args = {k: args[k] for k in ITERATION_ARGS if k in args}
+            its.append(get_iterations(self.n_meas, **its_args)[0])
+        setup = (self.samples, self.measurements, self.std_dev, pi_in)
 
-        def _append_result(p, i):
-            all_search_results.append(prob.it_results.copy())
-            all_search_results[-1]["search_index"] = idx
-            all_results.append(prob.result.copy())
-            all_results[-1]["search_index"] = idx
+        from alive_progress import alive_bar
 
         with alive_bar(
-            len(search_list),
+            min(len(search_list), max_num_combs)
+            if strategy == "adaptive"
+            else len(search_list),
             title="Solving for different combinations",
             force_tty=True,
             receipt=False,
             length=40,
         ) as bar:
-            for idx, args in enumerate(search_list):
-                prob = OfflineSequential(
-                    self.samples,
-                    self.measurements,
-                    self.std_dev,
-                    pi_in=pi_in,
+            if strategy == "halving":
+                results, pruned = self._solve_halving(
+                    setup,
+                    search_list,
+                    its,
+                    exp_thresh,
+                    best_method,
+                    halving_rate,
+                    prune_factor,
+                    bar,
                 )
-
-                args.update(dict(
-                    fail_on_partial=fail_on_partial
-                ))
-                logger.debug(f"Attempting solve with args: {args}")
-                try:
-                    prob.solve(**args, state_extra={"search_index": idx})
-                except ZeroDivisionError or KDEError or LinAlgError as e:
-                    logger.error(f"Failed: Ill-posed problem: {e}")
-                except RuntimeError as r:
-                    if "No solution found within exp_thresh" in str(r):
-                        logger.error(f"Failed: No solution in exp_thresh: {r}")
-                        # _append_result(prob, idx)
-                    if "Failed to solve problem through all iterations" in str(r):
-                        logger.error(f"Failed: No solution found for all data: {r}")
-                        _append_result(prob, idx)
-                    else:
-                        raise r
-                else:
-                    _append_result(prob, idx)
-
-                probs.append(prob)
-                bar()
+            elif strategy == "adaptive":
+                results, pruned = self._solve_adaptive(
+                    setup, search_list, its, exp_thresh, best_method, max_num_combs, bar
+                )
+            else:
+                results, pruned = self._solve_all(setup, search_list, its, memoize, bar)
+
+        for idx, (res, prob, _) in enumerate(results):
+            if res is not None:
+                all_search_results.append(res[0].copy())
+                all_search_results[-1]["search_index"] = idx
+                all_results.append(res[1].copy())
+                all_results[-1]["search_index"] = idx
+            if prob is not None:
+                prob.pca_cache = self.pca_cache
+            probs.append(prob)
+
+        n_solves = sum(r[2] for r in results)
+        n_full = sum(len(x) for x in its)
+        self.search_stats = {
+            "strategy": strategy,
+            "solves": n_solves,
+            "full_solves": n_full,
+            "saved": n_full - n_solves,
+            "pruned": pruned,
+        }
+        logger.info(f"Solved {n_solves} of {n_full} iterations: {self.search_stats}")
 
         if self.store:
             self.probs = probs
@@ -238,11 +493,16 @@ class OfflineSequentialSearch:
             self.search_results = self._process_search_results(all_results, exp_thresh)
             self.result = self.search_results[self.search_results[best_method]]
             logger.debug(f'Search results:\n{self.search_results}')
-            self.best = (
-                None
-                if len(self.result) == 0
-                else probs[self.result["search_index"].values[0]]
-            )
+            self.best = None
+            if len(self.result) > 0:
+                idx = self.result["search_index"].values[0]
+                self.best = probs[idx]
+                if self.best is None:
+                    # Not sent back by the workers, so solved again here
+                    _, self.best, _ = _solve_combination(
+                        setup, idx, search_list[idx], pca_cache=self.pca_cache
+                    )
+                    self.best.pca_cache = self.pca_cache
 
             if self.best is None:
                 msg = f"No solution found within exp_thresh {exp_thresh} for any solve"
@@ -252,6 +512,161 @@ class OfflineSequentialSearch:
             logger.error(msg)
             raise RuntimeError(msg)
 
+    def _solve_all(self, setup, search_list, its, memoize, bar):
+        """
+        Solve all search combinations on `setup` through all their
+        iterations `its`, in parallel as set by `set_n_jobs()`, returning
+        the results of each (see `_solve_combination()`) and no dropped
+        combinations.
+        """
+        pool, shared = self._search_pool(setup)
+        solve_group = partial(
+            _solve_group,
+            setup,
+            pca_cache=self.pca_cache if shared else None,
+            keep_prob=self.store or pool is None,
+            memoize=memoize,
+        )
+        groups = {}
+        for idx, args in enumerate(search_list):
+            root = (idx,)
+            if memoize and pool is None:
+                root = None
+            elif memoize:
+                root = (args.get("exp_thresh"), prefix_key(its[idx][:1]))
+            groups.setdefault(root, []).append((idx, args))
+
+        results = [None] * len(search_list)
+        try:
+            mapper = map if pool is None else pool.map
+            for group in mapper(solve_group, groups.values()):
+                for idx, *res in group:
+                    results[idx] = res
+                bar(len(group))
+        finally:
+            if pool is not None and pool is not self.executor:
+                pool.shutdown(cancel_futures=True)
+        return results, []
+
+    def _solve_halving(
+        self, setup, search_list, its, exp_thresh, best_method, rate, prune_factor, bar
+    ):
+        """
+        Solve search combinations on `setup` by successive halving (see
+        `solve()`), returning the results of each (see `_solve_combination()`)
+        with None for those dropped, and the search indices dropped.
+        """
+        prefix_cache = {}
+        results = [(None, None, 0)] * len(search_list)
+        running = list(range(len(search_list)))
+        pruned = []
+        budget = 1
+        while len(running) > 0:
+            for idx in running:
+                args = dict(search_list[idx], max_its=budget)
+                res, prob, n = _solve_combination(
+                    setup, idx, args, self.pca_cache, True, prefix_cache
+                )
+                results[idx] = (res, prob, results[idx][2] + n)
+
+            # Failed, stopped early, or through all iterations
+            done = [
+                i
+                for i in running
+                if results[i][0] is None
+                or len(results[i][0][0]) < min(budget, len(its[i]))
+                or budget >= len(its[i])
+            ]
+            running = [i for i in running if i not in done]
+            dropped = []
+            if len(running) > 0:
+                res_df = pd.concat([results[i][0][1] for i in running])
+                delta = np.abs(res_df["e_r"].values - 1.0)
+                metric = {
+                    "closest": delta,
+                    "min_kl": res_df["kl"].values,
+                    "max_kl": -res_df["kl"].values,
+                }[best_method]
+                order = np.lexsort((metric, delta > exp_thresh))
+                keep = [
+                    running[j]
+                    for j in order[: math.ceil(len(running) / rate)]
+                    if delta[j] <= prune_factor * exp_thresh
+                ]
+                keep = keep if len(keep) > 0 else [running[order[0]]]
+                dropped = [i for i in running if i not in keep]
+                logger.debug(f"Budget {budget}: dropping {dropped}, keeping {keep}")
+                for i in dropped:
+                    results[i] = (None, *results[i][1:])
+                pruned += dropped
+                running = keep
+            bar(len(done) + len(dropped))
+            budget *= rate
+        return results, sorted(pruned)
+
+    def _solve_adaptive(
+        self, setup, search_list, its, exp_thresh, best_method, max_solves, bar
+    ):
+        """
+        Solve up to `max_solves` search combinations on `setup`, proposed by
+        surrogates of the combinations solved so far (see `solve()`),
+        returning the results of each (see `_solve_combination()`) with None
+        for those not solved, and the search indices not solved.
+        """
+        prefix_cache = {}
+        results = [(None, None, 0)] * len(search_list)
+        X = _search_features(search_list, self.n_meas)
+        solved = []
+        log_delta = []
+        kl = []
+        while len(solved) < min(max_solves, len(search_list)):
+            todo = [i for i in range(len(search_list)) if i not in solved]
+            if len(solved) < DEF_ADAPTIVE_INIT:
+                # Greedy maximin design, starting from the first combination
+                dist = [
+                    min([np.linalg.norm(X[i] - X[j]) for j in solved], default=0)
+                    for i in todo
+                ]
+                idx = todo[int(np.argmax(dist))]
+            else:
+                # Failed combinations scored worse than any solved
+                y = np.array(log_delta)
+                worst = np.nanmax(y, initial=0.0) + 1.0
+                y = np.where(np.isnan(y), worst, y)
+                mean, std = _gp_predict(X[solved], y, X[todo])
+                ok = ~np.isnan(log_delta)
+                if best_method == "closest":
+                    acq = _expected_improvement(y.min(), mean, std)
+                else:
+                    # Improvement of the KL, weighted by the probability of
+                    # being within exp_thresh
+                    acq = norm.cdf((np.log(exp_thresh) - mean) / std)
+                    sign = 1.0 if best_method == "min_kl" else -1.0
+                    f = sign * np.array(kl)
+                    feasible = ok & (y <= np.log(exp_thresh))
+                    if feasible.any():
+                        kl_mean, kl_std = _gp_predict(X[solved][ok], f[ok], X[todo])
+                        best = f[feasible].min()
+                        acq = acq * _expected_improvement(best, kl_mean, kl_std)
+                idx = todo[int(np.argmax(acq))]
+
+            res, prob, n = _solve_combination(
+                setup, idx, search_list[idx], self.pca_cache, True, prefix_cache
+            )
+            results[idx] = (res, prob, n)
+            solved.append(idx)
+            if res is None:
+                log_delta.append(np.nan)
+                kl.append(np.nan)
+            else:
+                result = res[1].iloc[-1]
+                log_delta.append(np.log(abs(result["e_r"] - 1.0) + 1e-12))
+                kl.append(result["kl"])
+            logger.debug(f"Solved combination {idx}: log|E(r) - 1| {log_delta[-1]}")
+            bar()
+        unsolved = [i for i in range(len(search_list)) if i not in solved]
+        return results, unsolved
+
     def _process_search_results(
         self,
         dfs,
@@ -10,19 +10,16 @@ import pdb
 import random
 from typing import Callable, List, Optional, Tuple, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from alive_progress import alive_bar
-from matplotlib.patches import Rectangle
 from numpy.linalg import LinAlgError
-from rich.table import Table
-from scipy.stats import multivariate_normal
+from scipy.stats import gaussian_kde, multivariate_normal
 from scipy.stats.distributions import uniform
 
-from pydci import OfflineSequential, OfflineSequentialSearch
+from pydci.consistent_bayes.OfflineSequential import OfflineSequential
+from pydci.consistent_bayes.OfflineSequentialSearch import OfflineSequentialSearch
 from pydci.log import disable_log, enable_log, log_table, logger
+from pydci.plotting import plt, sns
 from pydci.utils import (
     KDEError,
     add_noise,
@@ -195,6 +192,14 @@ class OnlineSequential:
         **solve_args,
     ):
         """
+        Solve Till Threshold
+
+        Search for a solution on data chunk `data_idx` with
+        `OfflineSequentialSearch`, starting with `start_sample_size` samples
+        and, while no combination solves within `exp_thresh`, drawing
+        `samples_inc` more samples from `pi_in`, appended to the model's
+        samples for the chunk (see `DynamicModel.forward_solve()`), up to
+        `max_sample_size` samples. Returns the last search.
         """
         data_idx = data_idx if data_idx != -1 else len(self.model.data) - 1
 
@@ -203,11 +208,12 @@ class OnlineSequential:
                 init, samples = self.model.get_initial_samples(
                     num_samples=ss, **sampling_args
                 )
+            elif isinstance(init, gaussian_kde):
+                samples = init.resample(ss).T
             else:
-                if not isinstance(init, gaussian_kde):
-                    samples = init.rvs((ss, self.model.n_params)).T
-                else:
-                    samples = init.resample(ss).T
+                # Multivariate distributions draw a sample per size
+                size = ss if hasattr(init, "dim") else (ss, self.model.n_params)
+                samples = np.reshape(init.rvs(size=size), (ss, -1))
 
             return init, samples
 
@@ -221,7 +227,7 @@ class OnlineSequential:
         solved = False
         while not solved:
             logger.debug(f"Solving using {sample_size} samples")
-            prob = oss.OfflineSequentialSearch(
+            prob = OfflineSequentialSearch(
                 self.model.samples[data_idx],
                 self.model.data[data_idx],
                 self.model.measurement_noise,
@@ -240,8 +246,8 @@ class OnlineSequential:
                 break
             elif not solved:
                 logger.debug(f"Drawing {samples_inc} more samples.")
-                samples = _get_samples(pi_in, samples_inc)
-                sample_size += samples_ic
+                _, samples = _get_samples(pi_in, samples_inc)
+                sample_size += samples_inc
                 logger.debug(f"Solving forward model for {samples_inc} more samples")
                 self.model.forward_solve(samples, append=True)
 
@@ -826,7 +832,7 @@ class OnlineSequential:
                     solution_found = True
 
                     # Determine if new set of weights is too refined -> Calculate effective sample size
-                    weights.append(prob.state["ratio"].values)
+                    weights.append(prob.state["ratio"])
                     net_weights = np.prod(np.array(weights).T, axis=1)
                     eff_num_samples = len(np.where(net_weights > 1e-10)[0])
                     logger.info(f"Effective sample size: {eff_num_samples}")
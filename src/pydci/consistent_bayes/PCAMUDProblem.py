@@ -8,9 +8,9 @@ in general in terms of how they are to be used:
 
 1. Initialization: Upon initailization the state of the system is set,
 including parameter samples, their values evaluated through the forward model,
-and data/assumptions on observed data. This is used to initailiaze a pandas
-DataFrame `state`, that stores these values and is used for computing and
-storing final solutions
+and data/assumptions on observed data. This is used to initailiaze the
+array backed `state` (see `pydci.state.ProblemState`), that stores these values
+and is used for computing and storing final solutions
 2. Solving: solve() -> Main method called to solve the problem class. Specific
 parameters controlling how the algorithm is solved can be set here. The results
 of the solve are store in the `result` attribute of the class.
@@ -38,30 +38,53 @@ import pdb
 import random
 from typing import Callable, List, Optional, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from alive_progress import alive_bar
 from numpy.linalg import LinAlgError
 from numpy.typing import ArrayLike
-from rich.table import Table
+from scipy.linalg import eigh
 from scipy.stats import rv_continuous  # type: ignore
 from scipy.stats.distributions import norm
-from sklearn.decomposition import PCA  # type: ignore
-from sklearn.preprocessing import StandardScaler  # type: ignore
 
 from pydci.consistent_bayes.MUDProblem import MUDProblem
+from pydci.kde import DEF_MAX_BYTES
 from pydci.log import disable_log, enable_log, log_table, logger
-from pydci.utils import KDEError, closest_factors, fit_domain, get_df, put_df, set_shape
-
-sns.color_palette("bright")
-sns.set_style("darkgrid")
+from pydci.plotting import plt, sns
+from pydci.state import IterationLog
+from pydci.utils import (
+    KDEError,
+    LRUCache,
+    closest_factors,
+    fit_domain,
+    get_df,
+    set_shape,
+)
 
 __author__ = "Carlos del-Castillo-Negrete"
 __copyright__ = "Carlos del-Castillo-Negrete"
 __license__ = "mit"
 
+# Number of q_pca maps, by data mask and number of components, cached per problem
+DEF_PCA_CACHE_SIZE = 64
+
+# Max number of QoI for which the "auto" PCA solver uses the Gram matrix, as the
+# eigenproblems on its blocks grow as the cube of the number of QoI in a mask
+DEF_GRAM_MAX_QOI = 1000
+
+# Solvers for fitting q_pca maps, see PCAMUDProblem.set_pca()
+PCA_METHODS = ["auto", "gram", "full", "randomized", "arpack", "incremental"]
+DEF_PCA_OPTS = {
+    "method": "auto",
+    "dtype": "float64",
+    "oversample": 10,
+    "n_iter": "auto",
+    "seed": 0,
+}
+
+# Fields of the state saved per iteration by PCAMUDProblem.save_state()
+LOG_FIELDS = ["q_pca", "weight", "pi_in", "pi_obs", "pi_pr", "ratio", "pi_up"]
+LOG_FIELDS += ["log_ratio", "log_pi_up"]
+
 
 class PCAMUDProblem(MUDProblem):
     """
@@ -82,6 +105,11 @@ class PCAMUDProblem(MUDProblem):
     Attributes
     ----------
     pca_res : List[pd.DataFrame]
+    it_log : IterationLog
+        States saved per iteration by `save_state()`.
+    pca_cache : LRUCache
+        Cache of `q_pca()` maps. Keyed on the contents of the data and QoI,
+        so it can be shared between problems on the same samples and data.
 
     Methods
     -------
@@ -127,27 +155,290 @@ class PCAMUDProblem(MUDProblem):
             pi_pr=None,
         )
         self.qoi = self.q_lam
-        self.pca_states = None
+        self.it_log = None
+        self.pca_cache = LRUCache(DEF_PCA_CACHE_SIZE)
+        self.pca_opts = dict(DEF_PCA_OPTS)
+        self.pca_stream = None
+        self._data_key = None
+
+    def set_pca(
+        self,
+        method: str = "auto",
+        dtype="float64",
+        oversample: int = 10,
+        n_iter: Union[int, str] = "auto",
+        seed: int = 0,
+    ):
+        """
+        Set PCA Solver
+
+        Sets how the principal components of `q_pca()` maps are computed.
+        Only a few components are kept, so for residuals over many samples
+        and QoI, truncated solvers computing only those are much faster than
+        a full decomposition.
+
+        Parameters
+        ----------
+        method : str, default="auto"
+            One of:
+                - "gram": Eigendecomposition of the block of the Gram matrix of
+                  the residuals over all QoI on the mask. See `q_pca()`.
+                - "full": Exact SVD of the standardized residuals.
+                - "randomized": Randomized truncated SVD (Halko et al.), with
+                  `oversample` extra random vectors and `n_iter` power
+                  iterations.
+                - "arpack": Truncated SVD by Lanczos iterations (ARPACK).
+                  Falls back to "full" if all components are kept.
+                - "auto": "gram" if there are at most `DEF_GRAM_MAX_QOI` QoI
+                  and the Gram matrix fits in `max_bytes`, and sklearn's
+                  choice of solver for the data size otherwise.
+                - "incremental": Incremental SVD of the residuals on masks
+                  running up to the last QoI, updated with only the QoI
+                  added since the last fit, e.g. by `append_qoi()`, keeping
+                  `oversample` extra components. See `_update_stream()`.
+                  Other masks are fit as with "auto".
+        dtype : str or np.dtype, default="float64"
+            Precision of the residuals the SVD based solvers are run on. Using
+            "float32" halves memory and speeds up the decomposition, while
+            the projected `q_pca` values are still computed in float64.
+        oversample : int, default=10
+            Number of extra random vectors of the "randomized" solver, and
+            of extra components kept by the "incremental" solver.
+        n_iter : int or "auto", default="auto"
+            Number of power iterations of the "randomized" solver.
+        seed : int, default=0
+            Seed of the "randomized" solver, and of the start vector of
+            "arpack", so maps are reproducible.
+        """
+        if method not in PCA_METHODS:
+            raise ValueError(f"Unrecognized PCA method {method}: {PCA_METHODS}")
+        self.pca_opts = dict(
+            method=method,
+            dtype=np.dtype(dtype).name,
+            oversample=oversample,
+            n_iter=n_iter,
+            seed=seed,
+        )
+        self.pca_stream = None
 
     def q_pca(self, mask=None, max_nc=None):
         """
         Build QoI Map Using Data and Measurements
 
         Aggregate q_lam data with observed data for MUD convergence.
-        TODO: Cache the results of this for when it is repeatedly computed.
+
+        Maps are cached in `pca_cache`, keyed by the data mask, number of
+        components, and a digest of the data, QoI and noise level, so masks
+        already seen, e.g. across the iterations of sequential solves, are
+        not refit. Cached arrays are read only.
+
+        By default, new masks are fit from the Gram matrix of the standardized
+        residuals over all QoI, computed once (see `_residual_moments()`), so
+        the PCA of a mask is an eigenproblem on a block of it, a view for
+        contiguous masks, with no pass over the samples. For many QoI,
+        truncated (randomized or Lanczos) SVD solvers can be set instead with
+        `set_pca()`.
         """
         mask = np.arange(self.n_qoi) if mask is None else mask
-        residuals = np.subtract(self.data[mask].T, self.qoi[:, mask]) / self.std_dev
         max_nc = self.n_params if max_nc is None else max_nc
-        min_shape = min(residuals.shape)
-        max_nc = max_nc if max_nc < min_shape else min_shape
+        max_nc = min(max_nc, self.n_samples, len(np.arange(self.n_qoi)[mask]))
+        fit = None
+        if self.pca_opts["method"] == "incremental":
+            fit = self._stream_pca(mask, max_nc)
+        if fit is None:
+            opts = tuple(sorted(self.pca_opts.items()))
+            key = (self._get_data_key(), np.asarray(mask).tobytes(), max_nc, opts)
+            fit = self.pca_cache.get(key, lambda: self._fit_pca(mask, max_nc))
+        self.pca, self.q_lam = fit
+        self.state["q_pca"] = self.q_lam
+
+    def _stream_pca(self, mask, max_nc):
+        """
+        `q_pca()` map from the incremental SVD in `pca_stream`, for masks
+        that are a range of QoI running up to the last one. The SVD is
+        extended with the QoI added since it was last updated, and restarted
+        if the mask starts elsewhere or more components are needed. None for
+        other masks.
+        """
+        idx = np.arange(self.n_qoi)[mask]
+        if len(idx) == 0 or idx[-1] != self.n_qoi - 1 or np.any(np.diff(idx) != 1):
+            return None
+        stream = self.pca_stream
+        if stream is None or stream["start"] != idx[0] or stream["rank"] < max_nc:
+            rank = min(max_nc + self.pca_opts["oversample"], self.n_samples)
+            logger.debug(f"Starting incremental PCA at QoI {idx[0]}, rank {rank}")
+            stream = self.pca_stream = {
+                "start": idx[0],
+                "stop": idx[0],
+                "rank": rank,
+                "U": np.zeros((self.n_samples, 0)),
+                "S": np.zeros(0),
+                "vecs": np.zeros((0, 0)),
+                "proj": np.zeros((self.n_samples, 0)),
+            }
+        if stream["stop"] < self.n_qoi:
+            self._update_stream(stream, self.n_qoi)
+
+        U, S = stream["U"][:, :max_nc], stream["S"][:max_nc]
+        pca_res = {
+            "X_train": U * S,
+            "vecs": stream["vecs"][:max_nc],
+            "var": S**2 / (self.n_samples - 1),
+        }
+        logger.debug(f"PCA Variance: {pca_res['var']}")
+        q_lam = stream["proj"][:, :max_nc]
+        for val in [q_lam, *pca_res.values()]:
+            val.flags.writeable = False
+        return pca_res, q_lam
+
+    def _update_stream(self, stream, stop):
+        """
+        Extend the incremental SVD `stream` with QoI `stream["stop"]` to
+        `stop`
+
+        With the standardized residuals so far `Z ~ U S V^T` and those of the
+        new QoI `C`, splitting `C = U P + Q K` into its projection onto `U`
+        and a QR factorization of the remainder gives
+
+            [Z, C] ~ [U, Q] [[S, P], [0, K]] [[V, 0], [0, I]]^T
+
+        so the SVD of `[Z, C]` follows from that of the small middle matrix,
+        truncated to `stream["rank"]` components. Likewise the projections of
+        the raw residuals follow from the previous ones and those of the new
+        QoI. The cost is linear in the number of samples and new QoI, and
+        only the components themselves, of one row per component, grow with
+        the QoI so far. Exact while the residuals have at most `rank`
+        components.
+        """
+        lo = stream["stop"]
+        residuals = np.subtract(self.data[lo:stop].T, self.qoi[:, lo:stop])
+        residuals /= self.std_dev
+        scale = residuals.std(axis=0)
+        scale[scale == 0] = 1.0
+        Z = (residuals - residuals.mean(axis=0)) / scale
+
+        k = len(stream["S"])
+        P = stream["U"].T @ Z
+        Q, K = np.linalg.qr(Z - stream["U"] @ P)
+        M = np.block([[np.diag(stream["S"]), P], [np.zeros((len(K), k)), K]])
+        Um, S, Vt = np.linalg.svd(M, full_matrices=False)
+        r = min(stream["rank"], len(S))
+        U = np.hstack([stream["U"], Q]) @ Um[:, :r]
+        W = Vt[:r].T
+        vecs = np.hstack([W[:k].T @ stream["vecs"], W[k:].T])
+        proj = stream["proj"] @ W[:k] + residuals @ W[k:]
+
+        # Same signs as sklearn: largest entry of each component positive
+        sign = np.sign(vecs[np.arange(r), np.argmax(np.abs(vecs), axis=1)])
+        stream.update(
+            U=U * sign,
+            S=S[:r],
+            vecs=vecs * sign[:, None],
+            proj=proj * sign,
+            stop=stop,
+        )
+
+    def _get_data_key(self):
+        """
+        Digest of the data, raw QoI and noise level, the inputs of the
+        `q_pca()` maps, used to key cached maps.
+        """
+        if self._data_key is None:
+            self._data_key = LRUCache.hash(self.data, self.qoi, self.std_dev)
+        return self._data_key
+
+    def _residual_moments(self):
+        """
+        Moments of the residuals over all QoI for fitting `q_pca()` maps
+
+        Column means and standard deviations (as used by sklearn's
+        `StandardScaler`) of the residuals between the data and QoI, and the
+        Gram matrix `Z^T Z` of the standardized residuals `Z`, cached in
+        `pca_cache`. Standardizing is per QoI, so the Gram matrix of the
+        residuals of any mask is the block of this one on the mask. None if
+        the Gram matrix would take more than `max_bytes`.
+        """
+        max_bytes = DEF_MAX_BYTES if self.max_bytes is None else self.max_bytes
+        if 8 * self.n_qoi**2 > max_bytes:
+            return None
+
+        def _moments():
+            residuals = np.subtract(self.data.T, self.qoi) / self.std_dev
+            mean = residuals.mean(axis=0)
+            scale = residuals.std(axis=0)
+            scale[scale == 0] = 1.0
+            Z = (residuals - mean) / scale
+            moments = {"mean": mean, "scale": scale, "gram": Z.T @ Z}
+            for val in moments.values():
+                val.flags.writeable = False
+            return moments
+
+        return self.pca_cache.get((self._get_data_key(), "moments"), _moments)
+
+    def _fit_pca(self, mask, max_nc):
+        """
+        Fit the `q_pca()` map for data `mask` with `max_nc` components, with
+        the solver set by `set_pca()`.
+        """
+        method = self.pca_opts["method"]
+        method = "auto" if method == "incremental" else method
+        gram = method == "gram" or (method == "auto" and self.n_qoi <= DEF_GRAM_MAX_QOI)
+        moments = self._residual_moments() if gram else None
+        if moments is None and method == "gram":
+            logger.debug("Gram matrix exceeds max_bytes. Using full PCA.")
+            method = "full"
+        if moments is not None:
+            idx = np.arange(self.n_qoi)[mask]
+            if np.all(np.diff(idx) == 1):
+                block = slice(idx[0], idx[-1] + 1)
+                gram = moments["gram"][block, block]
+            else:
+                block = idx
+                gram = moments["gram"][np.ix_(idx, idx)]
+            m = len(idx)
+            evals, evecs = eigh(gram, subset_by_index=[m - max_nc, m - 1])
+            evals, vecs = evals[::-1], evecs[:, ::-1].T
+
+            # Same signs as sklearn: largest entry of each component positive
+            big = np.argmax(np.abs(vecs), axis=1)
+            vecs *= np.sign(vecs[np.arange(max_nc), big])[:, None]
+
+            # Project residuals, and standardized residuals, in one product
+            mean, scale = moments["mean"][block], moments["scale"][block]
+            proj = np.hstack([vecs.T, (vecs / scale).T])
+            res_proj = (self.data[block].T @ proj - self.qoi[:, block] @ proj)
+            res_proj /= self.std_dev
+            q_lam = res_proj[:, :max_nc]
+            pca_res = {
+                "X_train": res_proj[:, max_nc:] - (mean / scale) @ vecs.T,
+                "vecs": vecs,
+                "var": evals / (self.n_samples - 1),
+            }
+            logger.debug(f"PCA Variance: {pca_res['var']}")
+            for val in [q_lam, *pca_res.values()]:
+                val.flags.writeable = False
+            return pca_res, q_lam
+
+        residuals = np.subtract(self.data[mask].T, self.qoi[:, mask]) / self.std_dev
 
         # Standarize and perform linear PCA
-        logger.debug(f"Computing PCA using {max_nc} components")
+        from sklearn.decomposition import PCA  # type: ignore
+        from sklearn.preprocessing import StandardScaler  # type: ignore
+
+        if method == "arpack" and max_nc >= min(residuals.shape):
+            method = "full"
+        logger.debug(f"Computing PCA using {max_nc} components ({method})")
         sc = StandardScaler()
-        pca = PCA(n_components=max_nc)
-        X_train = pca.fit_transform(sc.fit_transform(residuals))
-        self.pca = {
+        pca = PCA(
+            n_components=max_nc,
+            svd_solver=method,
+            n_oversamples=self.pca_opts["oversample"],
+            iterated_power=self.pca_opts["n_iter"],
+            random_state=self.pca_opts["seed"],
+        )
+        Z = sc.fit_transform(residuals).astype(self.pca_opts["dtype"], copy=False)
+        X_train = pca.fit_transform(Z)
+        pca_res = {
             "X_train": X_train,
             "vecs": pca.components_,
             "var": pca.explained_variance_,
@@ -155,29 +446,94 @@ class PCAMUDProblem(MUDProblem):
         logger.debug(f"PCA Variance: {pca.explained_variance_}")
 
         # Compute Q_PCA
-        self.q_lam = residuals @ pca.components_.T
-        self.state = put_df(self.state, "q_pca", self.q_lam, size=max_nc)
+        q_lam = residuals @ pca.components_.T.astype(float)
+        for val in [q_lam, *pca_res.values()]:
+            val.flags.writeable = False
+        return pca_res, q_lam
+
+    def _copy_members(self, members):
+        """
+        Extends the parent method by copying the iteration log `it_log`, and
+        the incremental PCA state `pca_stream`, which are updated in place.
+        """
+        copies = super()._copy_members(members)
+        log, stream = members["it_log"], members["pca_stream"]
+        copies["it_log"] = None if log is None else log.copy()
+        copies["pca_stream"] = None if stream is None else dict(stream)
+        return copies
+
+    def append_samples(self, samples, weights=None):
+        """
+        Extends the parent method by appending the push-forward values of
+        the new samples to the raw QoI `qoi`, from which the `q_pca()` map is
+        recomputed on the next solve.
+        """
+        self.q_lam = self.qoi
+        super().append_samples(samples, weights=weights)
+        self.qoi = self.q_lam
+        self.pca_stream = None
+        self.it_log = None
+        self._data_key = None
+
+    def append_qoi(self, qoi, data):
+        """
+        Append QoI
+
+        Adds QoI, e.g. measurements at new time steps, for the same samples,
+        and their observed data. With the "incremental" PCA solver (see
+        `set_pca()`) the next `q_pca()` map on a mask running up to the last
+        QoI updates the SVD of the previous one with the new QoI only.
+        Densities depending on the QoI are reset, and the problem must be
+        solved again.
+
+        Parameters
+        ----------
+        qoi : ArrayLike
+            Values of the new QoI for each sample, of shape
+            `(n_samples, n_new)`.
+        data : ArrayLike
+            Observed data for the new QoI, of length `n_new`.
+        """
+        qoi = set_shape(np.array(qoi, dtype=float), (-1, 1))
+        data = set_shape(np.array(data, dtype=float), (-1, 1))
+        if qoi.shape != (self.n_samples, len(data)):
+            raise ValueError(
+                f"qoi must be of shape {(self.n_samples, len(data))}: {qoi.shape}"
+            )
+        self.qoi = np.hstack([self.qoi, qoi])
+        self.q_lam = self.qoi
+        self.data = np.vstack([self.data, data])
+        self.state["q_lam"] = self.qoi
+        self.dists["pi_obs"] = norm(loc=np.mean(self.data), scale=self.std_dev)
+        for d in ["pi_pr", "pi_up", "pi_pf"]:
+            self.dists[d] = None
+        self.result = None
+        self._data_key = None
 
     def save_state(self, vals):
         """
-        Save current state, adding columns with values in vals dictionary
-        """
-        keys = vals.keys()
-        cols = [c for c in self.state.columns if c.startswith("lam_")]
-        cols += [c for c in self.state.columns if c.startswith("q_pca_")]
-        cols += ["weight", "pi_in", "pi_obs", "pi_pr", "ratio", "pi_up"]
-        state = self.state[cols].copy()
-        for key in keys:
-            state[key] = vals[key]
-        if self.pca_states is None:
-            self.pca_states = state
-        else:
-            self.pca_states = pd.concat([self.pca_states, state], axis=0)
+        Save current state to the iteration log `it_log`, with the per
+        iteration values in vals dictionary. The samples are logged once, and
+        the `LOG_FIELDS` of the state per iteration.
+        """
+        if self.it_log is None:
+            self.it_log = IterationLog(self.n_samples, {"lam": self.lam})
+        self.it_log.append({f: self.state[f] for f in LOG_FIELDS}, vals)
+
+    @property
+    def pca_states(self):
+        """
+        States saved by `save_state()` as a DataFrame, one row per sample and
+        iteration. Built from `it_log` on request.
+        """
+        return None if self.it_log is None else self.it_log.to_frame()
 
     def solve(
         self,
         pca_mask: List[int] = None,
         pca_components: List[int] = [0],
+        linear: Union[bool, str] = False,
+        refine: bool = False,
     ):
         """
         Solve the parameter estimation problem
@@ -198,6 +554,12 @@ class PCAMUDProblem(MUDProblem):
             the PCA transformation on the residuals between the observed and
             simulated data. If not specified, defaults to the min of the number
             of states and the number of parameters.
+        linear: bool or "auto", default=False
+            Solve in closed form using a linear fit of the `q_pca()` map. See
+            `MUDProblem.solve()`.
+        refine: bool, default=False
+            Refine the MUD point between samples. See
+            `MUDProblem.refine_mud_point()`.
         """
         pca_components = (
             [pca_components] if isinstance(pca_components, int) else pca_components
@@ -208,7 +570,7 @@ class PCAMUDProblem(MUDProblem):
         self.dists["pi_obs"] = norm(loc=len(pca_components) * [0], scale=1)
         self.dists["pi_pr"] = None
         try:
-            super().solve()
+            super().solve(linear=linear, refine=refine)
         except ZeroDivisionError as z:
             logger.exception(
                 f"({pca_mask}: {pca_components}): "
@@ -264,7 +626,7 @@ class PCAMUDProblem(MUDProblem):
                     "Cannot specify both pca_mask and non-integer pca_splits"
                 )
         iterations = [(i, j) for i in pca_splits for j in pca_components]
-        prev_in = self.dists["pi_in"]
+        ckpt = None
         if len(iterations) == 0:
             raise ValueError(f"No iterations specified: {pca_splits}, {pca_mask}")
         for i, (pca_mask, pca_cs) in enumerate(iterations):
@@ -312,14 +674,8 @@ class PCAMUDProblem(MUDProblem):
                     failed = True
 
             if failed:
-                logger.info(f"Resetting to last solution at {iterations[i-1]}")
-                self.set_weights(weights[:-1])
-                self.dists["pi_in"] = prev_in
-                logger.debug(f"dists: {self.dists}")
-                self.solve(
-                    pca_mask=iterations[i - 1][0],
-                    pca_components=iterations[i - 1][1],
-                )
+                logger.info(f"Restoring last solution at {iterations[i-1]}")
+                self.restore(ckpt)
                 break
             else:
                 state_vals = {
@@ -332,10 +688,10 @@ class PCAMUDProblem(MUDProblem):
                 self.save_state(state_vals)
                 it_results.append(self.result.copy())
                 it_results[-1]["i"] = len(it_results) - 1
+                ckpt = self.checkpoint()
                 if i != len(iterations) - 1:
                     logger.info("Updating weights")
-                    weights.append(self.state["ratio"].values)
-                    prev_in = self.dists["pi_in"]
+                    weights.append(self.state["ratio"])
 
         self.it_results = pd.concat(it_results)
         self.result = self.it_results.iloc[[-1]]
@@ -447,7 +803,7 @@ class PCAMUDProblem(MUDProblem):
             plotted and (2) List of labels that were plotted, in order plotted.
         """
         if df is None:
-            df = self.state
+            df = self.state.to_frame()
 
         ax, labels = super().plot_D(
             df=df,
@@ -226,8 +226,8 @@ def plot_iterations(prob, max_plot=10, plot_idxs=None, lam_true=None):
             plot_idxs = range(0, num_its)
 
     label = f"$\pi^{{in}}_{0}$"
-    sns.kdeplot(prob.state, x="lam_0", ax=ax[0], label=label)
-    sns.kdeplot(prob.state, x="lam_1", ax=ax[1], label=label)
+    sns.kdeplot(prob.state.to_frame(), x="lam_0", ax=ax[0], label=label)
+    sns.kdeplot(prob.state.to_frame(), x="lam_1", ax=ax[1], label=label)
     for idx, state in prob.pca_states.groupby("iteration"):
         if idx in plot_idxs:
             label = f"$\pi^{{up}}_{{{idx}}}$"
@@ -281,9 +281,7 @@ def process_result(prob, lam_true, times):
     covs = []
     res["l2_err"] = l2_errs
 
-    mud_states = get_df(
-        prob.state.iloc[prob.it_results["MUD_idx"].values], "q_lam", prob.n_qoi
-    )
+    mud_states = get_df(prob.state, "q_lam", prob.n_qoi)[prob.it_results["MUD_idx"]]
     res["state_err"] = np.linalg.norm((mud_states.T - prob.data).T, axis=1)
 
     res["ts"] = [times[int(x.split(",")[-1][1:-1])] for x in res["pca_mask"].values]
@@ -0,0 +1,1157 @@
+"""
+pyDCI Kernel Density Estimation Backends
+
+Every density pyDCI estimates from samples (`pi_in`, `pi_pr`, `pi_up` and
+`pi_pf` in :class:`pydci.DCIProblem`) is built through :func:`pydci.utils.gkde`,
+which looks up the engine to use in the registry of KDE backends defined here.
+By default scipy's `gaussian_kde` is used. Faster engines can be selected
+globally with :func:`set_default_kde`, or per problem with
+`DCIProblem.set_kde()`.
+
+Backend Contract
+----------------
+A KDE backend is a class constructed as `Backend(dataset, weights=None,
+**kwargs)`, with `dataset` of shape `(n_dims, n_samples)`, that exposes:
+
+    - `pdf(points)`: Density at `points` of shape `(n_dims, n_points)`.
+    - `logpdf(points)`: Log of the density at `points`. Should stay finite
+      (and accurate) where `pdf()` underflows to zero, far in the tails.
+    - `resample(size, seed=None)`: Draws of shape `(n_dims, size)`.
+    - `d`, `n`, `weights`, `covariance`: As in `scipy.stats.gaussian_kde`.
+
+Backends may also support adding samples in place with `append(points,
+weights=None)`, as the backends shipped with pyDCI do.
+
+The density value at a point must not depend on the other points passed in
+the same `pdf()` call, so that evaluations can be split in blocks, or across
+threads (see :func:`evaluate_blocks`), with reproducible results.
+
+The backends shipped with pyDCI subclass `scipy.stats.gaussian_kde`, so they
+keep its bandwidth selection and covariance semantics (and its error messages
+for degenerate data), and only replace how the density is evaluated.
+"""
+import copy
+import hashlib
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Union
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+from scipy.linalg import solve_triangular
+from scipy.spatial import cKDTree
+from scipy.stats import gaussian_kde
+
+from pydci.log import logger
+
+__author__ = "Carlos del-Castillo-Negrete"
+__copyright__ = "Carlos del-Castillo-Negrete"
+__license__ = "mit"
+
+KDE_BACKENDS: Dict[str, Callable] = {}
+DEF_KDE = {"method": "scipy"}
+
+# Default memory budget, in bytes, for intermediates of density evaluations
+DEF_MAX_BYTES = 2**27
+
+# Bytes of intermediates per (evaluation point, kernel center) pair
+PAIR_BYTES = 24
+
+# Default memory budget, in bytes, of the kernel matrix cache
+DEF_CACHE_BYTES = 2**30
+
+# Default number of grid points per dimension for binned KDEs, by dimension
+DEF_GRID_SIZE = {1: 4096, 2: 512, 3: 128}
+
+# Number of kernel standard deviations to extend grids/kernels by
+DEF_CUT = 4.0
+
+# Default relative error tolerance for tree based KDEs
+DEF_RTOL = 1e-4
+
+# Number of nearest neighbors used to bound kernel sums in tree based KDEs
+DEF_TREE_K = 32
+
+# Density, relative to the peak, below which binned KDEs evaluate log
+# densities exactly, as interpolation loses relative accuracy in the tails
+DEF_LOG_TAIL = 1e-8
+
+
+def register_kde(name: str, backend: Callable = None):
+    """
+    Register a KDE backend
+
+    Adds `backend` to the registry of KDE engines under `name`. Can be used as
+    a function, `register_kde("scipy", gaussian_kde)`, or as a class
+    decorator, `@register_kde("direct")`.
+
+    Parameters
+    ----------
+    name : str
+        Name to register the backend under. Overwrites existing backends.
+    backend : Callable, optional
+        Class following the backend contract (see module docstring). If not
+        specified, a decorator registering the decorated class is returned.
+    """
+
+    def _register(cls):
+        KDE_BACKENDS[name] = cls
+        return cls
+
+    return _register if backend is None else _register(backend)
+
+
+def get_kde(method: Union[str, Callable] = None) -> Callable:
+    """
+    Get KDE backend
+
+    Parameters
+    ----------
+    method : Union[str, Callable], optional
+        Name of a registered backend, or a backend class itself. If not
+        specified the global default set by `set_default_kde()` is returned.
+
+    Returns
+    -------
+    backend : Callable
+        KDE backend class.
+    """
+    method = DEF_KDE["method"] if method is None else method
+    if callable(method):
+        return method
+    if method not in KDE_BACKENDS:
+        raise ValueError(
+            f"Unrecognized KDE method {method}. Allowed: {list_kdes()}"
+        )
+    return KDE_BACKENDS[method]
+
+
+def list_kdes() -> List[str]:
+    """
+    Names of registered KDE backends
+    """
+    return list(KDE_BACKENDS.keys())
+
+
+def set_default_kde(method: str = "scipy"):
+    """
+    Set the KDE backend used by default for all problems.
+
+    Parameters
+    ----------
+    method : str, default='scipy'
+        Name of a registered KDE backend.
+    """
+    _ = get_kde(method)
+    DEF_KDE["method"] = method
+
+
+def get_block_size(n: int, max_bytes: int = None) -> int:
+    """
+    Block size for memory bounded density evaluations
+
+    Number of evaluation points to process at once against `n` kernel centers
+    so that the intermediates, of `PAIR_BYTES` per pair, fit in `max_bytes`.
+
+    Parameters
+    ----------
+    n : int
+        Number of kernel centers (samples) of the density.
+    max_bytes : int, optional
+        Memory budget in bytes. Defaults to `DEF_MAX_BYTES`.
+
+    Returns
+    -------
+    block_size : int
+        Number of points to evaluate at once. At least one.
+
+    Examples
+    --------
+    >>> get_block_size(1000, max_bytes=240000)
+    10
+    """
+    max_bytes = DEF_MAX_BYTES if max_bytes is None else max_bytes
+    return max(1, int(max_bytes // (PAIR_BYTES * max(n, 1))))
+
+
+def get_n_jobs(n_jobs: int = 1) -> int:
+    """
+    Number of workers to use. Negative values count back from the number of
+    CPUs, so -1 uses all of them.
+    """
+    n_jobs = 1 if n_jobs is None else n_jobs
+    if n_jobs < 0:
+        n_jobs = max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def evaluate_blocks(
+    func: Callable,
+    values: np.ndarray,
+    block_size: int,
+    n_jobs: int = 1,
+    executor: Executor = None,
+) -> np.ndarray:
+    """
+    Evaluate a function over blocks of points
+
+    Splits `values` into blocks of at most `block_size` rows (and at least
+    as many blocks as workers), evaluates `func` on each, and concatenates
+    the results in order. Blocks can be evaluated across a pool of threads,
+    which is effective as NumPy releases the GIL in its kernels. For the
+    densities in pyDCI the value at each point does not depend on the block
+    it is evaluated in, so results are identical for any number of workers.
+
+    Parameters
+    ----------
+    func : Callable
+        Function of an array of rows of `values`, returning one value per row.
+    values : np.ndarray
+        Points to evaluate, of shape `(n_points, ...)`.
+    block_size : int
+        Max number of points per block. See `get_block_size()`.
+    n_jobs : int, default=1
+        Number of threads to use. See `get_n_jobs()`.
+    executor : concurrent.futures.Executor, optional
+        Executor to submit blocks to, instead of creating a thread pool.
+
+    Returns
+    -------
+    res : np.ndarray
+        Concatenated results of `func` over all blocks.
+    """
+    n_jobs = get_n_jobs(n_jobs)
+    n_blocks = max(int(np.ceil(len(values) / block_size)), n_jobs, 1)
+    bounds = np.linspace(0, len(values), n_blocks + 1).astype(int)
+    blocks = [values[i:j] for i, j in zip(bounds[:-1], bounds[1:]) if j > i]
+    if len(blocks) == 1:
+        return func(blocks[0])
+    if executor is not None:
+        return np.concatenate(list(executor.map(func, blocks)))
+    if n_jobs == 1:
+        return np.concatenate([func(b) for b in blocks])
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        return np.concatenate(list(pool.map(func, blocks)))
+
+
+def get_rng(seed=None):
+    """
+    Random number generator to draw with
+
+    Generators and RandomStates are used as is, and other seeds are passed
+    to `np.random.default_rng()`. If `seed` is None, NumPy's global random
+    state is used, so that draws are reproducible with `utils.set_seed()`.
+    """
+    if seed is None:
+        return np.random
+    if isinstance(seed, (np.random.Generator, np.random.RandomState)):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def weighted_resample(
+    dataset: np.ndarray,
+    weights: np.ndarray = None,
+    covariance: np.ndarray = None,
+    size: int = 1,
+    seed=None,
+    method: str = "systematic",
+) -> np.ndarray:
+    """
+    Draw samples from a weighted Gaussian mixture
+
+    Draws from the mixture of Gaussian kernels with covariance `covariance`
+    centered at the samples in `dataset`, with mixture weights `weights`, as
+    done by `gaussian_kde.resample()`. Kernels are selected by resampling
+    the weights, and a Gaussian jitter, with the Cholesky factor of the
+    kernel covariance, is added to the selected samples. Both steps are
+    vectorized, and need no fitted KDE.
+
+    Parameters
+    ----------
+    dataset : np.ndarray
+        Kernel centers (samples), of shape `(n_dims, n_samples)`.
+    weights : np.ndarray, optional
+        Mixture weights of each sample. Uniform if not specified.
+    covariance : np.ndarray, optional
+        Kernel covariance, of shape `(n_dims, n_dims)`. If not specified,
+        samples are resampled without jitter.
+    size : int, default=1
+        Number of samples to draw.
+    seed : optional
+        Seed or random generator. See `get_rng()`.
+    method : str, default='systematic'
+        How to select kernels: 'systematic' resampling, which uses a single
+        uniform draw, costs O(n + size), and has lower variance in how many
+        draws each kernel gets, or i.i.d. 'multinomial' resampling by binary
+        search on the cumulative weights.
+
+    Returns
+    -------
+    draws : np.ndarray
+        Samples of shape `(n_dims, size)`.
+    """
+    am = ["systematic", "multinomial"]
+    if method not in am:
+        raise ValueError(f"Unrecognized resampling method {method}. Allowed: {am}")
+    rng = get_rng(seed)
+    dataset = np.atleast_2d(dataset)
+    d, n = dataset.shape
+    cum_w = np.arange(1, n + 1) / n if weights is None else np.cumsum(weights)
+    cum_w = cum_w / cum_w[-1]
+    if method == "systematic":
+        # Number of the evenly spaced points (u + k) / size below each cum_w
+        below = np.ceil(cum_w * size - rng.random())
+        below = np.clip(below, 0, size).astype(int)
+        below[-1] = size
+        idx = np.repeat(np.arange(n), np.diff(below, prepend=0))
+        idx = rng.permutation(idx)
+    else:
+        idx = np.searchsorted(cum_w, rng.random(size), side="right")
+        idx = np.minimum(idx, n - 1)
+    draws = dataset[:, idx]
+    if covariance is not None:
+        chol = np.linalg.cholesky(np.atleast_2d(covariance))
+        draws = draws + chol @ rng.standard_normal((d, size))
+    return draws
+
+
+def kernel_means(kde: gaussian_kde, points: np.ndarray, max_bytes: int = None):
+    """
+    Kernel weighted means of the samples of a Gaussian KDE
+
+    Mean of the kernel centers (samples) of `kde` weighted by their kernel
+    values at each of `points`, `m(x) = sum_i w_i K(x - x_i) x_i / p(x)`.
+    For a kernel covariance `H`, `H^-1 (m(x) - x)` is the gradient of the
+    log density at `x` (see `kde_log_grad()`), and moving `x` to `m(x)` a
+    mean-shift step uphill. All points are handled together, with the kernel
+    values at them computed for blocks of kernel centers at a time, in log
+    space so that points far in the tails are handled as well.
+
+    Parameters
+    ----------
+    kde : gaussian_kde
+        KDE, or backend following the contract of this module.
+    points : np.ndarray
+        Points of shape `(n_dims, n_points)`.
+    max_bytes : int, optional
+        Memory budget for intermediates. See `get_block_size()`.
+
+    Returns
+    -------
+    means : np.ndarray
+        Kernel weighted means, of shape `(n_dims, n_points)`.
+    """
+    chol = np.linalg.cholesky(np.atleast_2d(kde.covariance))
+    centers = solve_triangular(chol, kde.dataset, lower=True)
+    sq_centers = np.sum(centers**2, axis=0)
+    with np.errstate(divide="ignore"):
+        log_w = np.log(kde.weights)
+    z = solve_triangular(chol, np.reshape(points, (kde.d, -1)), lower=True)
+    sq_z = np.sum(z**2, axis=0)[:, None]
+    block = get_block_size(z.shape[1], max_bytes)
+
+    # Running sums, rescaled as the largest log kernel value seen grows
+    num = np.zeros_like(z)
+    den = np.zeros(z.shape[1])
+    log_max = np.full(z.shape[1], -np.inf)
+    for i in range(0, kde.n, block):
+        c = centers[:, i : i + block]
+        sq_dists = np.maximum(sq_z + sq_centers[i : i + block] - 2 * z.T @ c, 0)
+        log_k = log_w[i : i + block] - 0.5 * sq_dists
+        log_max, prev = np.maximum(log_max, log_k.max(axis=1)), log_max
+        shift = np.where(np.isfinite(log_max), log_max, 0.0)
+        k = np.exp(log_k - shift[:, None])
+        scale = np.exp(prev - shift)
+        num = num * scale + c @ k.T
+        den = den * scale + np.sum(k, axis=1)
+    return chol @ (num / den)
+
+
+def kde_log_grad(kde: gaussian_kde, points: np.ndarray, max_bytes: int = None):
+    """
+    Gradient of the log density of a Gaussian KDE
+
+    Computed from the kernel weighted means of the samples, see
+    `kernel_means()`, for all `points`, of shape `(n_dims, n_points)`, at
+    once. Returns an array of the same shape.
+    """
+    points = np.reshape(points, (kde.d, -1))
+    means = kernel_means(kde, points, max_bytes=max_bytes)
+    return np.linalg.solve(np.atleast_2d(kde.covariance), means - points)
+
+
+class KernelCache:
+    """
+    Kernel Matrix Cache
+
+    Least recently used cache of pairwise kernel matrices over point sets,
+    keyed on the points and the kernel covariance (bandwidth), so densities
+    over the same samples with the same bandwidth, but different weights,
+    share their kernel evaluations. Entries are evicted, least recently used
+    first, to keep the cache under `max_bytes`.
+
+    Attributes
+    ----------
+    max_bytes : int
+        Memory budget of the cache in bytes.
+    hits : int
+        Number of lookups served from the cache.
+    misses : int
+        Number of lookups that computed a new entry.
+    """
+
+    def __init__(self, max_bytes: int = DEF_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by cached entries, in bytes.
+        """
+        return sum(v.nbytes for v in self._cache.values())
+
+    @staticmethod
+    def key(points: np.ndarray, covariance: np.ndarray) -> tuple:
+        """
+        Cache key of a point set and kernel covariance.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(np.ascontiguousarray(points, dtype=float).tobytes())
+        h.update(np.ascontiguousarray(covariance, dtype=float).tobytes())
+        return (np.shape(points), h.hexdigest())
+
+    def get(self, key: tuple, compute: Callable) -> np.ndarray:
+        """
+        Get entry `key`, calling `compute()` to create it if not cached.
+        """
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        val = compute()
+        with self._lock:
+            self.misses += 1
+            if val.nbytes <= self.max_bytes:
+                self._cache[key] = val
+                while self.nbytes > self.max_bytes:
+                    self._cache.popitem(last=False)
+        return val
+
+    def clear(self):
+        """
+        Remove all entries and reset statistics.
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+KERNEL_CACHE = KernelCache()
+
+
+register_kde("scipy", gaussian_kde)
+
+
+@register_kde("direct")
+class DirectKDE(gaussian_kde):
+    """
+    Direct Gaussian KDE evaluated with vectorized NumPy kernels
+
+    Same estimator as `scipy.stats.gaussian_kde`, but the density is evaluated
+    by whitening the samples once with the Cholesky factor of the kernel
+    covariance, and computing kernel sums over blocks of evaluation points
+    with vectorized NumPy operations. The memory used by intermediates is
+    kept under `max_bytes`, and the value at each point does not depend on
+    how points are blocked, so results are reproducible.
+
+    Parameters
+    ----------
+    dataset : ArrayLike
+        Samples to estimate density from, of shape `(n_dims, n_samples)`.
+    bw_method : optional
+        Bandwidth selection method. See `scipy.stats.gaussian_kde`.
+    weights : ArrayLike, optional
+        Weights of each sample.
+    max_bytes : int, default=DEF_MAX_BYTES
+        Memory budget, in bytes, for intermediates when evaluating.
+    """
+
+    def __init__(self, dataset, bw_method=None, weights=None, max_bytes=None):
+        self.max_bytes = max_bytes
+        super().__init__(dataset, bw_method=bw_method, weights=weights)
+        self._wsum = float(self.n if weights is None else np.sum(weights))
+        self._moments = None
+
+    def _compute_covariance(self):
+        """
+        Extends scipy's method by caching the whitened dataset.
+        """
+        super()._compute_covariance()
+        self._chol = np.linalg.cholesky(self.covariance)
+        self._log_norm = 0.5 * self.d * np.log(2 * np.pi) + np.sum(
+            np.log(np.diag(self._chol))
+        )
+        self._white = solve_triangular(self._chol, self.dataset, lower=True)
+
+    def _check_points(self, points):
+        """
+        Reshape points to `(d, m)` as done by `gaussian_kde.evaluate`.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        d, m = points.shape
+        if d != self.d:
+            if d == 1 and m == self.d:
+                points = np.reshape(points, (self.d, 1))
+            else:
+                msg = f"points have dimension {d}, dataset has dimension {self.d}"
+                raise ValueError(msg)
+        return points
+
+    def _sq_dists(self, white_pts):
+        """
+        Squared Mahalanobis distances between whitened points and samples.
+
+        Accumulated one dimension at a time, so each entry is computed the
+        same way no matter how the evaluation points are blocked.
+        """
+        sq = np.zeros((white_pts.shape[1], self.n))
+        diff = np.empty_like(sq)
+        for k in range(self.d):
+            np.subtract(white_pts[k][:, None], self._white[k][None, :], out=diff)
+            sq += np.square(diff, out=diff)
+        return sq
+
+    def _kernel_sums(self, white_pts):
+        """
+        Weighted (unnormalized) kernel sums at whitened points. Row sums are
+        used instead of a matrix-vector product, whose results can vary with
+        the number of rows, so that results are independent of block sizes.
+        """
+        kern = self._sq_dists(white_pts)
+        kern = np.exp(np.multiply(kern, -0.5, out=kern), out=kern)
+        return np.sum(np.multiply(kern, self.weights, out=kern), axis=1)
+
+    def _log_kernel_sums(self, white_pts):
+        """
+        Log of weighted (unnormalized) kernel sums at whitened points. Uses
+        the log-sum-exp trick, shifting each row by its max exponent, so sums
+        at points far from all samples do not underflow.
+        """
+        kern = self._sq_dists(white_pts)
+        np.multiply(kern, -0.5, out=kern)
+        with np.errstate(divide="ignore"):
+            kern += np.log(self.weights)
+        shift = np.max(kern, axis=1)
+        shift[~np.isfinite(shift)] = 0.0
+        kern = np.exp(np.subtract(kern, shift[:, None], out=kern), out=kern)
+        with np.errstate(divide="ignore"):
+            return np.log(np.sum(kern, axis=1)) + shift
+
+    def _eval_blocks(self, points, func):
+        """
+        Evaluate `func` on blocks of whitened points within `max_bytes`.
+        """
+        points = self._check_points(points)
+        white_pts = solve_triangular(self._chol, points, lower=True)
+        m = points.shape[1]
+        res = np.empty(m)
+        block_size = get_block_size(self.n, self.max_bytes)
+        for start in range(0, m, block_size):
+            end = min(start + block_size, m)
+            res[start:end] = func(white_pts[:, start:end])
+        return res
+
+    def _log_approx(self, points, approx, floor=0.0):
+        """
+        Log of approximate densities `approx` at `points`, evaluating the log
+        density exactly where the approximation is not above `floor`.
+        """
+        res = np.empty_like(approx)
+        exact = ~(approx > floor)
+        res[~exact] = np.log(approx[~exact])
+        if exact.any():
+            logger.debug(f"Evaluating {exact.sum()} log densities exactly")
+            res[exact] = DirectKDE.logpdf(self, points[:, exact])
+        return res
+
+    def evaluate(self, points):
+        """
+        Evaluate the estimated pdf on a set of points.
+
+        Parameters
+        ----------
+        points : ArrayLike
+            Points of shape `(n_dims, n_points)`.
+
+        Returns
+        -------
+        values : np.ndarray
+            Density at each point, of shape `(n_points,)`.
+        """
+        res = self._eval_blocks(points, self._kernel_sums)
+        return res * np.exp(-self._log_norm)
+
+    __call__ = evaluate
+
+    def pdf(self, x):
+        """
+        Evaluate the estimated pdf on a provided set of points.
+        """
+        return self.evaluate(x)
+
+    def resample(self, size=None, seed=None, method="systematic"):
+        """
+        Randomly sample a dataset from the estimated pdf.
+
+        Drawn directly from the weighted mixture of kernels with
+        `weighted_resample()`.
+
+        Parameters
+        ----------
+        size : int, optional
+            Number of samples to draw. Defaults to the effective number of
+            samples of the KDE.
+        seed : optional
+            Seed or random generator. See `get_rng()`.
+        method : str, default='systematic'
+            Resampling method. See `weighted_resample()`.
+
+        Returns
+        -------
+        draws : np.ndarray
+            Samples of shape `(n_dims, size)`.
+        """
+        size = int(self.neff) if size is None else size
+        return weighted_resample(
+            self.dataset,
+            self.weights,
+            self.covariance,
+            size=size,
+            seed=seed,
+            method=method,
+        )
+
+    def _get_moments(self):
+        """
+        Weighted mean, scatter matrix, and sum of squared (normalized) weights
+        of the samples. Computed on first call, then updated by `append()`.
+        """
+        if self._moments is None:
+            mean = self.dataset @ self.weights
+            centered = self.dataset - mean[:, None]
+            scatter = (centered * self.weights) @ centered.T
+            self._moments = (mean, scatter, np.sum(self.weights**2))
+        return self._moments
+
+    def append(self, points, weights=None):
+        """
+        Append samples to the density
+
+        Adds kernels centered at `points` to the estimate, in place. The data
+        covariance, and from it the bandwidth, is updated by combining running
+        weighted moments of the samples with those of the new points (a rank
+        `k` update for `k` new points), instead of refitting the KDE on all
+        samples. The result is the same KDE as one fit on all samples.
+
+        Parameters
+        ----------
+        points : ArrayLike
+            New samples, of shape `(n_dims, k)`.
+        weights : ArrayLike, optional
+            Weights of the new samples, on the same scale as the weights the
+            density was built with (one per sample if none were passed).
+
+        Returns
+        -------
+        kde : DirectKDE
+            The KDE itself, with the new samples added.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if points.shape[0] != self.d:
+            raise ValueError(f"points must have {self.d} dimensions: {points.shape}")
+        k = points.shape[1]
+        w = np.ones(k) if weights is None else np.asarray(weights, dtype=float)
+        w = np.atleast_1d(w)
+        if w.ndim != 1 or len(w) != k:
+            raise ValueError(f"`weights` must be a 1D array of size {k}")
+        if not np.isfinite(wsum := np.sum(w)) or wsum <= 0:
+            raise ValueError(f"`weights` must have a positive finite sum: {wsum}")
+
+        # Combine moments of the two sets as a mixture with weights a and b
+        mean, scatter, sq = self._get_moments()
+        a = self._wsum / (self._wsum + wsum)
+        b = 1.0 - a
+        w = w / wsum
+        new_mean = points @ w
+        centered = points - new_mean[:, None]
+        delta = new_mean - mean
+        scatter = a * scatter + b * ((centered * w) @ centered.T)
+        scatter += a * b * np.outer(delta, delta)
+        sq = a**2 * sq + b**2 * np.sum(w**2)
+        self._moments = (a * mean + b * new_mean, scatter, sq)
+
+        self.dataset = np.hstack([self.dataset, points])
+        self.n = self.dataset.shape[1]
+        self._weights = np.concatenate([a * self.weights, b * w])
+        self._neff = 1.0 / sq
+        self._wsum += wsum
+        self._data_covariance = np.atleast_2d(scatter / (1.0 - sq))
+        self._data_cho_cov = np.linalg.cholesky(self._data_covariance)
+        self._compute_covariance()
+        return self
+
+    def logpdf(self, x):
+        """
+        Evaluate the log of the estimated pdf on a provided set of points.
+
+        Computed in log space, so it is finite (and accurate) far in the
+        tails of the density, where `pdf()` underflows to zero.
+
+        Parameters
+        ----------
+        x : ArrayLike
+            Points of shape `(n_dims, n_points)`.
+
+        Returns
+        -------
+        values : np.ndarray
+            Log density at each point, of shape `(n_points,)`.
+        """
+        return self._eval_blocks(x, self._log_kernel_sums) - self._log_norm
+
+
+@register_kde("fft")
+class BinnedKDE(DirectKDE):
+    """
+    Binned Gaussian KDE evaluated with FFT convolutions
+
+    Approximates the same estimator as `scipy.stats.gaussian_kde` by linearly
+    binning the weighted samples onto a regular grid spanning the data (padded
+    by `cut` kernel standard deviations), and convolving the binned weights
+    with the Gaussian kernel sampled on the grid using FFTs. The density at
+    arbitrary points is then obtained by multi-linear interpolation on the
+    grid. Building the grid costs O(n + G log G), with G the total number of
+    grid points, and evaluation O(m), instead of O(n m) for the exact KDE.
+
+    Binning is only practical in low dimensions. For datasets with more than
+    `max_dim` dimensions the exact (direct) evaluation is used instead. Points
+    falling outside of the grid are also evaluated exactly.
+
+    Parameters
+    ----------
+    dataset : ArrayLike
+        Samples to estimate density from, of shape `(n_dims, n_samples)`.
+    bw_method : optional
+        Bandwidth selection method. See `scipy.stats.gaussian_kde`.
+    weights : ArrayLike, optional
+        Weights of each sample.
+    grid_size : Union[int, List[int]], optional
+        Number of grid points, per dimension or for all dimensions. Defaults
+        to `DEF_GRID_SIZE` for the dimension of the data.
+    cut : float, default=DEF_CUT
+        Number of kernel standard deviations to pad the grid, and truncate
+        the kernel, by.
+    max_dim : int, default=3
+        Max dimension of data to use binning for.
+    max_bytes : int, optional
+        Memory budget for exact evaluations. See `DirectKDE`.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        bw_method=None,
+        weights=None,
+        grid_size=None,
+        cut=DEF_CUT,
+        max_dim=3,
+        max_bytes=None,
+    ):
+        self.grid_size = grid_size
+        self.cut = cut
+        self.max_dim = max_dim
+        super().__init__(
+            dataset, bw_method=bw_method, weights=weights, max_bytes=max_bytes
+        )
+
+    def _compute_covariance(self):
+        """
+        Extends `DirectKDE` method by (re)computing the density on the grid.
+        """
+        super()._compute_covariance()
+        self._interp = None
+        if self.d <= self.max_dim:
+            self._build_grid()
+        else:
+            logger.debug(f"Binned KDE not used for {self.d} > {self.max_dim} dims")
+
+    def _build_grid(self):
+        """
+        Bin weighted samples onto the grid and convolve with the kernel.
+        """
+        gs = DEF_GRID_SIZE.get(self.d, 64) if self.grid_size is None else self.grid_size
+        gs = np.broadcast_to(np.asarray(gs, dtype=int), (self.d,))
+        bw = np.sqrt(np.diag(self.covariance))
+        lo = self.dataset.min(axis=1) - self.cut * bw
+        hi = self.dataset.max(axis=1) + self.cut * bw
+        delta = (hi - lo) / (gs - 1)
+
+        # Linear binning: Spread each weight onto the 2^d surrounding nodes
+        pos = (self.dataset - lo[:, None]) / delta[:, None]
+        idx = np.clip(np.floor(pos).astype(int), 0, gs[:, None] - 2)
+        frac = pos - idx
+        binned = np.zeros(np.prod(gs))
+        for corner in itertools.product([0, 1], repeat=self.d):
+            c = np.array(corner)[:, None]
+            w = self.weights * np.prod(np.where(c, frac, 1.0 - frac), axis=0)
+            flat = np.ravel_multi_index(tuple(idx + c), gs)
+            binned += np.bincount(flat, weights=w, minlength=binned.size)
+        binned = binned.reshape(gs)
+
+        # Kernel sampled on grid offsets, truncated at cut standard deviations
+        lags = np.minimum(np.ceil(self.cut * bw / delta).astype(int), gs - 1)
+        offs = np.meshgrid(
+            *[np.arange(-l, l + 1) * delta[i] for i, l in enumerate(lags)],
+            indexing="ij",
+        )
+        white = solve_triangular(
+            self._chol, np.stack([o.ravel() for o in offs]), lower=True
+        )
+        kern = np.exp(-0.5 * np.sum(white**2, axis=0) - self._log_norm)
+
+        from scipy.signal import fftconvolve  # slow to import, only needed here
+
+        dens = fftconvolve(binned, kern.reshape(offs[0].shape), mode="same")
+        self._peak = np.max(dens)
+        self._interp = RegularGridInterpolator(
+            [np.linspace(lo[i], hi[i], gs[i]) for i in range(self.d)],
+            np.maximum(dens, 0.0),
+            bounds_error=False,
+            fill_value=np.nan,
+        )
+
+    def evaluate(self, points):
+        """
+        Evaluate the estimated pdf on a set of points.
+
+        Parameters
+        ----------
+        points : ArrayLike
+            Points of shape `(n_dims, n_points)`.
+
+        Returns
+        -------
+        values : np.ndarray
+            Density at each point, of shape `(n_points,)`.
+        """
+        points = self._check_points(points)
+        if self._interp is None:
+            return super().evaluate(points)
+        res = self._interp(points.T)
+        if (outside := np.isnan(res)).any():
+            res[outside] = super().evaluate(points[:, outside])
+        return res
+
+    __call__ = evaluate
+
+    def logpdf(self, x):
+        """
+        Evaluate the log of the estimated pdf on a provided set of points.
+
+        Uses the binned estimate, except in the tails (below `DEF_LOG_TAIL`
+        times the peak density), where its relative error is large and the
+        log density is evaluated exactly instead.
+        """
+        points = self._check_points(x)
+        if self._interp is None:
+            return super().logpdf(points)
+        return self._log_approx(
+            points, self.evaluate(points), floor=DEF_LOG_TAIL * self._peak
+        )
+
+
+@register_kde("tree")
+class TreeKDE(DirectKDE):
+    """
+    Tree accelerated Gaussian KDE with a relative error tolerance
+
+    Approximates the same estimator as `scipy.stats.gaussian_kde` (same
+    bandwidth and kernel covariance) for moderate to high dimensional data,
+    where binning does not scale. Samples are whitened with the Cholesky
+    factor of the kernel covariance, so that the kernel is isotropic, and
+    stored in a KD-tree.
+
+    Since the weights are normalized, samples further than `r` from a point
+    contribute at most `W_out * exp(-r^2 / 2)` to its kernel sum `S`, with
+    `W_out` their total weight. The `k` nearest neighbors of each point give
+    a lower bound `S_k` on `S`, which is accepted directly if the remaining
+    samples are guaranteed to contribute less than `rtol * S_k`. Otherwise,
+    the radius `r` needed to meet the tolerance is computed from `S_k`, and
+    the kernel sum is truncated to samples within `r`, found with dual-tree
+    searches between trees over blocks of evaluation points (sorted by
+    radius) and the samples. Either way the relative error is under `rtol`,
+    and the value at each point does not depend on the other points
+    evaluated along with it.
+
+    Parameters
+    ----------
+    dataset : ArrayLike
+        Samples to estimate density from, of shape `(n_dims, n_samples)`.
+    bw_method : optional
+        Bandwidth selection method. See `scipy.stats.gaussian_kde`.
+    weights : ArrayLike, optional
+        Weights of each sample.
+    rtol : float, default=DEF_RTOL
+        Max relative error of density evaluations.
+    k : int, default=DEF_TREE_K
+        Number of nearest neighbors used to bound the kernel sums.
+    leafsize : int, default=16
+        Leaf size of KD-trees.
+    max_bytes : int, optional
+        Memory budget for evaluations. Assumes at worst every sample is
+        within the truncation radius. See `DirectKDE`.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        bw_method=None,
+        weights=None,
+        rtol=DEF_RTOL,
+        k=DEF_TREE_K,
+        leafsize=16,
+        max_bytes=None,
+    ):
+        if rtol <= 0:
+            raise ValueError(f"rtol must be a float > 0: {rtol}")
+        self.rtol = rtol
+        self.k = k
+        self.leafsize = leafsize
+        super().__init__(
+            dataset, bw_method=bw_method, weights=weights, max_bytes=max_bytes
+        )
+
+    def _compute_covariance(self):
+        """
+        Extends `DirectKDE` method by building a tree on the whitened samples.
+        """
+        super()._compute_covariance()
+        self._tree = cKDTree(self._white.T, leafsize=self.leafsize)
+
+    def _truncated_sums(self, white_pts, radii):
+        """
+        Kernel sums over samples within `radii` of each (whitened) point.
+
+        Pairs are sorted before summing, so each sum is accumulated in the
+        same order no matter which other points are in the block.
+        """
+        tree = cKDTree(white_pts.T, leafsize=self.leafsize)
+        pairs = tree.sparse_distance_matrix(
+            self._tree, np.max(radii), output_type="ndarray"
+        )
+        pairs = pairs[pairs["v"] <= radii[pairs["i"]]]
+        pairs = pairs[np.lexsort((pairs["j"], pairs["i"]))]
+        kern = np.exp(-0.5 * pairs["v"] ** 2) * self.weights[pairs["j"]]
+        return np.bincount(pairs["i"], weights=kern, minlength=white_pts.shape[1])
+
+    def evaluate(self, points):
+        """
+        Evaluate the estimated pdf on a set of points.
+
+        Parameters
+        ----------
+        points : ArrayLike
+            Points of shape `(n_dims, n_points)`.
+
+        Returns
+        -------
+        values : np.ndarray
+            Density at each point, of shape `(n_points,)`, to within a
+            relative error of `rtol`.
+        """
+        points = self._check_points(points)
+        white_pts = solve_triangular(self._chol, points, lower=True)
+        k = min(self.k, self.n)
+        dists, idxs = self._tree.query(white_pts.T, k=k)
+        dists, idxs = dists.reshape(-1, k), idxs.reshape(-1, k)
+        res = np.sum(self.weights[idxs] * np.exp(-0.5 * dists**2), axis=1)
+        w_out = np.maximum(1.0 - np.sum(self.weights[idxs], axis=1), 0.0)
+
+        # Radius at which the samples left out meet the tolerance
+        bound = self.rtol * res
+        todo = np.where(w_out * np.exp(-0.5 * dists[:, -1] ** 2) > bound)[0]
+        with np.errstate(divide="ignore"):
+            radii = np.sqrt(2.0 * (np.log(w_out[todo]) - np.log(bound[todo])))
+        if (exact := ~np.isfinite(radii)).any():
+            logger.debug(f"Evaluating {exact.sum()} points exactly")
+            res[todo[exact]] = super().evaluate(points[:, todo[exact]])
+            res[todo[exact]] *= np.exp(self._log_norm)
+        todo, radii = todo[~exact], radii[~exact]
+        order = np.argsort(radii)
+        todo, radii = todo[order], radii[order]
+        block_size = get_block_size(self.n, self.max_bytes)
+        for start in range(0, todo.size, block_size):
+            blk = slice(start, start + block_size)
+            res[todo[blk]] = self._truncated_sums(white_pts[:, todo[blk]], radii[blk])
+        return res * np.exp(-self._log_norm)
+
+    __call__ = evaluate
+
+    def logpdf(self, x):
+        """
+        Evaluate the log of the estimated pdf on a provided set of points.
+
+        The relative error bound of `evaluate()` carries over to an absolute
+        error of about `rtol` on the log density. Points where the density
+        underflows are evaluated exactly in log space.
+        """
+        points = self._check_points(x)
+        return self._log_approx(points, self.evaluate(points))
+
+
+@register_kde("frozen")
+class FrozenKDE(DirectKDE):
+    """
+    Gaussian KDE with a frozen bandwidth and a cached kernel matrix
+
+    Meant for re-weighting densities over a fixed set of samples, as done
+    every iteration of `OfflineSequential.solve()`. The kernel covariance is
+    computed as in `scipy.stats.gaussian_kde` when first fit, and then kept
+    fixed (frozen) for all re-weighted copies returned by `reweight()`, which
+    do not recompute it. The pairwise kernel matrix over the samples is
+    built on the first evaluation of the density at its own samples
+    (`self_pdf()`), and stored in a `KernelCache` keyed on the samples and
+    the kernel covariance. It is thus shared by all copies, and by any other
+    frozen KDE on the same samples with the same bandwidth, so evaluating a
+    re-weighted density at the samples is a single matrix-vector product.
+
+    Note a kernel matrix takes `8 * n^2` bytes of memory. Kernel matrices
+    larger than the cache's `max_bytes` could not be stored, so they are not
+    built, and `self_pdf()` evaluates the density directly over blocks of
+    samples instead, as `DirectKDE` does.
+
+    Parameters
+    ----------
+    dataset : ArrayLike
+        Samples to estimate density from, of shape `(n_dims, n_samples)`.
+    bw_method : optional
+        Bandwidth selection method. See `scipy.stats.gaussian_kde`.
+    weights : ArrayLike, optional
+        Weights of each sample.
+    max_bytes : int, optional
+        Memory budget for intermediates of evaluations. See `DirectKDE`.
+    cache : KernelCache, optional
+        Cache to store kernel matrices in. Defaults to the module wide
+        `KERNEL_CACHE`.
+    """
+
+    def __init__(
+        self, dataset, bw_method=None, weights=None, max_bytes=None, cache=None
+    ):
+        self.cache = KERNEL_CACHE if cache is None else cache
+        super().__init__(
+            dataset, bw_method=bw_method, weights=weights, max_bytes=max_bytes
+        )
+
+    def _compute_covariance(self):
+        """
+        Extends `DirectKDE` method by computing the kernel matrix cache key.
+        """
+        super()._compute_covariance()
+        self._cache_key = KernelCache.key(self.dataset, self.covariance)
+
+    def _kernel_matrix(self):
+        """
+        Compute pairwise kernel matrix over blocks of samples.
+        """
+        logger.debug(f"Computing {self.n} x {self.n} kernel matrix")
+        K = np.empty((self.n, self.n))
+        block_size = get_block_size(self.n, self.max_bytes)
+        for start in range(0, self.n, block_size):
+            end = min(start + block_size, self.n)
+            sq = self._sq_dists(self._white[:, start:end])
+            np.exp(np.multiply(sq, -0.5, out=sq), out=K[start:end])
+        return K
+
+    def kernel_matrix(self):
+        """
+        Pairwise (unnormalized) kernel values between samples, of shape
+        `(n, n)`. Computed on first call and cached.
+        """
+        return self.cache.get(self._cache_key, self._kernel_matrix)
+
+    def _fits_cache(self):
+        """
+        Whether the kernel matrix fits in the cache.
+        """
+        return self.n**2 * np.dtype(float).itemsize <= self.cache.max_bytes
+
+    def self_pdf(self):
+        """
+        Evaluate the estimated pdf at its own samples, using the cached
+        kernel matrix.
+
+        Returns
+        -------
+        values : np.ndarray
+            Density at each sample, of shape `(n_samples,)`.
+        """
+        if not self._fits_cache():
+            return DirectKDE.evaluate(self, self.dataset)
+        return (self.kernel_matrix() @ self.weights) * np.exp(-self._log_norm)
+
+    def self_logpdf(self):
+        """
+        Evaluate the log of the estimated pdf at its own samples, using the
+        cached kernel matrix where the density does not underflow.
+
+        Returns
+        -------
+        values : np.ndarray
+            Log density at each sample, of shape `(n_samples,)`.
+        """
+        if not self._fits_cache():
+            return DirectKDE.logpdf(self, self.dataset)
+        return self._log_approx(self.dataset, self.self_pdf())
+
+    def reweight(self, weights):
+        """
+        Re-weighted copy of the density
+
+        Returns a copy of the KDE with new sample weights, sharing the frozen
+        kernel covariance and the cached kernel matrix.
+
+        Parameters
+        ----------
+        weights : ArrayLike
+            New weights of each sample.
+
+        Returns
+        -------
+        kde : FrozenKDE
+            Re-weighted KDE.
+        """
+        weights = np.atleast_1d(np.asarray(weights, dtype=float))
+        if weights.ndim != 1 or len(weights) != self.n:
+            raise ValueError(f"`weights` must be a 1D array of size {self.n}")
+        if not np.isfinite(total := np.sum(weights)) or total <= 0:
+            raise ValueError(f"`weights` must have a positive finite sum: {total}")
+        new = copy.copy(self)
+        new._weights = weights / total
+        new._neff = 1 / np.sum(new._weights**2)
+        new._wsum = total
+        new._moments = None
+        return new
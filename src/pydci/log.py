@@ -4,14 +4,11 @@ pyDCI Logging Module
 pyDCI uses `Link loguru <https://loguru.readthedocs.io/en/stable/index.html>`_
 in combination with `Link rich <https://github.com/Textualize/rich>`_ to do
 logging in a nice and conise way. By default logging is disabled, but can
-be enable by importing the :func: `enable_log` to turn logging on.
+be enable by importing the :func: `enable_log` to turn logging on. rich is
+only imported once logging is enabled or a table is logged, and rich
+tracebacks are installed by :func: `enable_log`.
 """
 from loguru import logger
-from rich.console import Console
-from rich.logging import RichHandler
-from rich.text import Text
-from rich.traceback import install
-install(show_locals=True)
 
 
 def log_table(rich_table):
@@ -31,6 +28,9 @@ def log_table(rich_table):
     -------
     Text to output to loguru logging handler.
     """
+    from rich.console import Console
+    from rich.text import Text
+
     console = Console(width=70)
     with console.capture() as capture:
         console.print(rich_table)
@@ -61,6 +61,10 @@ def enable_log(
     serialize: bool, default=False
         If set to True, output log in json form.
     """
+    from rich.logging import RichHandler
+    from rich.traceback import install
+
+    install(show_locals=True)
     if file is None:
         fmt = "{message}" if fmt is None else fmt
         logger.configure(
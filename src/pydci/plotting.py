@@ -1,13 +1,10 @@
 import pdb
 import random
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from matplotlib.patches import Rectangle
 
-sns.set_style("darkgrid")  # set the default seaborn style for our plots
+from pydci.utils import lazy_import
 
 # Add True State Data to the plot
 bright_colors = [
@@ -20,7 +17,6 @@ bright_colors = [
     "olive",
     "cyan",
 ]
-interval_colors = sns.color_palette("muted", n_colors=50)
 
 # TODO: Matplotlib plotting options
 # plt.backend = "Agg"
@@ -45,7 +41,29 @@ DEF_RC_PARAMS = {
     "font.size": 16,
     "savefig.facecolor": "white",
 }
-plt.rcParams.update(DEF_RC_PARAMS)
+_STYLE_SET = False
+
+
+def set_style():
+    """
+    Set pyDCI's default seaborn style and matplotlib rc parameters
+
+    Called on first use of `plt` or `sns` from this module, so matplotlib and
+    seaborn are only imported, and their defaults only changed, once pyDCI
+    plots something.
+    """
+    global _STYLE_SET
+    if not _STYLE_SET:
+        _STYLE_SET = True
+        import matplotlib.pyplot
+        import seaborn
+
+        seaborn.set_style("darkgrid")  # set the default seaborn style for our plots
+        matplotlib.pyplot.rcParams.update(DEF_RC_PARAMS)
+
+
+plt = lazy_import("matplotlib.pyplot", on_import=set_style)
+sns = lazy_import("seaborn", on_import=set_style)
 
 
 def _parse_title(
@@ -90,7 +108,9 @@ def plot_state_data(
     Takes a list of observed data dataframes and plots the state at a certain
     index over time. If pf_dfs passed as well, pf_dfs are plotted as well.
     """
+    from matplotlib.patches import Rectangle
 
+    interval_colors = sns.color_palette("muted", n_colors=50)
     labels = []
     if ax is None:
         fig, ax = plt.subplots(1, 1, figsize=figsize)
@@ -0,0 +1,364 @@
+"""
+pyDCI Problem State
+
+Array backed container for the per-sample state of a `DCIProblem`: the
+parameter samples, their push-forward values, weights, and the densities and
+ratios computed when solving. Values are stored as a struct of arrays, with
+one contiguous float64 array per field, 1D for scalar fields (`weight`,
+`pi_in`, ...) and 2D of shape `(n_samples, n_dims)` for vector fields (`lam`,
+`q_lam`, ...), so solves read and write NumPy arrays directly.
+
+Columns are accessed with the same names as in a pandas DataFrame,
+`state["pi_up"]` or `state["lam_0"]`, returning NumPy arrays (views for the
+columns of vector fields), while `state["lam"]` returns a vector field as a
+whole. A DataFrame of the state, with one column per dimension of vector
+fields as produced by `pydci.utils.put_df`, is built only on request with
+`to_frame()`, e.g. for plotting.
+
+The states of the iterations of sequential solves are logged in an
+`IterationLog`, storing fields that do not change between iterations once and
+the others in preallocated blocks, one row per iteration.
+"""
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+__author__ = "Carlos del-Castillo-Negrete"
+__copyright__ = "Carlos del-Castillo-Negrete"
+__license__ = "mit"
+
+# Number of iterations an IterationLog is allocated for initially
+DEF_LOG_CAPACITY = 8
+
+
+class ProblemState:
+    """
+    Struct of Arrays Problem State
+
+    Stores named float64 fields of `n` samples each. Setting a field always
+    stores a new array (as assigning a DataFrame column does), so arrays
+    previously returned by the state are not modified by later updates.
+
+    Parameters
+    ----------
+    n : int
+        Number of samples.
+    fields : Dict[str, ArrayLike], optional
+        Initial fields to set, in order. Scalars are broadcast to `n` values.
+
+    Examples
+    --------
+    >>> state = ProblemState(3, {"weight": 1.0, "lam": np.arange(6).reshape(3, 2)})
+    >>> state.columns
+    ['weight', 'lam_0', 'lam_1']
+    >>> state["lam_1"]
+    array([1., 3., 5.])
+    """
+
+    def __init__(self, n: int, fields: Dict = None):
+        self.n = n
+        self._data = {}
+        self._frame = None
+        for name, val in ({} if fields is None else fields).items():
+            self[name] = val
+
+    @classmethod
+    def from_arrays(cls, n: int, fields: Dict):
+        """
+        State on existing float64 arrays of `n` rows, stored as is instead
+        of copied, e.g. views of an `IterationLog`.
+        """
+        state = cls(n)
+        state._data = dict(fields)
+        return state
+
+    def copy(self):
+        """
+        Shallow copy of the state, on the same field arrays. As setting a
+        field stores a new array, later sets on either do not affect the other.
+        """
+        return ProblemState.from_arrays(self.n, self._data)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def shape(self):
+        """
+        Shape of the state as a DataFrame.
+        """
+        return (self.n, len(self.columns))
+
+    @property
+    def fields(self) -> List[str]:
+        """
+        Names of the fields stored, scalar and vector.
+        """
+        return list(self._data.keys())
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        Column names of the state as a DataFrame, with vector fields
+        unpacked into one column per dimension, `{name}_{j}`.
+        """
+        cols = []
+        for name, val in self._data.items():
+            if val.ndim == 1:
+                cols.append(name)
+            else:
+                cols += [f"{name}_{j}" for j in range(val.shape[1])]
+        return cols
+
+    def _column(self, key):
+        """
+        Split a column name `{name}_{j}` of a vector field into `(name, j)`.
+        """
+        name, _, j = key.rpartition("_")
+        if j.isdigit() and name in self._data and self._data[name].ndim == 2:
+            if int(j) < self._data[name].shape[1]:
+                return name, int(j)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._data:
+            return True
+        try:
+            self._column(key)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, key: Union[str, List[str]]):
+        """
+        Get a field or column by name as an array, or a DataFrame of a list
+        of columns.
+        """
+        if isinstance(key, list):
+            return self.to_frame()[key]
+        if key in self._data:
+            return self._data[key]
+        name, j = self._column(key)
+        return self._data[name][:, j]
+
+    def __setitem__(self, key: str, value):
+        """
+        Set a field, or a column of a vector field, to a copy of `value`.
+        Setting a 2D value of `n` rows creates (or replaces) a vector field.
+        """
+        value = np.asarray(value, dtype=float)
+        if key not in self._data and key in self:
+            name, j = self._column(key)
+            block = self._data[name].copy()
+            block[:, j] = value
+            self._data[name] = block
+        elif value.ndim == 2:
+            if value.shape[0] != self.n:
+                raise ValueError(f"{key} must have {self.n} rows: {value.shape}")
+            self._data[key] = np.array(value, dtype=float, order="C")
+        else:
+            self._data[key] = np.array(np.broadcast_to(value, (self.n,)))
+        self._frame = None
+
+    def append(self, fields: Dict):
+        """
+        Append samples to the state
+
+        Parameters
+        ----------
+        fields : Dict[str, ArrayLike]
+            Values of the new samples for each field. The number of samples
+            appended is given by the first array passed. Scalars are
+            broadcast, and fields not passed are set to NaN.
+        """
+        if unknown := [k for k in fields if k not in self._data]:
+            raise ValueError(f"Unknown fields {unknown}")
+        sizes = [len(v) for v in fields.values() if np.ndim(v) > 0]
+        if len(sizes) == 0:
+            raise ValueError("At least one array of new values must be passed")
+        n_new = sizes[0]
+        data = {}
+        for name, val in self._data.items():
+            new = np.asarray(fields.get(name, np.nan), dtype=float)
+            new = np.broadcast_to(new, (n_new,) + val.shape[1:])
+            data[name] = np.concatenate([val, new])
+        self._data = data
+        self.n += n_new
+        self._frame = None
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        State as a pandas DataFrame
+
+        Built on first call after the state changes, and cached. The frame
+        is a copy of the state, so it should be treated as read only.
+
+        Returns
+        -------
+        df : pd.DataFrame
+            DataFrame with one column per scalar field, and per dimension of
+            each vector field.
+        """
+        if self._frame is None:
+            cols = {}
+            for name, val in self._data.items():
+                if val.ndim == 1:
+                    cols[name] = val
+                else:
+                    cols.update({f"{name}_{j}": val[:, j] for j in range(val.shape[1])})
+            self._frame = pd.DataFrame(cols, index=pd.RangeIndex(self.n))
+        return self._frame
+
+
+def _rows(i, shape):
+    """
+    Index of the rows `i` of a log block, over the leading `shape` of each.
+    """
+    return (i, slice(None)) + tuple(slice(n) for n in shape)
+
+
+class IterationLog:
+    """
+    Columnar Iteration Log
+
+    Log of the states of a problem over the iterations of a sequential solve.
+    Fields that do not change between iterations, e.g. the samples `lam`, are
+    stored once, and the others in blocks of shape `(capacity, n, ...)` with
+    one row per iteration, grown by doubling, so logging an iteration only
+    copies its own values. Vector fields whose width changes between
+    iterations, e.g. `q_pca`, are padded with NaN. Per iteration values,
+    e.g. the iteration number or the mask used, are kept in `info`.
+
+    Parameters
+    ----------
+    n : int
+        Number of samples.
+    static : Dict[str, ArrayLike], optional
+        Fields that are the same for all iterations.
+    capacity : int, default=DEF_LOG_CAPACITY
+        Number of iterations to allocate blocks for initially.
+
+    Examples
+    --------
+    >>> log = IterationLog(2, {"lam": np.zeros((2, 1))})
+    >>> for i in range(3):
+    ...     log.append({"ratio": np.full(2, i)}, {"iteration": i})
+    >>> log[-1]["ratio"]
+    array([2., 2.])
+    >>> log.to_frame().shape
+    (6, 3)
+    """
+
+    def __init__(self, n: int, static: Dict = None, capacity: int = DEF_LOG_CAPACITY):
+        self.n = n
+        self.static = ProblemState(n, static)
+        self.capacity = capacity
+        self._blocks = {}
+        self._shapes = {}
+        self._info = []
+        self._frame = None
+
+    def __len__(self):
+        return len(self._info)
+
+    @property
+    def info(self) -> pd.DataFrame:
+        """
+        Per iteration values, one row per iteration.
+        """
+        return pd.DataFrame(self._info, index=pd.RangeIndex(len(self)))
+
+    def _block(self, name, shape):
+        """
+        Block for field `name` with room for one more iteration of `shape`.
+        """
+        block = self._blocks.get(name)
+        if block is None:
+            block = np.full((max(self.capacity, 1), self.n) + shape, np.nan)
+        elif len(block) == len(self) or np.any(np.greater(shape, block.shape[2:])):
+            size = 2 * len(block) if len(block) == len(self) else len(block)
+            new = np.full(
+                (size, self.n) + tuple(np.maximum(shape, block.shape[2:])), np.nan
+            )
+            new[_rows(slice(len(self)), block.shape[2:])] = block[: len(self)]
+            block = new
+        self._blocks[name] = block
+        return block
+
+    def append(self, fields: Dict, info: Dict = None):
+        """
+        Log an iteration
+
+        Parameters
+        ----------
+        fields : Dict[str, ArrayLike]
+            Values of the per iteration fields for each sample.
+        info : Dict, optional
+            Per iteration values, e.g. the iteration number.
+        """
+        i = len(self)
+        for name, val in fields.items():
+            val = np.asarray(val, dtype=float)
+            if len(val) != self.n:
+                raise ValueError(f"{name} must have {self.n} rows: {val.shape}")
+            self._block(name, val.shape[1:])[_rows(i, val.shape[1:])] = val
+            shapes = self._shapes.setdefault(name, [])
+            shapes += [None] * (i - len(shapes)) + [val.shape[1:]]
+        self._info.append({} if info is None else dict(info))
+        self._frame = None
+
+    def copy(self, n: int = None, info: Dict = None):
+        """
+        Copy of the first `n` iterations of the log, all by default, with the
+        per iteration values in `info` updated for each.
+        """
+        n = len(self) if n is None else n
+        log = IterationLog(self.n, capacity=self.capacity)
+        log.static = self.static.copy()
+        log._blocks = {k: v[: max(n, 1)].copy() for k, v in self._blocks.items()}
+        log._shapes = {k: v[:n] for k, v in self._shapes.items()}
+        log._info = [{**i, **(info or {})} for i in self._info[:n]]
+        return log
+
+    def __getitem__(self, i: int) -> ProblemState:
+        """
+        State at iteration `i`, on read only views of the log.
+        """
+        i = range(len(self))[i]
+        fields = dict(self.static._data)
+        for name, block in self._blocks.items():
+            shapes = self._shapes[name]
+            if i >= len(shapes) or shapes[i] is None:
+                continue
+            view = block[_rows(i, shapes[i])]
+            view.flags.writeable = False
+            fields[name] = view
+        return ProblemState.from_arrays(self.n, fields)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Log as a DataFrame
+
+        One row per sample and iteration, with the columns of the static and
+        per iteration fields, as in `ProblemState.to_frame()`, and per
+        iteration values. Built on first call after the log changes, and
+        cached.
+        """
+        if self._frame is None:
+            k = len(self)
+            cols = {}
+            for name in self.static.columns:
+                cols[name] = np.tile(self.static[name], k)
+            for name, block in self._blocks.items():
+                val = block[:k].reshape((k * self.n,) + block.shape[2:])
+                if val.ndim == 1:
+                    cols[name] = val
+                else:
+                    cols.update({f"{name}_{j}": val[:, j] for j in range(val.shape[1])})
+            info = self.info
+            for name in info.columns:
+                cols[name] = np.repeat(info[name].values, self.n)
+            index = np.tile(np.arange(self.n), k)
+            self._frame = pd.DataFrame(cols, index=index)
+        return self._frame
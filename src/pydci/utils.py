@@ -2,16 +2,23 @@
 pyDCI Utilities
 
 """
+import hashlib
+import importlib
 import pdb
+import threading
+from collections import OrderedDict
 from itertools import product
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Tuple, Union
 
 import math
 import numpy as np
 import pandas as pd
 from numpy.linalg import LinAlgError
 from numpy.typing import ArrayLike
-from scipy.stats import gaussian_kde
+from scipy import stats
+from scipy.stats import gaussian_kde, rv_continuous
+
+from pydci.kde import get_kde
 
 
 class KDEError(Exception):
@@ -38,12 +45,17 @@ class KDEError(Exception):
         return msg
 
 
-def gkde(X, weights=None, label=None):
+def gkde(X, weights=None, label=None, method=None, **kwargs):
     """
-    Try to compute gkde using scipy, catching common errors
+    Try to compute gkde using the KDE backend `method`, catching common errors
+
+    The backend is looked up in the registry in :mod:`pydci.kde`. If `method`
+    is not specified, the global default is used (scipy's `gaussian_kde`
+    unless changed with `pydci.kde.set_default_kde()`). Extra keyword
+    arguments are passed to the backend's constructor.
     """
     try:
-        res = gaussian_kde(X, weights=weights)
+        res = get_kde(method)(X, weights=weights, **kwargs)
     except (LinAlgError, ValueError) as e:
         if "array must not contain infs or NaNs" in str(e):
             # TODO: Explain what this error means in message
@@ -162,6 +174,146 @@ def set_shape(array: np.ndarray, shape: Union[List, Tuple] = (1, -1)) -> np.ndar
     return array.reshape(shape) if array.ndim < 2 else array
 
 
+class LRUCache:
+    """
+    Least Recently Used Cache
+
+    Cache of at most `max_size` entries, evicting the least recently used
+    entry first. Lookups are thread safe, so a cache can be shared between
+    problems solved concurrently.
+
+    Attributes
+    ----------
+    max_size : int
+        Maximum number of entries.
+    hits : int
+        Number of lookups served from the cache.
+    misses : int
+        Number of lookups that computed a new entry.
+
+    Examples
+    --------
+    >>> cache = LRUCache(max_size=1)
+    >>> cache.get("a", lambda: 1), cache.get("a", lambda: 2)
+    (1, 1)
+    >>> cache.get("b", lambda: 3), "a" in cache
+    (3, False)
+    """
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    @staticmethod
+    def hash(*arrays) -> str:
+        """
+        Digest of the contents of `arrays`, to key entries derived from them.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for a in arrays:
+            a = np.ascontiguousarray(a, dtype=float)
+            h.update(str(a.shape).encode())
+            h.update(a.tobytes())
+        return h.hexdigest()
+
+    def get(self, key, compute: Callable):
+        """
+        Get entry `key`, calling `compute()` to create it if not cached.
+        """
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        val = compute()
+        with self._lock:
+            self.misses += 1
+            if self.max_size > 0:
+                self._cache[key] = val
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return val
+
+    def clear(self):
+        """
+        Remove all entries and reset statistics.
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class LazyModule:
+    """
+    Module imported on first attribute access
+
+    Stands in for a module that is slow to import (plotting, scikit-learn,
+    ...) and only needed by some methods, so importing pydci does not pay for
+    it. See :func:`lazy_import`.
+    """
+
+    def __init__(self, name: str, on_import=None):
+        self._name = name
+        self._on_import = on_import
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+            if self._on_import is not None:
+                self._on_import()
+        return self._module
+
+    def __getattr__(self, attr):
+        if attr in ("_name", "_on_import", "_module"):
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str, on_import=None) -> LazyModule:
+    """
+    Lazily import a module
+
+    Parameters
+    ----------
+    name : str
+        Full name of the module, e.g. `"matplotlib.pyplot"`.
+    on_import : Callable, optional
+        Called with no arguments once the module is first imported, e.g. to
+        set plotting defaults.
+
+    Returns
+    -------
+    module : LazyModule
+        Proxy importing `name` on first attribute access, then forwarding
+        attribute access to it.
+
+    Examples
+    --------
+    >>> json = lazy_import("json")
+    >>> json.dumps([1])
+    '[1]'
+    """
+    return LazyModule(name, on_import=on_import)
+
+
 def get_uniform_box(center, factor=0.5, mins=None, maxs=None):
     """
     Generate a domain of [min, max] values around a center value.
@@ -186,6 +338,61 @@ def get_uniform_box(center, factor=0.5, mins=None, maxs=None):
     return domain
 
 
+def stack_dists(dists: List[Any], ndim: int = 2):
+    """
+    Stack frozen distributions of the same family into one distribution.
+
+    Parameters of each distribution are broadcast against each other and
+    stacked along a new leading axis, so that evaluating the stacked
+    distribution at points of `ndim` dimensions evaluates all of them at
+    once, returning arrays with a leading axis of size `len(dists)`.
+
+    Parameters
+    ----------
+    dists : List[Any]
+        Frozen scipy.stats distributions, e.g. `norm(loc=..., scale=...)`.
+    ndim : int, default=2
+        Number of dimensions of the arrays of points to evaluate at.
+
+    Returns
+    -------
+    dist : Any
+        Stacked frozen distribution, or None if the distributions can't be
+        stacked (not frozen continuous distributions of one of the families
+        in `scipy.stats`, or of different families).
+
+    Examples
+    --------
+    >>> from scipy.stats import norm
+    >>> stack_dists([norm(0, 1), norm(1, 2)]).mean().shape
+    (2, 1, 1)
+    """
+    def _family(d):
+        gen = getattr(d, "dist", None)
+        if not isinstance(gen, rv_continuous):
+            return None
+        family = getattr(stats, gen.name, None)
+        return family if type(family) is type(gen) else None
+
+    first = dists[0]
+    family = _family(first)
+    for d in dists:
+        if family is None or _family(d) is not family:
+            return None
+        if len(d.args) != len(first.args) or sorted(d.kwds) != sorted(first.kwds):
+            return None
+
+    def _stack(vals):
+        vals = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in vals])
+        shape = vals[0].shape
+        pad = (1,) * max(ndim - len(shape), 0)
+        return np.stack(vals).reshape((len(dists),) + pad + shape)
+
+    args = [_stack([d.args[i] for d in dists]) for i in range(len(first.args))]
+    kwds = {k: _stack([d.kwds[k] for d in dists]) for k in first.kwds}
+    return family(*args, **kwds)
+
+
 def put_df(df, name, val, size=1, mask=None):
     """
     Given an n-m dimensional `val`, stores into dataframe `df` with `n`
@@ -214,9 +421,9 @@ def get_df(df, name, size=1):
     the `m` columns of val into from columns of `df` with names `{name}_{j}`
     where j is the index of the column.
     """
-    val = np.zeros((df.shape[0], size))
+    val = np.zeros((len(df), size))
     for idx in range(size):
-        val[:, idx] = df[f"{name}_{idx}"].values
+        val[:, idx] = df[f"{name}_{idx}"]
     return val
 
 
@@ -286,7 +493,8 @@ def get_search_combinations(
 ):
     """
     Determine search combinations for a given data chunk.
-    By default uses the last data chunk in the data list.
+    By default uses the last data chunk in the data list. The first
+    `max_num_combs` combinations are returned, or all if None.
 
     """
     if data_chunk_size is None:
@@ -327,7 +535,7 @@ def get_search_combinations(
         if j / (k * data_chunk_size) >= 1.0
     ]
 
-    if len(search_list) > max_num_combs:
+    if max_num_combs is not None and len(search_list) > max_num_combs:
         search_list = search_list[:max_num_combs]
 
     return search_list
\ No newline at end of file
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import numpy as np
+import pytest
+from scipy.stats import gaussian_kde
+from scipy.stats.distributions import norm, uniform
+
+from pydci import DCIProblem, kde
+from pydci.consistent_bayes import DCIProblem as dci_module
+
+
+def test_log_ratio():
+    rng = np.random.default_rng(19)
+    lam = rng.normal(size=(500, 1))
+    lam[0] = 50.0
+    prob = DCIProblem((lam, lam), norm(0.1, 1.0), pi_in=norm(), pi_pr=norm())
+    prob.solve()
+
+    assert prob.state["pi_obs"][0] == 0.0 and prob.state["pi_pr"][0] == 0.0
+    assert prob.state["log_ratio"][0] == pytest.approx(5.0 - 0.005)
+    ratio = norm(0.1).pdf(lam[1:, 0]) / norm.pdf(lam[1:, 0])
+    assert np.allclose(prob.state["ratio"][1:], ratio)
+    assert np.all(np.isfinite(prob.state["log_pi_up"]))
+    assert prob.result["e_r"].values[0] == pytest.approx(
+        np.mean(prob.state["ratio"])
+    )
+
+    prob = DCIProblem((lam[1:], lam[1:]), norm(0.1, 1.0))
+    far = np.array([[0.0], [60.0]])
+    ref = gaussian_kde(lam[1:].T).logpdf(far.T)
+    assert np.allclose(prob.pi_pr(far, log=True), ref)
+
+
+@pytest.mark.parametrize("stack", [True, False])
+def test_solve_batch(stack):
+    rng = np.random.default_rng(23)
+    lam = rng.uniform(-1, 1, size=(800, 2))
+    q_lam = np.stack([lam.sum(axis=1), lam[:, 0] - lam[:, 1]], axis=1)
+    obs = [norm(loc=[0.1 * i, -0.1], scale=0.3 + 0.05 * i) for i in range(4)]
+    if not stack:
+        obs.append(uniform(loc=[-0.5, -0.5], scale=1.0))
+    prob = DCIProblem((lam, q_lam), obs[0])
+    prob.set_max_bytes(kde.PAIR_BYTES * len(obs) * 2 * 100)
+    batch = prob.solve_batch(obs)
+
+    assert batch["ratio"].shape == (len(obs), 800)
+    assert prob.state["pi_pr"].sum() == 0.0
+    for i, pi_obs in enumerate(obs):
+        ref = DCIProblem((lam, q_lam), pi_obs)
+        ref.solve()
+        assert np.allclose(batch["ratio"][i], ref.state["ratio"])
+        assert np.allclose(batch["pi_up"][i], ref.state["pi_up"])
+        assert batch["e_r"][i] == pytest.approx(ref.result["e_r"].values[0])
+        assert batch["kl"][i] == pytest.approx(ref.result["kl"].values[0])
+
+
+def test_append_samples():
+    rng = np.random.default_rng(29)
+    lam = rng.uniform(-1, 1, size=(600, 2))
+    q_lam = lam.sum(axis=1).reshape(-1, 1)
+    ref = DCIProblem((lam, q_lam), norm(0.2, 0.3))
+    ref.set_kde("direct")
+    ref.solve()
+    prob = DCIProblem((lam[:500], q_lam[:500]), norm(0.2, 0.3))
+    prob.set_kde("direct")
+    prob.solve()
+    pi_in = prob.dists["pi_in"]
+    prob.append_samples((lam[500:], q_lam[500:]))
+
+    assert prob.n_samples == 600 and len(prob.state) == 600
+    assert prob.dists["pi_in"] is pi_in and prob.dists["pi_up"] is None
+    assert np.isnan(prob.state["pi_up"][-1])
+    prob.solve()
+    for col in ["pi_in", "pi_pr", "ratio", "pi_up"]:
+        assert np.allclose(prob.state[col], ref.state[col])
+
+
+def test_sample_dist():
+    rng = np.random.default_rng(31)
+    lam = rng.uniform(-1, 1, size=(1000, 2))
+    q_lam = lam.sum(axis=1).reshape(-1, 1)
+    prob = DCIProblem((lam, q_lam), norm(0.2, 0.1))
+    prob.solve()
+    samples = prob.sample_dist(200000, seed=np.random.default_rng(5))
+    ref = prob.dists["pi_up"].resample(200000, seed=5)
+
+    assert samples.shape == (200000, 2)
+    assert np.array_equal(samples, prob.sample_dist(200000, seed=5))
+    assert np.allclose(samples.mean(axis=0), ref.mean(axis=1), atol=5e-3)
+    assert np.allclose(np.cov(samples.T), np.cov(ref), atol=5e-3)
+    assert prob.sample_dist(10, dist="pi_obs", seed=1).shape == (1, 10)
+
+
+@pytest.mark.parametrize("method", ["scipy", "direct"])
+def test_max_bytes(method):
+    rng = np.random.default_rng(5)
+    lam = rng.uniform(-1, 1, size=(2000, 2))
+    q_lam = (lam**3).sum(axis=1).reshape(-1, 1)
+    ref = DCIProblem((lam, q_lam), norm(0.1, 0.2))
+    ref.set_kde(method)
+    ref.solve()
+    prob = DCIProblem((lam, q_lam), norm(0.1, 0.2))
+    prob.set_kde(method)
+    prob.set_max_bytes(kde.PAIR_BYTES * 2000 * 7)
+    prob.solve()
+
+    for col in ["pi_in", "pi_pr", "pi_obs", "pi_up"]:
+        assert np.array_equal(prob.state[col], ref.state[col])
+    assert np.array_equal(prob.pi_up(lam[:10]), ref.pi_up(lam[:10]))
+    with pytest.raises(ValueError):
+        prob.set_max_bytes(0)
+
+
+@pytest.mark.parametrize("method", ["scipy", "direct", "tree"])
+def test_n_jobs(method):
+    rng = np.random.default_rng(11)
+    lam = rng.uniform(-1, 1, size=(1500, 3))
+    q_lam = (lam**2).sum(axis=1).reshape(-1, 1)
+    states = []
+    for n_jobs in [1, 3, 8]:
+        prob = DCIProblem((lam, q_lam), norm(0.8, 0.2))
+        prob.set_kde(method)
+        prob.set_max_bytes(kde.PAIR_BYTES * 1500 * 100)
+        prob.set_n_jobs(n_jobs)
+        prob.solve()
+        states.append(prob.state)
+
+    for state in states[1:]:
+        for col in ["pi_in", "pi_pr", "pi_obs", "pi_up"]:
+            assert np.array_equal(state[col], states[0][col])
+
+
+@pytest.mark.parametrize("n_jobs", [2, 3, 8])
+def test_n_jobs_bound(n_jobs, monkeypatch):
+    running, totals = [], []
+    lock = threading.Lock()
+
+    def evaluate_blocks(*args, n_jobs=1, **kwargs):
+        with lock:
+            running.append(n_jobs)
+            totals.append(sum(running))
+        try:
+            return kde.evaluate_blocks(*args, n_jobs=n_jobs, **kwargs)
+        finally:
+            with lock:
+                running.remove(n_jobs)
+
+    monkeypatch.setattr(dci_module, "evaluate_blocks", evaluate_blocks)
+    rng = np.random.default_rng(11)
+    lam = rng.uniform(-1, 1, size=(1500, 3))
+    prob = DCIProblem((lam, lam.sum(axis=1).reshape(-1, 1)), norm(0.1, 0.2))
+    prob.set_n_jobs(n_jobs)
+    prob.solve()
+
+    # Threads split between the densities evaluated concurrently
+    assert len(totals) == 3 and max(totals) <= n_jobs
+    assert prob._block_jobs is None
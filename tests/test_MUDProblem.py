@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy.stats import uniform
+
+from pydci import MUDProblem
+
+
+@pytest.fixture
+def linear_samples():
+    rng = np.random.default_rng(0)
+    lam = rng.normal([0.5, -0.2], [0.3, 0.2], size=(2000, 2))
+    A = np.array([[1.0, 2.0]])
+    return lam, lam @ A.T + 0.1, A
+
+
+def test_solve_linear(linear_samples):
+    lam, q_lam, A = linear_samples
+    prob = MUDProblem((lam, q_lam), [[0.5]], 0.05)
+    prob.solve(linear=True)
+
+    assert np.allclose(prob.linear["A"], A) and prob.linear["err"] < 1e-12
+    assert np.allclose(prob.mud_point @ A.T + 0.1, 0.5)
+    assert np.allclose(prob.result[["lam_MUD_0", "lam_MUD_1"]].values, prob.mud_point)
+    assert np.allclose(prob.state["pi_up"], prob.state["pi_in"] * prob.state["ratio"])
+    assert abs(prob.expected_ratio() - 1.0) < 0.1
+
+    # Closed form agrees with the sample based solution
+    kde_prob = MUDProblem((lam, q_lam), [[0.5]], 0.05)
+    kde_prob.solve()
+    assert kde_prob.linear is None
+    assert abs(kde_prob.mud_point @ A.T + 0.1 - 0.5) < 0.05
+
+
+def test_solve_linear_auto(linear_samples):
+    lam, q_lam, _ = linear_samples
+    prob = MUDProblem((lam, q_lam), [[0.5]], 0.05)
+    prob.solve(linear="auto")
+    assert prob.linear is not None
+
+    prob = MUDProblem((lam[:500], q_lam[:500] ** 2), [[0.25]], 0.05)
+    prob.solve(linear="auto")
+    assert prob.linear is None and prob.mud_point is not None
+    with pytest.raises(ValueError):
+        prob.solve(linear="yes")
+
+
+def test_refine_mud_point():
+    rng = np.random.default_rng(1)
+    lam = rng.uniform(-1, 1, size=(1000, 2))
+    lam_true = np.array([0.3, -0.2])
+
+    def Q(lam):
+        lam = np.atleast_2d(lam)
+        return np.stack([lam[:, 0] + 0.3 * lam[:, 0] ** 2, lam[:, 1] - lam[:, 0]]).T
+
+    # States shifted to observe the same value, as MUDProblem has one datum
+    q_true = Q(lam_true)
+    q_lam = Q(lam) - q_true + q_true.mean()
+    prob = MUDProblem((lam, q_lam), [[q_true.mean()]], 0.02)
+    prob.solve()
+    sample_err = np.linalg.norm(prob.mud_point - lam_true)
+    mud_point = prob.refine_mud_point()
+
+    assert np.linalg.norm(mud_point - lam_true) < sample_err / 5
+    assert np.allclose(prob.result[["lam_MUD_0", "lam_MUD_1"]].values, mud_point)
+    assert np.allclose(prob.lam[prob.mud_arg], prob.get_mud_point()[1][0])
+
+    prob.solve(refine=True)
+    assert np.allclose(prob.mud_point, mud_point)
+
+
+def test_refine_mud_point_bounded():
+    rng = np.random.default_rng(0)
+    lam = rng.uniform(0, 1, size=(2000, 1))
+    prob = MUDProblem((lam, lam**2), [[0.995]], 0.05, pi_in=uniform(0, 1))
+    prob.solve()
+    sample_mud_point = prob.mud_point.copy()
+    assert sample_mud_point[0] > 0.99
+
+    # Steps past the edge of the support are dropped
+    mud_point = prob.refine_mud_point()
+    assert np.all(np.isfinite(mud_point))
+    assert 0 <= mud_point[0] <= 1 and mud_point[0] >= sample_mud_point[0] - 0.01
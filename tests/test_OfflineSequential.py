@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from pydci import OfflineSequential
+from pydci.consistent_bayes.PCAMUDProblem import PCAMUDProblem
+
+
+@pytest.fixture
+def seq_problem_args():
+    rng = np.random.default_rng(0)
+    lam = rng.uniform(0, 1, size=(500, 2))
+    t = np.linspace(0, 1, 20)
+    q_lam = lam[:, [0]] * np.sin(3 * t) + lam[:, [1]] * t
+    data = 0.3 * np.sin(3 * t) + 0.7 * t + rng.normal(0, 0.05, len(t))
+    return (lam, q_lam), data, 0.05
+
+
+def test_solve_restores_checkpoint(seq_problem_args, monkeypatch):
+    prob = OfflineSequential(*seq_problem_args)
+    solve = PCAMUDProblem.solve
+    calls, dists = [], []
+
+    def fail_second(self, **kwargs):
+        calls.append(kwargs)
+        solve(self, **kwargs)
+        dists.append(dict(self.dists))
+        if len(calls) == 2:
+            self.state["ratio"] = 0.0
+            raise ZeroDivisionError("Predictability assumption violated")
+
+    monkeypatch.setattr(PCAMUDProblem, "solve", fail_second)
+    prob.solve(pca_splits=3, fail_on_partial=False)
+
+    # Last good iteration restored, without solving it again
+    assert len(calls) == 2 and len(prob.it_results) == 1
+    first = prob.get_iteration_state(0)
+    for field in ["weight", "ratio", "pi_up", "q_pca"]:
+        assert np.array_equal(prob.state[field], first[field])
+    assert np.allclose(prob.mud_point, prob.result[["lam_MUD_0", "lam_MUD_1"]])
+    for d, dens in dists[0].items():
+        # KDEs restored as copies of those of the last good iteration
+        assert type(prob.dists[d]) is type(dens)
+        for attr in ["dataset", "weights"]:
+            val = getattr(dens, attr, None)
+            assert np.array_equal(getattr(prob.dists[d], attr, None), val)
+    assert prob.dists["pi_pr"] is not dists[1]["pi_pr"]
+
+    with pytest.raises(RuntimeError):
+        calls.clear()
+        prob.solve(pca_splits=3)
+
+
+def test_resume_failure_keeps_own_log(seq_problem_args, monkeypatch):
+    cache = {}
+    first = OfflineSequential(*seq_problem_args)
+    first.solve(pca_splits=3, max_its=1, prefix_cache=cache,
+                state_extra={"search_index": 0})
+    solve = PCAMUDProblem.solve
+
+    def fail(self, **kwargs):
+        solve(self, **kwargs)
+        raise ZeroDivisionError("Predictability assumption violated")
+
+    monkeypatch.setattr(PCAMUDProblem, "solve", fail)
+    prob = OfflineSequential(*seq_problem_args)
+    prob.solve(pca_splits=3, prefix_cache=cache, fail_on_partial=False,
+               state_extra={"search_index": 1})
+
+    # Failed first new iteration restores the resumed state of this problem
+    assert prob.n_solves == 1 and len(prob.it_results) == 1
+    assert prob.it_log is not first.it_log and len(prob.it_log) == 1
+    assert list(prob.it_log.info["search_index"]) == [1]
+    assert list(first.it_log.info["search_index"]) == [0]
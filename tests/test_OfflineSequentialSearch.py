@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pydci import OfflineSequentialSearch
+from pydci.consistent_bayes.OfflineSequentialSearch import _gp_predict
+
+
+@pytest.fixture
+def search_args():
+    rng = np.random.default_rng(0)
+    lam = rng.uniform(0, 1, size=(300, 2))
+    t = np.linspace(0, 1, 6)
+    q_lam = lam[:, [0]] * np.sin(3 * t) + lam[:, [1]] * t
+    data = 0.3 * np.sin(3 * t) + 0.7 * t + rng.normal(0, 0.05, len(t))
+    samples = pd.DataFrame(
+        np.hstack([lam, q_lam]),
+        columns=[f"lam_{i}" for i in range(2)] + [f"q_lam_{i}" for i in range(6)],
+    )
+    return samples, data, 0.05
+
+
+@pytest.mark.parametrize("n_jobs", [2, "threads"])
+def test_parallel_search(search_args, n_jobs):
+    serial = OfflineSequentialSearch(*search_args)
+    serial.solve(max_num_combs=4)
+
+    prob = OfflineSequentialSearch(*search_args, store=False)
+    if n_jobs == "threads":
+        pool = ThreadPoolExecutor(max_workers=2)
+        prob.set_n_jobs(executor=pool)
+    else:
+        prob.set_n_jobs(n_jobs)
+    prob.solve(max_num_combs=4)
+
+    cols = ["search_index", "e_r", "kl", "closest"]
+    pd.testing.assert_frame_equal(
+        prob.search_results[cols].reset_index(drop=True),
+        serial.search_results[cols].reset_index(drop=True),
+    )
+    assert prob.probs == [] and len(serial.probs) == 4
+    assert np.array_equal(prob.best.mud_point, serial.best.mud_point)
+    assert prob.best.pca_cache is prob.pca_cache
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_search_memoize(search_args, n_jobs):
+    res = []
+    for memoize in [False, True]:
+        prob = OfflineSequentialSearch(*search_args)
+        prob.set_n_jobs(n_jobs)
+        prob.solve(all_data=False, memoize=memoize)
+        res.append(prob.search_results)
+
+    # Masks range(0, 4) with 2 splits resume from range(0, 2) with 1 split
+    assert res[1].index.equals(res[0].index)
+    cols = ["search_index", "e_r", "kl", "closest", "num_splits"]
+    pd.testing.assert_frame_equal(res[1][cols], res[0][cols])
+    solved = [i for i, p in enumerate(prob.probs) if hasattr(p, "it_results")]
+    assert list(res[1]["search_index"]) == solved
+    for idx in solved:
+        p = prob.probs[idx]
+        info = p.it_log.info
+        assert len(info) == len(p.it_results)
+        assert (info["search_index"] == idx).all()
+        assert np.array_equal(info["pca_splits"], p.it_results["num_splits"])
+
+
+def test_search_halving(search_args):
+    full = OfflineSequentialSearch(*search_args)
+    full.solve(all_data=False, memoize=False)
+    prob = OfflineSequentialSearch(*search_args)
+    prob.solve(all_data=False, strategy="halving")
+
+    stats = prob.search_stats
+    assert stats["full_solves"] == full.search_stats["full_solves"]
+    assert 0 < stats["solves"] < full.search_stats["solves"]
+    assert stats["saved"] == stats["full_solves"] - stats["solves"]
+    assert len(stats["pruned"]) > 0
+    assert not set(stats["pruned"]) & set(prob.search_results["search_index"])
+    assert abs(prob.result["e_r"].values[0] - 1) < 0.5
+
+    # Survivors solved through all iterations match the full search
+    res = prob.search_results.set_index("search_index")
+    full_res = full.search_results.set_index("search_index").loc[res.index]
+    assert np.allclose(res["e_r"], full_res["e_r"])
+    with pytest.raises(ValueError):
+        prob.solve(strategy="random")
+    for rate in [1, 0, 2.5]:
+        with pytest.raises(ValueError):
+            prob.solve(strategy="halving", halving_rate=rate)
+
+
+def test_search_adaptive(search_args):
+    full = OfflineSequentialSearch(*search_args)
+    full.solve(all_data=False, max_num_combs=None)
+    prob = OfflineSequentialSearch(*search_args)
+    prob.solve(all_data=False, strategy="adaptive", max_num_combs=10)
+
+    # Searches all combinations, solving only max_num_combs of them
+    assert len(prob.probs) == len(full.probs) == 12
+    solved = [i for i, p in enumerate(prob.probs) if p is not None]
+    assert len(solved) == 10 and prob.search_stats["pruned"] == [
+        i for i in range(12) if i not in solved
+    ]
+    assert prob.search_stats["solves"] < full.search_stats["solves"]
+    res = prob.search_results.set_index("search_index")
+    full_res = full.search_results.set_index("search_index")
+    assert set(res.index) <= set(solved)
+    assert np.allclose(res["e_r"], full_res.loc[res.index, "e_r"])
+    assert abs(prob.result["e_r"].values[0] - 1) < 0.05
+
+
+def test_gp_predict():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(size=(10, 3))
+    y = np.sin(3 * X).sum(axis=1)
+    mean, std = _gp_predict(X, y, X)
+    assert np.allclose(mean, y, atol=1e-2) and (std < 0.05 * y.std()).all()
+    _, std = _gp_predict(X, y, X + 2)
+    assert np.allclose(std, y.std(), rtol=1e-2)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from pydci.consistent_bayes.OnlineSequential import OnlineSequential
+from pydci.Model import DynamicModel
+
+
+class DecayModel(DynamicModel):
+    """
+    Independent exponential decay of each state at rate lam
+    """
+
+    def forward_model(self, x0, times, lam):
+        return np.asarray(x0) * np.exp(-np.outer(times - times[0], lam))
+
+
+@pytest.fixture
+def online():
+    np.random.seed(0)
+    model = DecayModel(
+        x0=[1.0, 2.0],
+        lam_true=[0.5, 0.3],
+        measurement_noise=0.01,
+        state_idxs=[0, 1],
+        def_init=["uniform", {"scale": 0.5}],
+    )
+    model.get_data()
+    return OnlineSequential(model)
+
+
+def test_solve_till_thresh(online):
+    prob = online.solve_till_thresh(
+        -1, exp_thresh=0.5, start_sample_size=100, max_sample_size=200
+    )
+    assert prob.best is not None and prob.n_samples == 100
+    assert abs(prob.result["e_r"].values[0] - 1) < 0.5
+
+
+def test_solve_till_thresh_retry(online):
+    prob = online.solve_till_thresh(
+        -1,
+        exp_thresh=1e-8,
+        start_sample_size=100,
+        max_sample_size=150,
+        samples_inc=25,
+        max_num_combs=2,
+    )
+    # More samples drawn until the max sample size, none solving
+    samples = online.model.samples[0]
+    assert len(samples) == 150 and prob.n_samples == 150
+    assert np.all(np.isfinite(samples.values)) and prob.best is None
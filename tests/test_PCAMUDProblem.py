@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from pydci import PCAMUDProblem
+
+
+@pytest.fixture
+def pca_problem_args():
+    rng = np.random.default_rng(0)
+    lam = rng.uniform(0, 1, size=(500, 2))
+    t = np.linspace(0, 1, 20)
+    q_lam = lam[:, [0]] * np.sin(3 * t) + lam[:, [1]] * t
+    q_lam += rng.normal(0, 0.01, q_lam.shape)
+    data = 0.3 * np.sin(3 * t) + 0.7 * t + rng.normal(0, 0.05, len(t))
+    return (lam, q_lam), data, 0.05
+
+
+def test_q_pca_cache(pca_problem_args):
+    prob = PCAMUDProblem(*pca_problem_args)
+    prob.q_pca(mask=range(10))
+    q_pca, vecs = prob.q_lam, prob.pca["vecs"]
+    prob.q_pca(mask=range(10, 20))
+    prob.q_pca(mask=range(10))
+
+    # Residual moments are computed once, and cached as well
+    assert prob.pca_cache.misses == 3 and prob.pca_cache.hits == 2
+    assert prob.q_lam is q_pca and prob.pca["vecs"] is vecs
+    assert not q_pca.flags.writeable
+    assert np.array_equal(prob.state["q_pca"], q_pca)
+
+    # Shared between problems on the same data, and the same as refitting
+    other = PCAMUDProblem(*pca_problem_args)
+    fresh = other.pca_cache
+    other.pca_cache = prob.pca_cache
+    other.q_pca(mask=range(10))
+    assert prob.pca_cache.hits == 3
+    other.pca_cache = fresh
+    other.q_pca(mask=range(10))
+    assert other.q_lam is not q_pca and np.allclose(other.q_lam, q_pca)
+
+    # Refit once samples are added
+    (lam, q_lam), _, _ = pca_problem_args
+    prob.append_samples((lam[:10], q_lam[:10]))
+    prob.q_pca(mask=range(10))
+    assert prob.pca_cache.misses == 5 and prob.q_lam.shape == (510, 2)
+
+
+@pytest.mark.parametrize("mask", [None, range(5, 15), [1, 4, 9, 10]])
+@pytest.mark.parametrize("max_nc", [None, 1, 3])
+def test_q_pca_gram(pca_problem_args, mask, max_nc):
+    prob = PCAMUDProblem(*pca_problem_args)
+    prob.q_pca(mask=mask, max_nc=max_nc)
+    assert (prob._get_data_key(), "moments") in prob.pca_cache
+
+    # Fit with sklearn on the masked residuals when the Gram matrix is too big
+    sk_prob = PCAMUDProblem(*pca_problem_args)
+    sk_prob.set_max_bytes(1)
+    sk_prob.q_pca(mask=mask, max_nc=max_nc)
+    assert sk_prob._residual_moments() is None
+    assert np.allclose(prob.q_lam, sk_prob.q_lam)
+    for key in ["X_train", "vecs", "var"]:
+        assert np.allclose(prob.pca[key], sk_prob.pca[key])
+
+
+@pytest.mark.parametrize("method", ["randomized", "arpack"])
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_q_pca_truncated(pca_problem_args, method, dtype):
+    prob = PCAMUDProblem(*pca_problem_args)
+    prob.set_pca("full")
+    prob.q_pca(max_nc=2)
+    exact = prob.q_lam
+
+    prob.set_pca(method, dtype=dtype, oversample=5)
+    prob.q_pca(max_nc=2)
+    assert prob.pca_cache.misses == 2
+    assert prob.pca["vecs"].dtype == dtype and prob.q_lam.dtype == np.float64
+    tol = 1e-10 if dtype == "float64" else 1e-5
+    assert np.allclose(prob.q_lam, exact, rtol=0, atol=tol * np.abs(exact).max())
+
+    with pytest.raises(ValueError):
+        prob.set_pca("lanczos")
+
+
+def test_q_pca_incremental(pca_problem_args):
+    (lam, q_lam), data, std_dev = pca_problem_args
+    full = PCAMUDProblem(*pca_problem_args)
+    full.set_pca("full")
+    full.q_pca(max_nc=2)
+
+    prob = PCAMUDProblem((lam, q_lam[:, :5]), data[:5], std_dev)
+    prob.set_pca("incremental", oversample=4)
+    prob.q_pca(max_nc=2)
+    for i in range(5, 20, 5):
+        prob.append_qoi(q_lam[:, i : i + 5], data[i : i + 5])
+        prob.q_pca(max_nc=2)
+        assert prob.pca_stream["stop"] == i + 5 and prob.pca_cache.misses == 0
+
+    assert np.array_equal(prob.state["q_lam"], q_lam) and prob.n_qoi == 20
+    assert prob.pca["vecs"].shape == full.pca["vecs"].shape
+    scale = np.abs(full.q_lam).max()
+    assert np.allclose(prob.q_lam, full.q_lam, rtol=0, atol=1e-3 * scale)
+    assert np.allclose(prob.pca["var"], full.pca["var"], rtol=1e-3)
+
+    # Exact while the residuals have at most `rank` components
+    prob.set_pca("incremental", oversample=18)
+    prob.q_pca(mask=range(0, 20), max_nc=2)
+    assert np.allclose(prob.q_lam, full.q_lam, rtol=0, atol=1e-10 * scale)
+
+    # Other masks are fit as with "auto"
+    prob.q_pca(mask=range(10), max_nc=2)
+    assert prob.pca_cache.misses == 2
+
+    with pytest.raises(ValueError):
+        prob.append_qoi(q_lam[:10, :2], data[:2])
+
+
+def test_checkpoint_copies(pca_problem_args):
+    (lam, q_lam), data, std_dev = pca_problem_args
+    prob = PCAMUDProblem((lam, q_lam[:, :10]), data[:10], std_dev)
+    prob.set_kde("direct")
+    prob.set_pca("incremental")
+    prob.solve()
+    prob.save_state({"iteration": 0})
+    ckpt = prob.checkpoint()
+
+    # Log, incremental PCA and KDE all updated in place
+    prob.save_state({"iteration": 1})
+    prob.append_qoi(q_lam[:, 10:], data[10:])
+    prob.q_pca()
+    prob.dists["pi_in"].append(lam[:10].T)
+    assert prob.pca_stream["stop"] == 20 and prob.dists["pi_in"].n == 510
+
+    prob.restore(ckpt)
+    assert len(prob.it_log) == 1 and prob.n_qoi == 10
+    assert prob.pca_stream["stop"] == 10 and prob.dists["pi_in"].n == 500
+    other = PCAMUDProblem((lam, q_lam[:, :10]), data[:10], std_dev)
+    other.restore(ckpt)
+    assert other.it_log is not prob.it_log
+    assert other.pca_stream is not prob.pca_stream
+    assert other.dists["pi_in"] is not prob.dists["pi_in"]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+# Only imported when plotting or solving with optional features
+LAZY_MODULES = ["matplotlib", "seaborn", "sklearn", "alive_progress", "rich"]
+
+
+def _fresh_import(stmt, setup="pass"):
+    """
+    Run `stmt` in a fresh interpreter after running `setup`, returning the
+    top level modules imported.
+    """
+    code = (
+        "import json, sys\n"
+        f"{setup}\n"
+        f"{stmt}\n"
+        "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout)
+
+
+def test_import_pydci():
+    mods = _fresh_import("import pydci")
+    assert not {"scipy", "pandas", *LAZY_MODULES} & set(mods)
+
+
+def test_import_problems_lazy():
+    mods = _fresh_import(
+        "from pydci import *", setup="import numpy, pandas, scipy.stats, loguru"
+    )
+    assert not set(LAZY_MODULES) & set(mods)
+
+
+def test_lazy_attributes():
+    import pydci
+    from pydci.consistent_bayes.DCIProblem import DCIProblem
+
+    assert pydci.DCIProblem is DCIProblem
+    assert set(pydci.__all__) <= set(dir(pydci))
+    with pytest.raises(AttributeError):
+        pydci.NotAProblem
+
+
+def test_lazy_plotting():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from pydci import plotting
+
+    assert plotting.plt.rcParams["font.size"] == plotting.DEF_RC_PARAMS["font.size"]
+    assert plotting.sns.color_palette("bright", n_colors=2) is not None
+    assert "loaded" in repr(plotting.sns) and "not" not in repr(plotting.sns)
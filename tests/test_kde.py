@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+import warnings
+
+import numpy as np
+import pytest
+from scipy.stats import gaussian_kde
+
+from pydci import kde
+from pydci.utils import gkde
+
+
+@pytest.fixture
+def samples_2D():
+    rng = np.random.default_rng(123)
+    X = rng.normal(size=(2, 500))
+    weights = rng.uniform(0.1, 1.0, size=500)
+    return X, weights
+
+
+def test_registry_default():
+    assert kde.get_kde() is gaussian_kde
+    assert "scipy" in kde.list_kdes()
+    assert "direct" in kde.list_kdes()
+    with pytest.raises(ValueError):
+        kde.get_kde("not_a_kde")
+
+
+def test_set_default_kde(samples_2D):
+    X, weights = samples_2D
+    kde.set_default_kde("direct")
+    try:
+        assert isinstance(gkde(X, weights=weights), kde.DirectKDE)
+    finally:
+        kde.set_default_kde("scipy")
+    assert type(gkde(X, weights=weights)) is gaussian_kde
+
+
+def test_direct_kde(samples_2D):
+    X, weights = samples_2D
+    ref = gaussian_kde(X, weights=weights)
+    res = gkde(X, weights=weights, method="direct", max_bytes=37 * 24 * 500)
+
+    assert isinstance(res, gaussian_kde)
+    assert np.allclose(res.pdf(X), ref.pdf(X), rtol=1e-10)
+    assert res.resample(10).shape == (2, 10)
+
+
+@pytest.mark.parametrize("dim,rtol", [(1, 1e-3), (2, 1e-2)])
+def test_binned_kde_accuracy(dim, rtol):
+    rng = np.random.default_rng(21)
+    X = rng.normal(size=(dim, 5000))
+    weights = rng.uniform(0.1, 1.0, size=5000)
+    ref = gaussian_kde(X, weights=weights)
+    res = gkde(X, weights=weights, method="fft")
+
+    assert isinstance(res, kde.BinnedKDE)
+    assert np.allclose(res.pdf(X), ref.pdf(X), rtol=rtol)
+    assert res.covariance == pytest.approx(ref.covariance)
+
+
+def test_binned_kde_outside_grid(samples_2D):
+    X, weights = samples_2D
+    ref = gaussian_kde(X, weights=weights)
+    res = gkde(X, weights=weights, method="fft")
+    far = np.array([[10.0, -10.0], [0.0, 12.0]])
+
+    assert np.allclose(res.pdf(far), ref.pdf(far), rtol=1e-10)
+
+
+@pytest.mark.parametrize("rtol", [1e-2, 1e-5])
+def test_tree_kde_tolerance(rtol):
+    rng = np.random.default_rng(7)
+    X = rng.uniform(size=(5, 2000))
+    weights = np.exp(-10 * np.sum((X - 0.5) ** 2, axis=0))
+    ref = gaussian_kde(X, weights=weights)
+    res = gkde(X, weights=weights, method="tree", rtol=rtol)
+    vals = res.pdf(X)
+
+    assert isinstance(res, kde.TreeKDE)
+    assert np.all(np.abs(vals - ref.pdf(X)) <= rtol * ref.pdf(X))
+    assert np.allclose(res.covariance, ref.covariance)
+
+
+def test_tree_kde_tiny_densities():
+    rng = np.random.default_rng(0)
+    X = np.hstack([rng.normal(0, 1, 1000), rng.normal(100, 1, 1000)])[None, :]
+    weights = np.where(X[0] < 50, 1e-303, 1.0)
+    ref = gaussian_kde(X, weights=weights)
+    res = gkde(X, weights=weights, method="tree")
+
+    # Tolerance radii of densities near underflow computed without overflow
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        vals = res.pdf(X[:, :100])
+    assert np.allclose(vals, ref.pdf(X[:, :100]), rtol=1e-5)
+
+
+def test_tree_kde_dci_problem():
+    from scipy.stats.distributions import norm
+
+    from pydci import DCIProblem
+
+    rng = np.random.default_rng(3)
+    lam = rng.uniform(-1, 1, size=(1000, 4))
+    q_lam = lam.sum(axis=1).reshape(-1, 1)
+    ref = DCIProblem((lam, q_lam), norm(0.5, 0.2))
+    ref.solve()
+    prob = DCIProblem((lam, q_lam), norm(0.5, 0.2))
+    prob.set_kde("tree", dists=["pi_in", "pi_up"], rtol=1e-6)
+    prob.solve()
+
+    assert isinstance(prob.dists["pi_in"], kde.TreeKDE)
+    assert not isinstance(prob.dists["pi_pr"], kde.TreeKDE)
+    assert np.allclose(prob.state["pi_up"], ref.state["pi_up"], rtol=1e-5)
+    assert prob.result["e_r"].values[0] == pytest.approx(ref.result["e_r"].values[0])
+
+
+def test_frozen_kde_reweight(samples_2D):
+    X, weights = samples_2D
+    ref = gaussian_kde(X)
+    res = gkde(X, method="frozen")
+
+    assert np.allclose(res.self_pdf(), ref.pdf(X), rtol=1e-10)
+
+    new = res.reweight(weights)
+    K = res.kernel_matrix()
+    assert new.kernel_matrix() is K
+    assert np.array_equal(new.covariance, ref.covariance)
+    assert np.allclose(new.self_pdf(), new.pdf(X), rtol=1e-10)
+    with pytest.raises(ValueError):
+        res.reweight(weights[:-1])
+
+
+def test_frozen_kde_cache_budget(samples_2D, monkeypatch):
+    X, weights = samples_2D
+    ref = gaussian_kde(X, weights=weights)
+    cache = kde.KernelCache(max_bytes=X.shape[1] ** 2 * 8 - 1)
+    res = kde.FrozenKDE(X, weights=weights, max_bytes=10000, cache=cache)
+
+    # Too large to cache, so evaluated in blocks without the kernel matrix
+    def no_matrix(self):
+        raise AssertionError("Kernel matrix built")
+
+    monkeypatch.setattr(kde.FrozenKDE, "_kernel_matrix", no_matrix)
+    assert np.allclose(res.self_pdf(), ref.pdf(X), rtol=1e-10)
+    assert np.allclose(res.self_logpdf(), ref.logpdf(X), rtol=1e-10)
+    assert len(cache) == 0 and cache.misses == 0
+
+
+def test_frozen_kde_set_weights():
+    from scipy.stats.distributions import norm
+
+    from pydci import DCIProblem
+
+    rng = np.random.default_rng(13)
+    lam = rng.uniform(-1, 1, size=(500, 2))
+    q_lam = lam.sum(axis=1).reshape(-1, 1)
+    prob = DCIProblem((lam, q_lam), norm(0.2, 0.3))
+    prob.set_kde("frozen")
+    prob.solve()
+    pi_in = prob.dists["pi_in"]
+
+    prob.set_weights(prob.state["ratio"])
+    assert prob.dists["pi_in"].kernel_matrix() is pi_in.kernel_matrix()
+    assert prob.dists["pi_up"] is None
+    prob.solve()
+    assert np.allclose(prob.state["pi_in"], prob.dists["pi_in"].pdf(lam.T))
+
+
+def test_kernel_cache():
+    from scipy.stats.distributions import norm
+
+    from pydci import DCIProblem
+
+    rng = np.random.default_rng(17)
+    lam = rng.uniform(-1, 1, size=(400, 2))
+    q_lam = lam.sum(axis=1).reshape(-1, 1)
+    cache = kde.KernelCache()
+    prob = DCIProblem((lam, q_lam), norm(0.2, 0.3))
+    prob.set_kde("frozen", cache=cache)
+    prob.solve()
+    assert (cache.misses, cache.hits) == (2, 0)
+
+    pi_up = prob.pi_up()
+    pi_pf = prob.pi_pf()
+    assert (cache.misses, cache.hits) == (2, 2)
+    pi_in_cov = prob.dists["pi_in"].covariance
+    assert np.array_equal(prob.dists["pi_up"].covariance, pi_in_cov)
+    assert np.allclose(pi_up, prob.dists["pi_up"].pdf(lam.T))
+    assert np.allclose(pi_pf, prob.dists["pi_pf"].pdf(q_lam.T))
+
+    small = kde.KernelCache(max_bytes=400 * 400 * 8)
+    small.get(small.key(lam.T, np.eye(2)), lambda: np.ones((400, 400)))
+    small.get(small.key(q_lam.T, np.eye(1)), lambda: np.ones((400, 400)))
+    assert len(small) == 1 and small.nbytes <= small.max_bytes
+
+
+@pytest.mark.parametrize("method", ["direct", "fft", "tree", "frozen"])
+def test_kde_logpdf(method, samples_2D):
+    X, weights = samples_2D
+    ref = gaussian_kde(X, weights=weights)
+    res = gkde(X, weights=weights, method=method)
+    pts = np.hstack([X[:, :50], [[40.0, -3.0], [0.0, 60.0]]])
+    vals = res.logpdf(pts)
+
+    assert np.all(np.isfinite(vals))
+    assert np.allclose(vals, ref.logpdf(pts), atol=1e-2)
+    if method == "frozen":
+        assert np.allclose(res.self_logpdf(), ref.logpdf(X), rtol=1e-10)
+
+
+@pytest.mark.parametrize("method", ["direct", "fft", "tree", "frozen"])
+def test_kde_append(method, samples_2D):
+    X, weights = samples_2D
+    ref = gkde(X, weights=weights, method=method)
+    res = gkde(X[:, :300], weights=weights[:300], method=method)
+    res.append(X[:, 300:450], weights=weights[300:450])
+    res.append(X[:, 450:], weights=weights[450:])
+
+    assert res.n == 500
+    assert np.allclose(res.weights, ref.weights)
+    assert np.allclose(res.covariance, ref.covariance)
+    assert res.neff == pytest.approx(ref.neff)
+    assert np.allclose(res.pdf(X), ref.pdf(X), rtol=1e-8)
+    with pytest.raises(ValueError):
+        res.append(X[:, :5], weights=weights[:4])
+
+
+@pytest.mark.parametrize("method", ["systematic", "multinomial"])
+def test_weighted_resample(method, samples_2D):
+    X, weights = samples_2D
+    weights = weights / weights.sum()
+    draws = kde.weighted_resample(X, weights, size=100000, seed=1, method=method)
+    idx = np.argmin(np.abs(X[0][:, None] - draws[0][None, :1000]), axis=0)
+
+    assert draws.shape == (2, 100000)
+    assert np.array_equal(X[:, idx], draws[:, :1000])
+    counts = np.array([np.sum(draws[0] == x) for x in X[0, :50]])
+    tol = 1 if method == "systematic" else 5 * np.sqrt(100000 * weights[:50])
+    assert np.all(np.abs(counts - 100000 * weights[:50]) <= tol)
+    with pytest.raises(ValueError):
+        kde.weighted_resample(X, weights, method="alias")
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pydci.state import IterationLog, ProblemState
+
+
+@pytest.fixture
+def state():
+    lam = np.arange(12, dtype=float).reshape(4, 3)
+    return ProblemState(4, {"weight": 1.0, "ratio": np.arange(4), "lam": lam})
+
+
+def test_state_columns(state):
+    assert state.columns == ["weight", "ratio", "lam_0", "lam_1", "lam_2"]
+    assert state.shape == (4, 5)
+    assert "lam_2" in state and "lam" in state
+    assert "lam_3" not in state and "pi_up" not in state
+    assert np.array_equal(state["weight"], np.ones(4))
+    assert np.shares_memory(state["lam_1"], state["lam"])
+    assert np.array_equal(state["lam_1"], [1.0, 4.0, 7.0, 10.0])
+    with pytest.raises(KeyError):
+        state["lam_3"]
+
+
+def test_state_set(state):
+    ratio = state["ratio"]
+    lam = state["lam"]
+    state["ratio"] = 2.0
+    state["lam_0"] = -1.0
+    state["pi_up"] = np.ones(4)
+
+    assert np.array_equal(ratio, np.arange(4))
+    assert lam[0, 0] == 0.0 and np.all(state["lam_0"] == -1.0)
+    assert state.columns[-1] == "pi_up"
+    with pytest.raises(ValueError):
+        state["q_lam"] = np.ones((3, 2))
+
+
+def test_state_to_frame(state):
+    df = state.to_frame()
+    assert isinstance(df, pd.DataFrame)
+    assert list(df.columns) == state.columns
+    assert state.to_frame() is df
+    assert np.array_equal(state[["lam_0", "ratio"]].values[:, 1], np.arange(4))
+
+    state["q_pca"] = np.zeros((4, 2))
+    assert state.to_frame() is not df
+    assert "q_pca_1" in state.to_frame()
+
+
+def test_dci_problem_state():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from scipy.stats.distributions import norm
+
+    from pydci import DCIProblem
+
+    rng = np.random.default_rng(1)
+    lam = rng.uniform(-1, 1, size=(300, 2))
+    q_lam = lam.sum(axis=1).reshape(-1, 1)
+    prob = DCIProblem((lam, q_lam), norm(0.2, 0.3))
+    prob.solve()
+
+    assert isinstance(prob.state, ProblemState)
+    assert np.array_equal(prob.state["lam"], lam)
+    assert np.allclose(
+        prob.state["pi_up"], prob.state["pi_in"] * prob.state["ratio"]
+    )
+    prob.plot_L()
+    prob.plot_D()
+
+
+def test_state_append(state):
+    state.append({"weight": 2.0, "lam": np.ones((2, 3))})
+
+    assert len(state) == 6 and state.to_frame().shape == (6, 5)
+    assert np.array_equal(state["weight"], [1, 1, 1, 1, 2, 2])
+    assert np.all(np.isnan(state["ratio"][4:]))
+    assert np.array_equal(state["lam_2"][4:], [1.0, 1.0])
+    with pytest.raises(ValueError):
+        state.append({"pi_up": np.ones(2)})
+
+
+def test_iteration_log():
+    lam = np.arange(8, dtype=float).reshape(4, 2)
+    log = IterationLog(4, {"lam": lam}, capacity=1)
+    for i in range(3):
+        nc = 1 if i == 1 else 2
+        log.append(
+            {"ratio": np.full(4, i), "q_pca": np.full((4, nc), i)},
+            {"iteration": i, "pca_mask": str([i])},
+        )
+
+    state = log[1]
+    assert len(log) == 3 and isinstance(state, ProblemState)
+    assert state.columns == ["lam_0", "lam_1", "ratio", "q_pca_0"]
+    assert np.shares_memory(state["ratio"], log._blocks["ratio"])
+    assert np.shares_memory(log[0]["lam"], log[2]["lam"])
+    assert not state["ratio"].flags.writeable
+    assert np.array_equal(log[-1]["q_pca"], np.full((4, 2), 2.0))
+
+    df = log.to_frame()
+    assert df.shape == (12, 7) and list(df.index[:5]) == [0, 1, 2, 3, 0]
+    assert np.all(np.isnan(df["q_pca_1"].values[4:8]))
+    assert np.array_equal(df["lam_1"].values[8:], lam[:, 1])
+    assert list(log.info["pca_mask"]) == ["[0]", "[1]", "[2]"]
+    with pytest.raises(ValueError):
+        log.append({"ratio": np.ones(3)})